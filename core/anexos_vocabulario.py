@@ -0,0 +1,177 @@
+# core/anexos_vocabulario.py
+"""
+Vocabulario único de anexos conocidos para todo el proceso.
+
+- Se carga UNA vez (anexos base + archivo base JSON + bitácora de aprendidos)
+- Vive en memoria protegido por un lock
+- Cada anexo nuevo se agrega a una bitácora append-only (una línea por anexo)
+- Los demás procesos de Streamlit leen solo las líneas nuevas de la bitácora
+  (por desplazamiento), nunca vuelven a leer el JSON completo
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Base inicial de anexos conocidos
+ANEXOS_BASE = [
+    "A", "B", "B-1", "C", "CN", "E", "F", "I", "SSPA", "PACMA",
+    "AP", "MMRDD", "GNR", "PUE", "BDE", "GARANTÍAS", "FORMA", "DT-9",
+    "II", "IV", "O"
+]
+
+# Rutas propias (no se importa core.config para evitar importaciones circulares)
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+ANEXOS_FILE = DATA_DIR / "anexos_base.json"
+BITACORA_FILE = DATA_DIR / "anexos_aprendidos.log"
+
+# Segundos mínimos entre revisiones de la bitácora (un os.stat por revisión)
+INTERVALO_SINCRONIZACION = 2.0
+
+
+class VocabularioAnexos:
+    """Almacén en memoria de anexos conocidos con persistencia incremental"""
+
+    def __init__(self, archivo_base=ANEXOS_FILE, bitacora=BITACORA_FILE,
+                 intervalo_sincronizacion=INTERVALO_SINCRONIZACION):
+        self.archivo_base = Path(archivo_base)
+        self.bitacora = Path(bitacora)
+        self.intervalo_sincronizacion = intervalo_sincronizacion
+
+        self._lock = threading.Lock()
+        self._anexos = set()
+        self._snapshot = frozenset()
+        self._desplazamiento = 0
+        self._ultima_revision = 0.0
+        # Se incrementa cada vez que cambia el vocabulario
+        self.version = 0
+
+        self._cargar_inicial()
+
+    # ----------------- Carga y sincronización -----------------
+    def _cargar_inicial(self):
+        """Carga anexos base, archivo JSON y bitácora completa (solo al arrancar)"""
+        anexos = {a.upper() for a in ANEXOS_BASE}
+
+        try:
+            self.archivo_base.parent.mkdir(parents=True, exist_ok=True)
+            if not self.archivo_base.exists():
+                with open(self.archivo_base, 'w', encoding='utf-8') as f:
+                    json.dump(sorted(anexos), f, ensure_ascii=False, indent=2)
+            else:
+                with open(self.archivo_base, 'r', encoding='utf-8') as f:
+                    anexos.update(a.upper() for a in json.load(f) if a)
+        except Exception as e:
+            print(f"⚠️ Error cargando archivo base de anexos: {e}")
+
+        with self._lock:
+            self._anexos = anexos
+            self._leer_bitacora()
+            self._publicar()
+
+    def _leer_bitacora(self):
+        """Lee solo las líneas agregadas desde la última lectura (requiere lock)"""
+        try:
+            tamaño = self.bitacora.stat().st_size
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ Error revisando bitácora de anexos: {e}")
+            return
+
+        if tamaño < self._desplazamiento:
+            # La bitácora fue truncada/rotada: releer desde el inicio
+            self._desplazamiento = 0
+        if tamaño == self._desplazamiento:
+            return
+
+        with open(self.bitacora, 'rb') as f:
+            f.seek(self._desplazamiento)
+            datos = f.read(tamaño - self._desplazamiento)
+
+        # Solo se consumen líneas completas (otro proceso puede estar escribiendo)
+        fin = datos.rfind(b'\n')
+        if fin < 0:
+            return
+        for linea in datos[:fin].decode('utf-8', errors='ignore').splitlines():
+            anexo = linea.strip().upper()
+            if anexo:
+                self._anexos.add(anexo)
+        self._desplazamiento += fin + 1
+
+    def _publicar(self):
+        """Actualiza la copia inmutable si el conjunto cambió (requiere lock)"""
+        if len(self._anexos) != len(self._snapshot):
+            self._snapshot = frozenset(self._anexos)
+            self.version += 1
+
+    def sincronizar(self, forzar=False):
+        """Incorpora anexos aprendidos por otros procesos"""
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultima_revision < self.intervalo_sincronizacion:
+            return
+        with self._lock:
+            self._ultima_revision = ahora
+            self._leer_bitacora()
+            self._publicar()
+
+    # ----------------- API pública -----------------
+    def agregar(self, anexo):
+        """Agrega un anexo; retorna True si era nuevo"""
+        return self.agregar_varios([anexo]) > 0
+
+    def agregar_varios(self, anexos):
+        """Agrega varios anexos en una sola escritura; retorna cuántos eran nuevos"""
+        with self._lock:
+            self._leer_bitacora()
+            nuevos = []
+            for anexo in anexos:
+                anexo = (anexo or "").strip().upper()
+                if anexo and anexo not in self._anexos:
+                    self._anexos.add(anexo)
+                    nuevos.append(anexo)
+
+            if nuevos:
+                try:
+                    self.bitacora.parent.mkdir(parents=True, exist_ok=True)
+                    contenido = "".join(f"{a}\n" for a in nuevos).encode('utf-8')
+                    # O_APPEND: escrituras pequeñas atómicas entre procesos
+                    fd = os.open(self.bitacora, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        os.write(fd, contenido)
+                    finally:
+                        os.close(fd)
+                    # Lo recién escrito ya está en memoria
+                    self._leer_bitacora()
+                except Exception as e:
+                    print(f"⚠️ Error persistiendo anexos nuevos: {e}")
+                self._publicar()
+
+            return len(nuevos)
+
+    def snapshot(self):
+        """Conjunto inmutable de anexos conocidos (sin copiar en cada llamada)"""
+        self.sincronizar()
+        return self._snapshot
+
+    def contiene(self, anexo):
+        return (anexo or "").upper() in self.snapshot()
+
+    def obtener(self):
+        """Lista ordenada de anexos conocidos"""
+        return sorted(self.snapshot())
+
+
+_VOCABULARIO = None
+_VOCABULARIO_LOCK = threading.Lock()
+
+
+def obtener_vocabulario():
+    """Instancia única del vocabulario para todo el proceso"""
+    global _VOCABULARIO
+    if _VOCABULARIO is None:
+        with _VOCABULARIO_LOCK:
+            if _VOCABULARIO is None:
+                _VOCABULARIO = VocabularioAnexos()
+    return _VOCABULARIO
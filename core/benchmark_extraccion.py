@@ -0,0 +1,135 @@
+# core/benchmark_extraccion.py
+"""
+Benchmark de peor caso para los extractores de core/text_processing.py
+
+Genera un corpus determinista de ruido OCR adversarial (cabeceras sin
+terminador, palabras clave repetidas, líneas gigantes, espacios alternados)
+y verifica que cada extractor escale de forma lineal: al multiplicar el
+tamaño del texto por FACTOR_CRECIMIENTO, el tiempo no debe crecer más que
+FACTOR_CRECIMIENTO * TOLERANCIA, y el costo absoluto no debe superar
+MAX_MS_POR_KB.
+
+Uso:
+    python -m core.benchmark_extraccion
+    python -m core.benchmark_extraccion --tamaño 100000
+"""
+import argparse
+import random
+import sys
+import time
+
+from core import text_processing
+
+TAMAÑO_BASE = 50_000          # caracteres del caso pequeño
+FACTOR_CRECIMIENTO = 4        # el caso grande es FACTOR veces el pequeño
+TOLERANCIA = 2.0              # margen sobre el crecimiento lineal ideal
+HOLGURA_MS = 5.0              # ruido de medición tolerado en tiempos muy pequeños
+MAX_MS_POR_KB = 2.0           # presupuesto absoluto por extractor
+REPETICIONES = 3              # se toma el mejor de N para reducir ruido
+
+EXTRACTORES = {
+    "contrato_contratista": text_processing._extract_contrato_and_contratista,
+    "objeto": text_processing._extract_objeto,
+    "monto": text_processing._extract_monto,
+    "plazo": text_processing._extract_plazo,
+    "anexos": text_processing._extract_anexos_avanzado,
+    "completo": lambda texto: text_processing.extract_contract_data(texto, presupuesto_s=None),
+}
+
+
+# ----------------- Corpus adversarial -----------------
+def _repetir(fragmento, tamaño):
+    return (fragmento * (tamaño // len(fragmento) + 1))[:tamaño]
+
+def _ruido_ocr(tamaño, semilla=27):
+    """Ruido tipo OCR: letras, dígitos, signos y saltos de línea sin estructura"""
+    rnd = random.Random(semilla)
+    alfabeto = "ABCDEFGHIJKLMNÑOPQRSTUVWXYZÁÉÍÓÚ0123456789.,:;-$\"“”' " * 2 + "\n"
+    return "".join(rnd.choice(alfabeto) for _ in range(tamaño))
+
+CORPUS = {
+    # Cabecera de contratista sin "Hoja/Página/DE" que la cierre
+    "contratista_sin_cierre": lambda n: _repetir("Contrato No. 641234567 " + "ABC " * 60, n),
+    # OBJETO repetido sin salto de línea ni MONTO/PLAZO
+    "objeto_sin_terminador": lambda n: _repetir("OBJETO ", n),
+    # Secciones "4." sin OBJETO
+    "secciones_sin_objeto": lambda n: _repetir("\n4. xx", n),
+    # MONTO/IMPORTE sin ninguna cifra posterior
+    "monto_sin_cifras": lambda n: _repetir("MONTO IMPORTE VALOR ", n),
+    # Muchas cabeceras de plazo en una sola línea gigante
+    "plazo_linea_gigante": lambda n: _repetir("11. PLAZO es de xx ", n),
+    # Integridad del contrato sin sección siguiente
+    "integridad_sin_fin": lambda n: _repetir("2. INTEGRIDAD DEL CONTRATO ANEXO ", n),
+    # Comillas de anexo nunca cerradas
+    "anexo_comillas_abiertas": lambda n: _repetir('ANEXO "' + "A" * 50 + " ", n),
+    # Espacios y saltos alternados que sobreviven a _clean_whitespace
+    "espacios_alternados": lambda n: _repetir(" \n", n),
+    # Número de contrato repetido en una sola línea (búsqueda contextual)
+    "contrato_repetido_linea": lambda n: _repetir("641234567 ", n),
+    "ruido_ocr": _ruido_ocr,
+}
+
+
+# ----------------- Medición -----------------
+def _medir(funcion, texto):
+    mejor = float("inf")
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion(texto)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+def ejecutar_benchmark(tamaño=TAMAÑO_BASE):
+    """Mide cada extractor sobre cada caso adversarial; retorna lista de resultados"""
+    resultados = []
+    grande = tamaño * FACTOR_CRECIMIENTO
+
+    for caso, generador in CORPUS.items():
+        # Los extractores trabajan sobre texto ya limpio
+        texto_chico = text_processing._clean_whitespace(generador(tamaño))
+        texto_grande = text_processing._clean_whitespace(generador(grande))
+
+        for nombre, funcion in EXTRACTORES.items():
+            ms_chico = _medir(funcion, texto_chico)
+            ms_grande = _medir(funcion, texto_grande)
+
+            limite_crecimiento = ms_chico * FACTOR_CRECIMIENTO * TOLERANCIA + HOLGURA_MS
+            ms_por_kb = ms_grande / max(len(texto_grande) / 1024, 1)
+
+            resultados.append({
+                "caso": caso,
+                "extractor": nombre,
+                "ms_chico": ms_chico,
+                "ms_grande": ms_grande,
+                "ms_por_kb": ms_por_kb,
+                "lineal": ms_grande <= limite_crecimiento,
+                "en_presupuesto": ms_por_kb <= MAX_MS_POR_KB,
+            })
+
+    return resultados
+
+def imprimir_reporte(resultados):
+    print(f"{'CASO':<26} {'EXTRACTOR':<22} {'CHICO ms':>9} {'GRANDE ms':>10} {'ms/KB':>7}  ESTADO")
+    for r in resultados:
+        estado = "✅" if r["lineal"] and r["en_presupuesto"] else "❌"
+        print(f"{r['caso']:<26} {r['extractor']:<22} {r['ms_chico']:>9.2f} "
+              f"{r['ms_grande']:>10.2f} {r['ms_por_kb']:>7.3f}  {estado}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de peor caso de extractores")
+    parser.add_argument("--tamaño", type=int, default=TAMAÑO_BASE,
+                        help="caracteres del caso pequeño (el grande es 4x)")
+    args = parser.parse_args(argv)
+
+    resultados = ejecutar_benchmark(args.tamaño)
+    imprimir_reporte(resultados)
+
+    fallas = [r for r in resultados if not (r["lineal"] and r["en_presupuesto"])]
+    if fallas:
+        print(f"❌ {len(fallas)} combinaciones fuera del presupuesto lineal")
+        return 1
+    print("✅ Todos los extractores dentro del presupuesto lineal")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
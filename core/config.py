@@ -126,38 +126,24 @@ def crear_usuario(usuario_data):
 ANEXOS_FILE = DATA_DIR / "anexos_base.json"
 
 def cargar_anexos_conocidos():
-    """Cargar anexos conocidos (LOCAL PERMANENTE)"""
-    anexos_base = [
-        "A", "B", "B-1", "C", "CN", "E", "F", "I", "SSPA", "PACMA",
-        "AP", "MMRDD", "GNR", "PUE", "BDE", "GARANTÍAS", "FORMA", "DT-9",
-        "II", "IV", "O"
-    ]
-    
-    if not ANEXOS_FILE.exists():
-        # Crear archivo con anexos base
-        try:
-            with open(ANEXOS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(sorted(set(anexos_base)), f, ensure_ascii=False, indent=2)
-            logger.info("Archivo de anexos creado")
-        except Exception as e:
-            logger.error(f"Error creando archivo de anexos: {e}")
-            return anexos_base
+    """Cargar anexos conocidos (vocabulario compartido, cargado una sola vez)"""
+    from core.anexos_vocabulario import obtener_vocabulario
     
     try:
-        with open(ANEXOS_FILE, 'r', encoding='utf-8') as f:
-            anexos = json.load(f)
-        logger.info(f"{len(anexos)} anexos conocidos cargados")
+        anexos = obtener_vocabulario().obtener()
         return anexos
     except Exception as e:
         logger.error(f"Error cargando anexos: {e}")
-        return anexos_base
+        from core.anexos_vocabulario import ANEXOS_BASE
+        return list(ANEXOS_BASE)
 
 def guardar_anexos_conocidos(anexos):
-    """Guardar anexos conocidos (LOCAL PERMANENTE)"""
+    """Guardar anexos conocidos (se agregan a la bitácora incremental)"""
+    from core.anexos_vocabulario import obtener_vocabulario
+    
     try:
-        with open(ANEXOS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(sorted(set(anexos)), f, ensure_ascii=False, indent=2)
-        logger.info(f"Anexos guardados: {len(anexos)} elementos")
+        nuevos = obtener_vocabulario().agregar_varios(anexos)
+        logger.info(f"Anexos guardados: {nuevos} nuevos")
         return True
     except Exception as e:
         logger.error(f"Error guardando anexos: {e}")
@@ -2,13 +2,1180 @@
 import psycopg2
 import psycopg2.extensions
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+import base64
+import csv
 import hashlib
 from datetime import datetime
 import io
+import itertools
+import mmap
+import os
+import queue
 import streamlit as st
 import json
+import tempfile
+import threading
 import traceback
 
+from core import migraciones
+from core.db_pool import obtener_pool
+from core.text_processing import (
+    VERSION_EXTRACTOR, extract_contract_data, normalizar_monto, normalizar_plazo
+)
+
+# ============================================
+# CONSULTAS EN STREAMING (CURSORES DEL SERVIDOR)
+# ============================================
+# Filas por viaje al servidor al recorrer una consulta grande
+ITERSIZE_SERVIDOR = int(os.environ.get("PEMEX_ITERSIZE", "2000"))
+
+_contador_cursores = itertools.count(1)
+
+def _iterar_consulta(conn, consulta, params=None, itersize=ITERSIZE_SERVIDOR):
+    """
+    Genera las filas (tuplas) de una consulta con un cursor con nombre
+    (del lado del servidor): se traen de itersize en itersize, así que la
+    memoria no depende del tamaño del resultado. El cursor vive dentro de la
+    transacción actual: no confirmar (commit) mientras se recorre.
+    """
+    cur = conn.cursor(name=f"pemex_iter_{next(_contador_cursores)}")
+    cur.itersize = itersize
+    try:
+        cur.execute(consulta, params)
+        yield from cur
+    finally:
+        try:
+            cur.close()
+        except psycopg2.Error as e:
+            # Transacción abortada: el cursor ya no existe en el servidor
+            print(f"⚠️ No se pudo cerrar el cursor {cur.name}: {e}")
+
+# ============================================
+# TEXTO OCR Y REPROCESAMIENTO DE CONTRATOS
+# ============================================
+
+# Campos que se vuelven a extraer -> columna de contratos_pemex (y su largo máximo)
+CAMPOS_REPROCESABLES = {
+    'contratista': ('contratista', 300),
+    'objeto': ('descripcion', None),
+    'monto': ('monto_contrato', 100),
+    'plazo': ('plazo_dias', 50),
+    'anexos': ('anexos', None),
+}
+
+def _anexos_como_lista(valor):
+    """Anexos guardados (lista JSONB o texto JSON) como lista de strings"""
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except ValueError:
+            return []
+    return [str(a) for a in valor] if isinstance(valor, list) else []
+
+def _instantanea_extraccion(extraido):
+    """
+    Valores que produjo el extractor para los campos reprocesables, tal como
+    se guardarían (texto recortado al largo de la columna, anexos en lista).
+    Se guarda en extraccion_original para distinguir después lo que el
+    usuario corrigió a mano de lo que sigue igual que la extracción.
+    """
+    instantanea = {}
+    for campo, (columna, largo) in CAMPOS_REPROCESABLES.items():
+        if campo == 'anexos':
+            instantanea[campo] = sorted(set(_anexos_como_lista(extraido.get('anexos') or [])))
+            continue
+        valor = str(extraido.get(campo) or '').strip()
+        instantanea[campo] = valor[:largo] if largo else valor
+    return instantanea
+
+def _comparar_reextraccion(guardado, extraido, campos):
+    """
+    Cambios campo -> (antes, después) entre lo guardado y una extracción
+    nueva, y lista de campos protegidos (la extracción nueva difiere pero el
+    valor guardado fue corregido a mano).
+
+    Un campo solo se reemplaza si está vacío o si sigue igual a lo que
+    produjo el extractor anterior (guardado['extraccion_original']); sin esa
+    instantánea (contratos anteriores) solo se llenan los vacíos. Nunca se
+    borra un valor guardado, y los anexos nuevos se suman a los que ya tenía
+    el contrato (pudieron capturarse a mano).
+    """
+    original = guardado.get('extraccion_original')
+    if isinstance(original, str):
+        try:
+            original = json.loads(original)
+        except ValueError:
+            original = None
+    if not isinstance(original, dict):
+        original = None
+    
+    cambios = {}
+    protegidos = []
+    for campo in campos:
+        columna, largo = CAMPOS_REPROCESABLES[campo]
+        antes = guardado.get(columna)
+        
+        if campo == 'anexos':
+            anexos_antes = _anexos_como_lista(antes)
+            despues = sorted(set(anexos_antes) | set(extraido.get('anexos') or []))
+            if despues != sorted(anexos_antes):
+                cambios[campo] = (anexos_antes, despues)
+            continue
+        
+        despues = str(extraido.get(campo) or '').strip()
+        if largo:
+            despues = despues[:largo]
+        if not despues or despues == (antes or ''):
+            continue
+        
+        sin_editar = original is not None and (antes or '') == (original.get(campo) or '')
+        if not antes or sin_editar:
+            cambios[campo] = (antes, despues)
+        else:
+            protegidos.append(campo)
+    return cambios, protegidos
+
+# ============================================
+# LISTADO DE ARCHIVOS Y LECTURA BAJO DEMANDA
+# ============================================
+
+# Columnas de archivos_pemex que se devuelven al listar (sin contenido)
+COLUMNAS_ARCHIVO = (
+    "id, contrato_id, categoria, tipo_archivo, nombre_archivo, "
+    "tamaño_bytes, hash_sha256, fecha_subida, usuario_subio"
+)
+
+# Prefijo con el que se identifica el PDF principal de un contrato
+# (se guarda en contratos_pemex, no en archivos_pemex)
+PREFIJO_PRINCIPAL = "principal_"
+
+# Lectura de large objects: bloques de 1 MB; hasta UMBRAL_MEMORIA_DESCARGA
+# el archivo se arma en memoria, por encima se vuelca a un temporal en disco
+TAMAÑO_BLOQUE_LO = 1024 * 1024
+UMBRAL_MEMORIA_DESCARGA = int(os.environ.get("PEMEX_UMBRAL_MEMORIA_DESCARGA", 16 * 1024 * 1024))
+
+def _iterar_large_object(conn, lo_oid, tamaño_bloque=TAMAÑO_BLOQUE_LO):
+    """Genera el contenido de un large object bloque por bloque (memoria constante)"""
+    large_obj = conn.lobject(lo_oid, 'rb', 0, None)
+    try:
+        while True:
+            chunk = large_obj.read(tamaño_bloque)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        large_obj.close()
+
+def _volcar_large_object(conn, lo_oid, umbral=UMBRAL_MEMORIA_DESCARGA):
+    """
+    Copia un large object a un SpooledTemporaryFile posicionado al inicio:
+    en memoria hasta 'umbral' bytes, en disco por encima. El que lo recibe
+    debe cerrarlo (se borra solo).
+    """
+    flujo = tempfile.SpooledTemporaryFile(max_size=umbral)
+    try:
+        for chunk in _iterar_large_object(conn, lo_oid):
+            flujo.write(chunk)
+        flujo.seek(0)
+        return flujo
+    except Exception:
+        flujo.close()
+        raise
+
+def _leer_large_object(conn, lo_oid):
+    """
+    Contenido completo (bytes) de un large object. Se acumula en un BytesIO:
+    getvalue() entrega su buffer sin copiarlo, a diferencia de juntar una
+    lista de bloques con b''.join (que tiene el archivo dos veces en memoria)
+    """
+    buffer = io.BytesIO()
+    for chunk in _iterar_large_object(conn, lo_oid):
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+def _obtener_archivos(conn, contrato_id, categoria=None):
+    """
+    Archivos de un contrato CON su contenido. Los metadatos se recorren con
+    un cursor del servidor y cada large object se lee dentro de un savepoint:
+    un archivo dañado se omite sin abortar la transacción ni el recorrido
+    """
+    if categoria:
+        filas = _iterar_consulta(conn, """
+            SELECT id, contrato_id, categoria, tipo_archivo,
+                   lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
+                   fecha_subida, usuario_subio
+            FROM archivos_pemex
+            WHERE contrato_id = %s AND categoria = %s
+            ORDER BY fecha_subida DESC
+        """, (contrato_id, categoria))
+    else:
+        filas = _iterar_consulta(conn, """
+            SELECT id, contrato_id, categoria, tipo_archivo,
+                   lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
+                   fecha_subida, usuario_subio
+            FROM archivos_pemex
+            WHERE contrato_id = %s
+            ORDER BY categoria, fecha_subida DESC
+        """, (contrato_id,))
+    
+    columnas = ("id", "contrato_id", "categoria", "tipo_archivo", "lo_oid", "nombre_archivo",
+                "tamaño_bytes", "hash_sha256", "fecha_subida", "usuario_subio")
+    cur = conn.cursor()
+    archivos = []
+    for fila in filas:
+        archivo = dict(zip(columnas, fila))
+        lo_oid = archivo.pop('lo_oid')
+        cur.execute("SAVEPOINT leer_archivo")
+        try:
+            archivo['contenido'] = _leer_large_object(conn, lo_oid)
+            cur.execute("RELEASE SAVEPOINT leer_archivo")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT leer_archivo")
+            print(f"⚠️ Error obteniendo contenido del archivo {archivo['id']}: {e}")
+            continue
+        archivos.append(archivo)
+    return archivos
+
+# ============================================
+# ESCRITURA DE LARGE OBJECTS EN UNA SOLA PASADA
+# ============================================
+
+# Con al menos este tamaño el hash y la escritura al servidor se solapan
+# (hashlib y lo_write liberan el GIL)
+UMBRAL_ESCRITURA_PARALELA = 8 * 1024 * 1024
+
+def _nombre_origen(archivo):
+    """Nombre de archivo para guardar, según el tipo de origen"""
+    if isinstance(archivo, (str, os.PathLike)):
+        return os.path.basename(os.fspath(archivo))
+    nombre = getattr(archivo, 'name', None)
+    if isinstance(nombre, str) and nombre:
+        return os.path.basename(nombre)
+    return f"archivo_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+def _tamaño_origen(archivo):
+    """Tamaño en bytes si se conoce sin leer el origen, o None"""
+    if isinstance(archivo, (bytes, bytearray, memoryview)):
+        return len(archivo)
+    if isinstance(archivo, (str, os.PathLike)):
+        return os.path.getsize(archivo)
+    tamaño = getattr(archivo, 'size', None)
+    return tamaño if isinstance(tamaño, int) else None
+
+def _bloques_origen(archivo, tamaño_bloque=TAMAÑO_BLOQUE_LO):
+    """
+    Recorre el origen una sola vez en bloques de tamaño_bloque sin
+    materializarlo completo:
+    - bytes / bytearray / memoryview: vistas sin copia
+    - ruta (str o PathLike): mmap del archivo
+    - subida de Streamlit (BytesIO): getvalue(), sin copiar el buffer
+    - cualquier otro flujo con read(): lecturas sucesivas
+    """
+    if isinstance(archivo, (bytes, bytearray, memoryview)):
+        vista = memoryview(archivo)
+        for inicio in range(0, len(vista), tamaño_bloque):
+            yield vista[inicio:inicio + tamaño_bloque]
+        return
+
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                # Rebanar el mmap copia solo el bloque; el resto lo pagina el SO
+                for inicio in range(0, len(mapa), tamaño_bloque):
+                    yield mapa[inicio:inicio + tamaño_bloque]
+        return
+
+    if not hasattr(archivo, 'read'):
+        raise ValueError("Tipo de archivo no soportado")
+
+    if isinstance(archivo, io.BytesIO):
+        # UploadedFile se construye con los bytes recibidos y getvalue() los
+        # devuelve sin copiarlos
+        yield from _bloques_origen(archivo.getvalue(), tamaño_bloque)
+        return
+
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+
+    while True:
+        chunk = archivo.read(tamaño_bloque)
+        if not chunk:
+            break
+        yield chunk
+
+def _escribir_large_object(conn, archivo, paralelo=None):
+    """
+    Crea un large object con el contenido de 'archivo' leyéndolo una sola vez:
+    cada bloque actualiza el SHA-256 y se escribe al servidor en el momento.
+    Con paralelo=True (por defecto, si el origen mide UMBRAL_ESCRITURA_PARALELA
+    o más) la escritura corre en un hilo aparte mientras se calcula el hash
+    del bloque siguiente. Retorna (oid, tamaño_bytes, hash_sha256).
+    """
+    if paralelo is None:
+        tamaño = _tamaño_origen(archivo)
+        paralelo = tamaño is not None and tamaño >= UMBRAL_ESCRITURA_PARALELA
+
+    large_obj = conn.lobject(0, 'wb', 0, None)
+    hash_sha256 = hashlib.sha256()
+    total = 0
+    try:
+        if not paralelo:
+            for chunk in _bloques_origen(archivo):
+                hash_sha256.update(chunk)
+                large_obj.write(bytes(chunk))
+                total += len(chunk)
+        else:
+            # Cola acotada: como máximo unos pocos bloques en memoria
+            cola = queue.Queue(maxsize=4)
+            errores = []
+
+            def escribir():
+                while True:
+                    chunk = cola.get()
+                    if chunk is None:
+                        return
+                    if not errores:
+                        try:
+                            large_obj.write(chunk)
+                        except Exception as e:
+                            errores.append(e)
+
+            escritor = threading.Thread(target=escribir, daemon=True)
+            escritor.start()
+            try:
+                for chunk in _bloques_origen(archivo):
+                    if errores:
+                        break
+                    hash_sha256.update(chunk)
+                    cola.put(bytes(chunk))
+                    total += len(chunk)
+            finally:
+                cola.put(None)
+                escritor.join()
+            if errores:
+                raise errores[0]
+        return large_obj.oid, total, hash_sha256.hexdigest()
+    finally:
+        large_obj.close()
+
+# ============================================
+# BLOBS DEDUPLICADOS POR HASH (CONTEO DE REFERENCIAS)
+# ============================================
+
+def _hash_en_memoria(archivo):
+    """SHA-256 de un origen que ya está en memoria (barato), o None"""
+    if isinstance(archivo, io.BytesIO):
+        archivo = archivo.getvalue()
+    if isinstance(archivo, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(archivo).hexdigest()
+    return None
+
+def _guardar_blob(conn, archivo):
+    """
+    Large object para el contenido de 'archivo', reutilizando el existente
+    si ya hay uno con el mismo hash. Suma una referencia en blobs_pemex.
+    Retorna (lo_oid, tamaño_bytes, hash_sha256, reutilizado).
+    """
+    cur = conn.cursor()
+
+    # Contenido en memoria: se busca por hash antes de subir nada al servidor
+    hash_previo = _hash_en_memoria(archivo)
+    if hash_previo:
+        cur.execute("""
+            UPDATE blobs_pemex SET referencias = referencias + 1
+            WHERE hash_sha256 = %s
+            RETURNING lo_oid, tamaño_bytes
+        """, (hash_previo,))
+        fila = cur.fetchone()
+        if fila:
+            return fila[0], fila[1], hash_previo, True
+
+    # Rutas y flujos: una sola pasada (hash + escritura) y se resuelve después
+    lo_nuevo, tamaño_bytes, file_hash = _escribir_large_object(conn, archivo)
+    cur.execute("""
+        INSERT INTO blobs_pemex (hash_sha256, lo_oid, tamaño_bytes, referencias)
+        VALUES (%s, %s, %s, 1)
+        ON CONFLICT (hash_sha256) DO UPDATE SET referencias = blobs_pemex.referencias + 1
+        RETURNING lo_oid
+    """, (file_hash, lo_nuevo, tamaño_bytes))
+    lo_oid = cur.fetchone()[0]
+    if lo_oid != lo_nuevo:
+        # Ya existía: el recién escrito sobra
+        conn.lobject(lo_nuevo).unlink()
+        return lo_oid, tamaño_bytes, file_hash, True
+    return lo_oid, tamaño_bytes, file_hash, False
+
+def _unlink_seguro(conn, lo_oid):
+    """Elimina un large object sin abortar la transacción si ya no existe"""
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT unlink_blob")
+    try:
+        cur.execute("SELECT lo_unlink(%s)", (lo_oid,))
+        cur.execute("RELEASE SAVEPOINT unlink_blob")
+        return True
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT unlink_blob")
+        print(f"⚠️ No se pudo eliminar el large object {lo_oid}: {e}")
+        return False
+
+def _liberar_blobs(conn, referencias):
+    """
+    Quita una referencia por cada (lo_oid, hash_sha256) de filas ya borradas.
+    El large object solo se elimina cuando nadie más lo usa; los que no
+    están en blobs_pemex (anteriores a la deduplicación) se eliminan directo.
+    Retorna cuántos large objects se eliminaron.
+    """
+    cur = conn.cursor()
+    eliminados = 0
+    for lo_oid, file_hash in referencias:
+        cur.execute("""
+            UPDATE blobs_pemex SET referencias = referencias - 1
+            WHERE hash_sha256 = %s AND lo_oid = %s AND referencias > 0
+            RETURNING referencias
+        """, (file_hash, lo_oid))
+        fila = cur.fetchone()
+        if fila is None:
+            cur.execute("SELECT 1 FROM blobs_pemex WHERE lo_oid = %s", (lo_oid,))
+            if cur.fetchone():
+                continue
+        elif fila[0] > 0:
+            continue
+        else:
+            cur.execute("DELETE FROM blobs_pemex WHERE hash_sha256 = %s", (file_hash,))
+        if _unlink_seguro(conn, lo_oid):
+            eliminados += 1
+    return eliminados
+
+_SQL_FILAS_CON_BLOB = """
+    SELECT hash_sha256, lo_oid, tamaño_bytes, fecha_subida FROM contratos_pemex
+    UNION ALL
+    SELECT hash_sha256, lo_oid, tamaño_bytes, fecha_subida FROM archivos_pemex
+"""
+
+def _reporte_almacenamiento(conn):
+    """Bytes que ocuparían las filas sin deduplicar vs. bytes realmente guardados"""
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH filas AS ({_SQL_FILAS_CON_BLOB}),
+        fisicos AS (SELECT DISTINCT lo_oid, tamaño_bytes FROM filas)
+        SELECT
+            (SELECT COUNT(*) FROM filas) AS referencias,
+            (SELECT COALESCE(SUM(tamaño_bytes), 0) FROM filas) AS bytes_logicos,
+            (SELECT COUNT(*) FROM fisicos) AS large_objects,
+            (SELECT COALESCE(SUM(tamaño_bytes), 0) FROM fisicos) AS bytes_fisicos,
+            (SELECT COUNT(*) FROM blobs_pemex) AS blobs
+    """)
+    columnas = [desc[0] for desc in cur.description]
+    reporte = dict(zip(columnas, cur.fetchone()))
+    reporte['bytes_logicos'] = int(reporte['bytes_logicos'])
+    reporte['bytes_fisicos'] = int(reporte['bytes_fisicos'])
+    reporte['bytes_ahorrados'] = reporte['bytes_logicos'] - reporte['bytes_fisicos']
+    reporte['porcentaje_ahorro'] = (
+        100.0 * reporte['bytes_ahorrados'] / reporte['bytes_logicos'] if reporte['bytes_logicos'] else 0.0
+    )
+    return reporte
+
+def _deduplicar_blobs(conn, aplicar=True):
+    """
+    Registra en blobs_pemex el contenido guardado antes de la deduplicación
+    y une los duplicados: las filas con el mismo hash pasan a apuntar al
+    large object más antiguo y los sobrantes se eliminan. Con aplicar=False
+    solo reporta lo que haría.
+    """
+    cur = conn.cursor()
+    try:
+        antes = _reporte_almacenamiento(conn)
+
+        cur.execute(f"""
+            WITH filas AS ({_SQL_FILAS_CON_BLOB})
+            INSERT INTO blobs_pemex (hash_sha256, lo_oid, tamaño_bytes, referencias)
+            SELECT DISTINCT ON (hash_sha256) hash_sha256, lo_oid, tamaño_bytes, 0
+            FROM filas
+            ORDER BY hash_sha256, fecha_subida
+            ON CONFLICT (hash_sha256) DO NOTHING
+        """)
+
+        cur.execute(f"""
+            WITH filas AS ({_SQL_FILAS_CON_BLOB})
+            SELECT DISTINCT f.lo_oid
+            FROM filas f JOIN blobs_pemex b ON b.hash_sha256 = f.hash_sha256
+            WHERE f.lo_oid <> b.lo_oid
+        """)
+        sobrantes = [fila[0] for fila in cur.fetchall()]
+
+        for tabla in ("contratos_pemex", "archivos_pemex"):
+            cur.execute(sql.SQL("""
+                UPDATE {tabla} t SET lo_oid = b.lo_oid
+                FROM blobs_pemex b
+                WHERE b.hash_sha256 = t.hash_sha256 AND t.lo_oid <> b.lo_oid
+            """).format(tabla=sql.Identifier(tabla)))
+
+        cur.execute("""
+            UPDATE blobs_pemex b SET referencias =
+                (SELECT COUNT(*) FROM contratos_pemex c WHERE c.lo_oid = b.lo_oid) +
+                (SELECT COUNT(*) FROM archivos_pemex a WHERE a.lo_oid = b.lo_oid)
+        """)
+
+        eliminados = 0
+        if aplicar:
+            for lo_oid in sobrantes:
+                if _unlink_seguro(conn, lo_oid):
+                    eliminados += 1
+
+        despues = _reporte_almacenamiento(conn)
+        resultado = {
+            'large_objects_duplicados': len(sobrantes),
+            'large_objects_eliminados': eliminados,
+            'bytes_liberados': antes['bytes_fisicos'] - despues['bytes_fisicos'],
+            'almacenamiento': despues,
+            'aplicado': aplicar,
+        }
+
+        if aplicar:
+            conn.commit()
+            print(f"✅ Deduplicación: {eliminados} large objects eliminados, "
+                  f"{resultado['bytes_liberados']} bytes liberados")
+        else:
+            conn.rollback()
+            print(f"🔧 Simulación: {len(sobrantes)} large objects duplicados, "
+                  f"{resultado['bytes_liberados']} bytes se liberarían")
+        return resultado
+
+    except Exception as e:
+        conn.rollback()
+        raise Exception(f"❌ Error deduplicando archivos: {str(e)}")
+
+# ============================================
+# ESCRITURA EN LOTE (UNA CONEXIÓN, UNA TRANSACCIÓN)
+# ============================================
+def _nombre_unico(nombre, ocupados):
+    """Agrega un sufijo aleatorio si el nombre ya está ocupado en la categoría"""
+    if nombre not in ocupados:
+        return nombre
+    import uuid
+    nombre_base, punto, extension = nombre.rpartition('.')
+    if not punto:
+        return f"{nombre}_{uuid.uuid4().hex[:8]}"
+    return f"{nombre_base}_{uuid.uuid4().hex[:8]}.{extension}"
+
+def _normalizar_lote(archivos, categoria=None):
+    """Acepta archivos sueltos (todos en categoria) o tuplas (archivo, categoria[, tipo])"""
+    lote = []
+    for elemento in archivos:
+        if isinstance(elemento, tuple):
+            archivo, categoria_archivo, *resto = elemento
+            lote.append((archivo, categoria_archivo, resto[0] if resto else None))
+        elif categoria:
+            lote.append((elemento, categoria, None))
+        else:
+            raise Exception(f"❌ Falta la categoría de {_nombre_origen(elemento)}")
+    return lote
+
+def _guardar_blobs_lote(conn, archivos):
+    """
+    Large objects de un lote (archivo, categoria, tipo_archivo), deduplicados
+    por hash también dentro del lote. Devuelve [(lo_oid, tamaño_bytes, hash)]
+    en el mismo orden.
+    """
+    blobs = []
+    reutilizados = 0
+    for archivo, _, _ in archivos:
+        lo_oid, tamaño_bytes, file_hash, reutilizado = _guardar_blob(conn, archivo)
+        reutilizados += reutilizado
+        blobs.append((lo_oid, tamaño_bytes, file_hash))
+    if reutilizados:
+        print(f"♻️ {reutilizados} de {len(archivos)} archivos reutilizaron un large object existente")
+    return blobs
+
+def _guardar_archivos_lote(conn, contrato_id, archivos, usuario="sistema", blobs=None):
+    """
+    Guarda varios archivos de un contrato sin confirmar la transacción.
+    archivos: lista de (archivo, categoria, tipo_archivo); tipo_archivo puede
+    ser None para tomarlo de la subida. Los nombres repetidos se resuelven con
+    una sola consulta y los metadatos se insertan en un único INSERT de varias
+    filas. blobs: resultado de _guardar_blobs_lote si los large objects ya se
+    escribieron. Devuelve los ids en el mismo orden que archivos.
+    """
+    if not archivos:
+        return []
+    if blobs is None:
+        blobs = _guardar_blobs_lote(conn, archivos)
+
+    cur = conn.cursor()
+    categorias = sorted({categoria for _, categoria, _ in archivos})
+    cur.execute("""
+        SELECT categoria, nombre_archivo FROM archivos_pemex
+        WHERE contrato_id = %s AND categoria = ANY(%s)
+    """, (contrato_id, categorias))
+    ocupados = {}
+    for categoria, nombre_archivo in cur.fetchall():
+        ocupados.setdefault(categoria, set()).add(nombre_archivo)
+
+    filas = []
+    for (archivo, categoria, tipo_archivo), (lo_oid, tamaño_bytes, file_hash) in zip(archivos, blobs):
+        nombres = ocupados.setdefault(categoria, set())
+        file_name = _nombre_unico(_nombre_origen(archivo), nombres)
+        nombres.add(file_name)
+        tipo_archivo = tipo_archivo or getattr(archivo, 'type', None) or 'application/octet-stream'
+        filas.append((
+            contrato_id, categoria, tipo_archivo,
+            lo_oid, file_name, tamaño_bytes, file_hash, usuario
+        ))
+
+    ids = execute_values(cur, """
+        INSERT INTO archivos_pemex (
+            contrato_id, categoria, tipo_archivo,
+            lo_oid, nombre_archivo, tamaño_bytes, hash_sha256, usuario_subio
+        ) VALUES %s
+        RETURNING id
+    """, filas, page_size=max(len(filas), 1), fetch=True)
+    return [fila[0] for fila in ids]
+
+# ============================================
+# BÚSQUEDA DE TEXTO COMPLETO
+# ============================================
+# Caracteres del texto (descripción + OCR) sobre los que se arma el fragmento
+LIMITE_TEXTO_FRAGMENTO = 200000
+OPCIONES_FRAGMENTO = "StartSel=**, StopSel=**, MaxWords=25, MinWords=8, MaxFragments=2, FragmentDelimiter=\" … \""
+
+def _buscar_texto(conn, consulta, limite=50, offset=0):
+    """
+    Contratos que coinciden con 'consulta' (sintaxis tipo buscador: palabras,
+    "frase exacta", -excluir, OR) ordenados por ts_rank, con un fragmento
+    resaltado. El fragmento solo se calcula para la página pedida y el total
+    sale de la misma consulta (COUNT(*) OVER).
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        WITH q AS (SELECT websearch_to_tsquery(%(config)s::regconfig, %(consulta)s) AS consulta),
+        pagina AS (
+            SELECT c.id, ts_rank(c.busqueda_tsv, q.consulta) AS rango, COUNT(*) OVER () AS total
+            FROM contratos_pemex c, q
+            WHERE c.busqueda_tsv @@ q.consulta
+            ORDER BY rango DESC, c.id DESC
+            LIMIT %(limite)s OFFSET %(offset)s
+        )
+        SELECT c.id, c.area, c.numero_contrato, c.contratista, c.monto_contrato,
+               c.plazo_dias, c.monto_contrato_num, c.plazo_dias_num, c.descripcion, c.anexos,
+               c.nombre_archivo, c.tipo_archivo, c.fecha_subida, c.tamaño_bytes, c.usuario_subio,
+               p.rango, p.total,
+               ts_headline(%(config)s::regconfig,
+                           left(concat_ws(' … ', c.descripcion, c.texto_ocr), %(limite_texto)s),
+                           q.consulta, %(opciones)s) AS fragmento
+        FROM pagina p JOIN contratos_pemex c ON c.id = p.id, q
+        ORDER BY p.rango DESC, c.id DESC
+    """, {
+        'config': migraciones.CONFIG_BUSQUEDA,
+        'consulta': consulta,
+        'limite': limite,
+        'offset': offset,
+        'limite_texto': LIMITE_TEXTO_FRAGMENTO,
+        'opciones': OPCIONES_FRAGMENTO,
+    })
+    columnas = [desc[0] for desc in cur.description]
+    contratos = [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+    for contrato in contratos:
+        contrato['anexos'] = _anexos_como_lista(contrato.get('anexos'))
+        contrato['rango'] = float(contrato['rango'])
+    return contratos
+
+# ============================================
+# BÚSQUEDA POR SIMILITUD (TRIGRAMAS)
+# ============================================
+# word_similarity mínima para aceptar un contratista o número con errores
+# de OCR o de tecleo ("CONSTRUCTRA" -> "CONSTRUCTORA")
+UMBRAL_SIMILITUD = float(os.environ.get("PEMEX_UMBRAL_SIMILITUD", "0.5"))
+INDICES_TRIGRAMAS = ("idx_contratos_numero_trgm", "idx_contratos_contratista_trgm")
+
+# El search_path del usuario solo tiene su esquema: operadores y funciones
+# de pg_trgm van calificados con el esquema de la extensión ({trgm}, donde
+# la instaló la migración 6). Ambos filtros usan los índices GIN.
+_SQL_SIMILARES = """
+    SELECT id, area, numero_contrato, contratista, monto_contrato,
+           plazo_dias, monto_contrato_num, plazo_dias_num, descripcion, anexos,
+           nombre_archivo, tipo_archivo, fecha_subida, tamaño_bytes, usuario_subio,
+           (numero_contrato ILIKE %(patron)s OR contratista ILIKE %(patron)s) AS contiene,
+           GREATEST({trgm}.word_similarity(%(texto)s, numero_contrato),
+                    {trgm}.word_similarity(%(texto)s, contratista)) AS similitud
+    FROM contratos_pemex
+    WHERE %(texto)s OPERATOR({trgm}.<%%) numero_contrato
+       OR %(texto)s OPERATOR({trgm}.<%%) contratista
+       OR numero_contrato ILIKE %(patron)s
+       OR contratista ILIKE %(patron)s
+    ORDER BY contiene DESC, similitud DESC, fecha_subida DESC
+    LIMIT %(limite)s
+"""
+
+# dsn -> esquema de pg_trgm (se consulta una vez por base)
+_esquemas_trgm = {}
+
+def _consulta_similares(conn):
+    """_SQL_SIMILARES con el esquema donde está instalada pg_trgm"""
+    esquema = _esquemas_trgm.get(conn.dsn)
+    if esquema is None:
+        cur = conn.cursor()
+        cur.execute("SELECT extnamespace::regnamespace::text FROM pg_extension WHERE extname = 'pg_trgm'")
+        fila = cur.fetchone()
+        if not fila:
+            raise Exception("❌ La extensión pg_trgm no está instalada: no hay búsqueda por similitud")
+        esquema = _esquemas_trgm[conn.dsn] = fila[0]
+    return sql.SQL(_SQL_SIMILARES).format(trgm=sql.Identifier(esquema))
+
+def _patron_subcadena(texto):
+    """Patrón ILIKE que busca el texto literal (escapa % y _)"""
+    texto = texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{texto}%"
+
+def _buscar_similares(conn, texto, limite=20, umbral=None):
+    """
+    Contratos cuyo número o contratista contiene 'texto' o se le parece
+    (word_similarity >= umbral); primero los que lo contienen y luego por
+    similitud
+    """
+    cur = conn.cursor()
+    # Solo para esta transacción: el pool hace rollback al devolver la conexión
+    cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                (str(UMBRAL_SIMILITUD if umbral is None else umbral),))
+    cur.execute(_consulta_similares(conn), {'texto': texto, 'patron': _patron_subcadena(texto), 'limite': limite})
+    columnas = [desc[0] for desc in cur.description]
+    contratos = [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+    for contrato in contratos:
+        contrato['anexos'] = _anexos_como_lista(contrato.get('anexos'))
+        contrato['similitud'] = float(contrato['similitud'] or 0)
+    return contratos
+
+def _indices_del_plan(nodo):
+    """Nombres de índice usados en un plan de EXPLAIN (FORMAT JSON)"""
+    indices = set()
+    if nodo.get('Index Name'):
+        indices.add(nodo['Index Name'])
+    for hijo in nodo.get('Plans', []):
+        indices |= _indices_del_plan(hijo)
+    return indices
+
+def _explicar_busqueda_similar(conn, texto, forzar_indice=True):
+    """
+    EXPLAIN de la búsqueda por similitud. Con forzar_indice se desactiva el
+    recorrido secuencial (en tablas chicas el planificador lo prefiere) para
+    comprobar que los índices de trigramas son utilizables. No ejecuta la
+    consulta.
+    """
+    cur = conn.cursor()
+    try:
+        if forzar_indice:
+            cur.execute("SET LOCAL enable_seqscan = off")
+        cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", (str(UMBRAL_SIMILITUD),))
+        cur.execute(sql.SQL("EXPLAIN (FORMAT JSON) ") + _consulta_similares(conn),
+                    {'texto': texto, 'patron': _patron_subcadena(texto), 'limite': 20})
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        indices = _indices_del_plan(plan[0]['Plan'])
+        return {
+            'indices': sorted(indices),
+            'usa_indice_trigramas': all(indice in indices for indice in INDICES_TRIGRAMAS),
+            'plan': plan[0]['Plan'],
+        }
+    finally:
+        conn.rollback()
+
+# ============================================
+# LISTADO PAGINADO DE CONTRATOS (KEYSET)
+# ============================================
+COLUMNAS_CONTRATO = """
+    id, area, numero_contrato, contratista, monto_contrato,
+    plazo_dias, monto_contrato_num, plazo_dias_num, descripcion, anexos,
+    nombre_archivo, tipo_archivo, fecha_subida, tamaño_bytes, usuario_subio
+"""
+TAMAÑO_PAGINA_CONTRATOS = 50
+# Por debajo de esta estimación se cuenta exacto (COUNT(*) es barato)
+UMBRAL_CONTEO_EXACTO = 10000
+
+def _normalizar_anexos(anexos):
+    """'SSPA' o ['ANEXO SSPA', 'b'] -> ['SSPA', 'B'] (como los guarda el extractor)"""
+    if not anexos:
+        return []
+    if isinstance(anexos, str):
+        anexos = [anexos]
+    normalizados = []
+    for anexo in anexos:
+        anexo = str(anexo).strip().upper()
+        if anexo.startswith("ANEXO "):
+            anexo = anexo[len("ANEXO "):].strip()
+        if anexo and anexo not in normalizados:
+            normalizados.append(anexo)
+    return normalizados
+
+def _contar_anexos(conn, limite=None):
+    """[(anexo, contratos que lo incluyen)] del más frecuente al menos frecuente"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT anexo, COUNT(*) AS contratos
+        FROM contratos_pemex c, jsonb_array_elements_text(c.anexos) AS anexo
+        WHERE jsonb_typeof(c.anexos) = 'array'
+        GROUP BY anexo
+        ORDER BY contratos DESC, anexo
+        LIMIT %s
+    """, (limite,))
+    return cur.fetchall()
+
+def _condiciones_contratos(filtros):
+    """WHERE y parámetros para los filtros de buscar_contratos_pemex"""
+    where_conditions = []
+    params = []
+    
+    if filtros:
+        if 'numero_contrato' in filtros and filtros['numero_contrato']:
+            where_conditions.append("numero_contrato ILIKE %s")
+            params.append(f"%{filtros['numero_contrato']}%")
+        if 'contratista' in filtros and filtros['contratista']:
+            where_conditions.append("contratista ILIKE %s")
+            params.append(f"%{filtros['contratista']}%")
+        # Rangos sobre las columnas numéricas (usan índice B-tree)
+        for clave, condicion, normalizar in (
+            ('monto_min', "monto_contrato_num >= %s", normalizar_monto),
+            ('monto_max', "monto_contrato_num <= %s", normalizar_monto),
+            ('plazo_min', "plazo_dias_num >= %s", normalizar_plazo),
+            ('plazo_max', "plazo_dias_num <= %s", normalizar_plazo),
+        ):
+            valor = normalizar(filtros.get(clave))
+            if valor is not None:
+                where_conditions.append(condicion)
+                params.append(valor)
+        # Contratos que incluyen todos estos anexos (índice GIN jsonb_path_ops)
+        anexos = _normalizar_anexos(filtros.get('anexos_contiene'))
+        if anexos:
+            where_conditions.append("anexos @> %s::jsonb")
+            params.append(json.dumps(anexos, ensure_ascii=False))
+    
+    return where_conditions, params
+
+def _fila_a_contrato(columnas, fila):
+    contrato = dict(zip(columnas, fila))
+    # psycopg2 ya entrega el JSONB decodificado; solo las filas guardadas
+    # como texto JSON (doble codificación anterior) se decodifican
+    contrato['anexos'] = _anexos_como_lista(contrato.get('anexos'))
+    return contrato
+
+def _filas_a_contratos(cur):
+    columnas = [desc[0] for desc in cur.description]
+    return [_fila_a_contrato(columnas, fila) for fila in cur.fetchall()]
+
+def _buscar_contratos(conn, filtros=None, limite=None):
+    """
+    Contratos que cumplen los filtros, del más reciente al más antiguo.
+    Sin límite se recorren con un cursor del servidor (_iterar_contratos):
+    el cliente no tiene a la vez todas las tuplas y todos los diccionarios
+    """
+    if not limite:
+        columnas = [columna.strip() for columna in COLUMNAS_CONTRATO.split(',')]
+        return [_fila_a_contrato(columnas, fila) for fila in _iterar_contratos(conn, filtros)]
+    
+    where_conditions, params = _condiciones_contratos(filtros)
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    
+    query = f"""
+        SELECT {COLUMNAS_CONTRATO}
+        FROM contratos_pemex
+        WHERE {where_clause}
+        ORDER BY fecha_subida DESC, id DESC
+        LIMIT %s
+    """
+    params.append(limite)
+    
+    cur = conn.cursor()
+    cur.execute(query, params)
+    return _filas_a_contratos(cur)
+
+def _codificar_cursor(fecha_subida, contrato_id):
+    """Token opaco con la posición (fecha_subida, id) del último contrato de la página"""
+    crudo = json.dumps([fecha_subida.isoformat(), contrato_id])
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+def _decodificar_cursor(cursor):
+    try:
+        fecha_subida, contrato_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return fecha_subida, int(contrato_id)
+    except (ValueError, TypeError) as e:
+        raise Exception(f"❌ Cursor de paginación inválido: {e}")
+
+def _pagina_contratos(conn, filtros=None, tamaño=TAMAÑO_PAGINA_CONTRATOS, cursor=None):
+    """
+    Una página de contratos por keyset sobre (fecha_subida, id): el costo no
+    crece con el número de página (sin OFFSET) y un contrato nuevo no
+    desplaza ni repite filas entre páginas. Devuelve
+    {'contratos': [...], 'siguiente': token o None}
+    """
+    where_conditions, params = _condiciones_contratos(filtros)
+    if cursor:
+        fecha_subida, contrato_id = _decodificar_cursor(cursor)
+        where_conditions.append("(fecha_subida, id) < (%s::timestamptz, %s)")
+        params.extend([fecha_subida, contrato_id])
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    
+    # Una fila de más para saber si hay otra página
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {COLUMNAS_CONTRATO}
+        FROM contratos_pemex
+        WHERE {where_clause}
+        ORDER BY fecha_subida DESC, id DESC
+        LIMIT %s
+    """, params + [tamaño + 1])
+    contratos = _filas_a_contratos(cur)
+    
+    siguiente = None
+    if len(contratos) > tamaño:
+        contratos = contratos[:tamaño]
+        ultimo = contratos[-1]
+        siguiente = _codificar_cursor(ultimo['fecha_subida'], ultimo['id'])
+    return {'contratos': contratos, 'siguiente': siguiente}
+
+def _contar_contratos(conn, filtros=None, exacto=False):
+    """
+    Número de contratos que cumplen los filtros. Sin filtros es exacto y
+    sale de estadisticas_pemex. Con filtros y sin exacto se usa la
+    estimación del planificador (EXPLAIN) y solo se cuenta de verdad si la
+    estimación es chica. Devuelve {'total': n, 'estimado': bool}
+    """
+    where_conditions, params = _condiciones_contratos(filtros)
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    cur = conn.cursor()
+    
+    if not where_conditions:
+        cur.execute("SELECT contratos FROM estadisticas_pemex WHERE dimension = 'total' AND clave = ''")
+        fila = cur.fetchone()
+        return {'total': fila[0] if fila else 0, 'estimado': False}
+    
+    if not exacto:
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM contratos_pemex WHERE {where_clause}", params)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimado = int(plan[0]['Plan']['Plan Rows'])
+        if estimado >= UMBRAL_CONTEO_EXACTO:
+            return {'total': estimado, 'estimado': True}
+    
+    cur.execute(f"SELECT COUNT(*) FROM contratos_pemex WHERE {where_clause}", params)
+    return {'total': cur.fetchone()[0], 'estimado': False}
+
+def _iterar_contratos(conn, filtros=None, itersize=ITERSIZE_SERVIDOR):
+    """Tuplas de contratos (columnas de COLUMNAS_CONTRATO) sin cargar la tabla completa"""
+    where_conditions, params = _condiciones_contratos(filtros)
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    return _iterar_consulta(conn, f"""
+        SELECT {COLUMNAS_CONTRATO}
+        FROM contratos_pemex
+        WHERE {where_clause}
+        ORDER BY fecha_subida DESC, id DESC
+    """, params, itersize)
+
+def _exportar_contratos_csv(conn, destino, filtros=None, itersize=ITERSIZE_SERVIDOR):
+    """
+    Escribe los contratos en CSV (ruta o archivo de texto abierto) fila por
+    fila desde un cursor del servidor. Devuelve cuántos contratos se escribieron.
+    """
+    columnas = [columna.strip() for columna in COLUMNAS_CONTRATO.split(',')]
+    indice_anexos = columnas.index('anexos')
+    archivo = open(destino, 'w', newline='', encoding='utf-8') if isinstance(destino, (str, os.PathLike)) else destino
+    try:
+        escritor = csv.writer(archivo)
+        escritor.writerow(columnas)
+        total = 0
+        for fila in _iterar_contratos(conn, filtros, itersize):
+            fila = list(fila)
+            fila[indice_anexos] = json.dumps(_anexos_como_lista(fila[indice_anexos]), ensure_ascii=False)
+            escritor.writerow(fila)
+            total += 1
+        return total
+    finally:
+        if archivo is not destino:
+            archivo.close()
+
+# ============================================
+# ESTADÍSTICAS PRECALCULADAS (estadisticas_pemex)
+# ============================================
+# Dimensiones de estadisticas_pemex y su orden al listarlas
+DIMENSIONES_ESTADISTICAS = {
+    'contratista': "contratos DESC, clave",
+    'dia': "clave DESC",
+    'categoria': "archivos DESC, clave",
+}
+
+def _tabla_en(nombre, esquema=None):
+    """Identificador de tabla, calificado con el esquema si se indica"""
+    return sql.Identifier(esquema, nombre) if esquema else sql.Identifier(nombre)
+
+def _estadisticas_totales(conn, esquema=None):
+    """
+    Totales del esquema desde la fila 'total' de estadisticas_pemex; la
+    primera y última fecha salen del índice de fecha_subida (sin recorrer
+    la tabla)
+    """
+    cur = conn.cursor()
+    cur.execute(sql.SQL("""
+        SELECT
+            COALESCE(e.contratos, 0), COALESCE(e.bytes_contratos, 0), COALESCE(e.monto_total, 0),
+            COALESCE(e.archivos, 0), COALESCE(e.bytes_archivos, 0), COALESCE(e.contratos_con_archivos, 0),
+            (SELECT COUNT(*) FROM {estadisticas} WHERE dimension = 'contratista' AND contratos > 0),
+            (SELECT MIN(fecha_subida) FROM {contratos}),
+            (SELECT MAX(fecha_subida) FROM {contratos})
+        FROM (SELECT 1) AS uno
+        LEFT JOIN {estadisticas} e ON e.dimension = 'total' AND e.clave = ''
+    """).format(
+        estadisticas=_tabla_en("estadisticas_pemex", esquema),
+        contratos=_tabla_en("contratos_pemex", esquema),
+    ))
+    return dict(zip([
+        'contratos', 'bytes_contratos', 'monto_total', 'archivos', 'bytes_archivos',
+        'contratos_con_archivos', 'contratistas', 'primer_contrato', 'ultimo_contrato'
+    ], cur.fetchone()))
+
+def _estadisticas_por(conn, dimension, limite=None):
+    """Filas de una dimensión (contratista, dia o categoria) con valores distintos de cero"""
+    if dimension not in DIMENSIONES_ESTADISTICAS:
+        raise Exception(f"❌ Dimensión desconocida: {dimension} (use {', '.join(DIMENSIONES_ESTADISTICAS)})")
+    cur = conn.cursor()
+    cur.execute(sql.SQL("""
+        SELECT clave, contratos, bytes_contratos, monto_total, archivos, bytes_archivos
+        FROM estadisticas_pemex
+        WHERE dimension = %s AND (contratos <> 0 OR archivos <> 0)
+        ORDER BY {orden}
+        LIMIT %s
+    """).format(orden=sql.SQL(DIMENSIONES_ESTADISTICAS[dimension])), (dimension, limite))
+    columnas = [desc[0] for desc in cur.description]
+    return [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+
+def _formato_estadisticas_pemex(totales):
+    """Totales con las llaves de obtener_estadisticas_pemex"""
+    stats = {
+        'total_contratos': totales['contratos'],
+        'total_bytes': totales['bytes_contratos'],
+        'contratistas_unicos': totales['contratistas'],
+        'fecha_mas_antigua': totales['primer_contrato'],
+        'fecha_mas_reciente': totales['ultimo_contrato'],
+        'monto_total': totales['monto_total'],
+    }
+    # Formatear fechas
+    for key in ['fecha_mas_antigua', 'fecha_mas_reciente']:
+        if stats[key]:
+            stats[key] = stats[key].strftime('%Y-%m-%d')
+    return stats
+
+def _estadisticas_archivos(conn):
+    """Totales de archivos y desglose por categoría (llaves de obtener_estadisticas_archivos)"""
+    totales = _estadisticas_totales(conn)
+    return {
+        'total_archivos': totales['archivos'],
+        'contratos_con_archivos': totales['contratos_con_archivos'],
+        'total_bytes': totales['bytes_archivos'],
+        'categorias': [
+            {'categoria': fila['clave'], 'cantidad_por_categoria': fila['archivos'],
+             'total_bytes': fila['bytes_archivos']}
+            for fila in _estadisticas_por(conn, 'categoria')
+        ],
+    }
+
+def _reconstruir_estadisticas(conn):
+    """Recalcula estadisticas_pemex desde cero (si se desincronizó, p. ej. tras un TRUNCATE)"""
+    cur = conn.cursor()
+    try:
+        migraciones.reconstruir_estadisticas(cur)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise Exception(f"❌ Error reconstruyendo estadísticas: {str(e)}")
+    totales = _estadisticas_totales(conn)
+    print(f"✅ Estadísticas reconstruidas: {totales['contratos']} contratos, {totales['archivos']} archivos")
+    return totales
+
+# ============================================
+# ESTADÍSTICAS DE TODA LA ORGANIZACIÓN
+# ============================================
+
+# Una fila por usuario registrado cuyo esquema existe: conteos estimados del
+# catálogo (reltuples, -1 si nunca se analizó) y espacio en disco de las
+# tablas. Los archivos viven en large objects de pg_largeobject, compartido
+# por todos los esquemas, así que bytes_disco no incluye su contenido
+_SQL_ESTADISTICAS_CATALOGO = """
+    SELECT
+        u.usuario,
+        u.esquema,
+        GREATEST(COALESCE(c.reltuples, 0), 0)::bigint,
+        GREATEST(COALESCE(a.reltuples, 0), 0)::bigint,
+        COALESCE(pg_total_relation_size(c.oid), 0) + COALESCE(pg_total_relation_size(a.oid), 0),
+        to_regclass(format('%I.estadisticas_pemex', u.esquema)) IS NOT NULL
+    FROM public.usuarios_registrados u
+    JOIN pg_namespace n ON n.nspname = u.esquema
+    LEFT JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = 'contratos_pemex'
+    LEFT JOIN pg_class a ON a.relnamespace = n.oid AND a.relname = 'archivos_pemex'
+    ORDER BY u.usuario
+"""
+
+def _estadisticas_organizacion(conn, exacto=True):
+    """
+    Conteos y bytes de todos los esquemas de usuario en una o dos consultas.
+
+    Siempre se lee el catálogo (una consulta, sin tocar las tablas). Con
+    exacto se agrega un solo UNION ALL sobre la fila 'total' de
+    estadisticas_pemex de cada esquema; los esquemas sin esa tabla (aún sin
+    migrar) se quedan con la estimación y se marcan como estimados.
+    Devuelve {'usuarios': [...], 'totales': {...}, 'estimado': bool}
+    """
+    cur = conn.cursor()
+    cur.execute(_SQL_ESTADISTICAS_CATALOGO)
+    usuarios = []
+    con_estadisticas = []
+    for usuario, esquema, contratos, archivos, bytes_disco, tiene_rollup in cur.fetchall():
+        usuarios.append({
+            'usuario': usuario,
+            'esquema': esquema,
+            'total_contratos': contratos,
+            'total_archivos': archivos,
+            'bytes_contratos': None,
+            'bytes_archivos': None,
+            'bytes_disco': bytes_disco,
+            'estimado': True,
+        })
+        if tiene_rollup:
+            con_estadisticas.append(esquema)
+    
+    if exacto and con_estadisticas:
+        partes = [
+            sql.SQL("""
+                SELECT {esquema}, contratos, archivos, bytes_contratos, bytes_archivos
+                FROM {tabla} WHERE dimension = 'total' AND clave = ''
+            """).format(esquema=sql.Literal(esquema), tabla=sql.Identifier(esquema, "estadisticas_pemex"))
+            for esquema in con_estadisticas
+        ]
+        cur.execute(sql.SQL(" UNION ALL ").join(partes))
+        por_esquema = {usuario['esquema']: usuario for usuario in usuarios}
+        for esquema, contratos, archivos, bytes_contratos, bytes_archivos in cur.fetchall():
+            por_esquema[esquema].update({
+                'total_contratos': contratos,
+                'total_archivos': archivos,
+                'bytes_contratos': bytes_contratos,
+                'bytes_archivos': bytes_archivos,
+                'estimado': False,
+            })
+        sin_migrar = len(usuarios) - len(con_estadisticas)
+        if sin_migrar:
+            print(f"⚠️ {sin_migrar} esquema(s) sin estadisticas_pemex: se reportan estimados (ejecute las migraciones)")
+    
+    totales = {'usuarios': len(usuarios)}
+    for llave in ('total_contratos', 'total_archivos', 'bytes_contratos', 'bytes_archivos', 'bytes_disco'):
+        valores = [usuario[llave] for usuario in usuarios if usuario[llave] is not None]
+        totales[llave] = sum(valores) if valores else None
+    
+    return {
+        'usuarios': usuarios,
+        'totales': totales,
+        'estimado': any(usuario['estimado'] for usuario in usuarios),
+    }
+
 class ContratosManager:
     def __init__(self, connection_string):
         self.connection_string = connection_string
@@ -16,56 +1183,31 @@ class ContratosManager:
         psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY)
     
     def _get_connection(self):
-        conn = psycopg2.connect(self.connection_string)
-        conn.autocommit = False
-        return conn
+        """Conexión prestada por el pool del proceso (conn.close() la devuelve)"""
+        return obtener_pool(self.connection_string).obtener()
+
+    def conexion(self):
+        """
+        Context manager con una conexión del pool:
+            with manager.conexion() as conn: ...
+        Confirma al salir, revierte si hay excepción y la devuelve al pool
+        """
+        return obtener_pool(self.connection_string).conexion()
+
+    def estadisticas_pool(self):
+        """Préstamos, esperas, conexiones creadas, etc. del pool de este manager"""
+        return obtener_pool(self.connection_string).estadisticas()
     
     def init_db(self):
-        """Inicializar la base de datos con TODOS los campos PEMEX"""
-        conn = self._get_connection()
+        """
+        Inicializar la base de datos con TODOS los campos PEMEX: aplica las
+        migraciones pendientes del esquema público (una vez por proceso)
+        """
         try:
-            cur = conn.cursor()
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS contratos_pemex (
-                    id BIGSERIAL PRIMARY KEY,
-                    area VARCHAR(500) NOT NULL DEFAULT 'SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN',
-                    numero_contrato VARCHAR(100) UNIQUE NOT NULL,
-                    contratista VARCHAR(300) NOT NULL,
-                    monto_contrato VARCHAR(100),
-                    plazo_dias VARCHAR(50),
-                    descripcion TEXT,
-                    anexos JSONB,
-                    
-                    -- Archivo original
-                    lo_oid OID NOT NULL,
-                    nombre_archivo VARCHAR(300) NOT NULL,
-                    tipo_archivo VARCHAR(50),
-                    tamaño_bytes BIGINT NOT NULL,
-                    hash_sha256 VARCHAR(64) NOT NULL,
-                    
-                    -- Metadatos del sistema
-                    fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                    usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                    procesado BOOLEAN DEFAULT TRUE,
-                    
-                    CONSTRAINT check_tamaño_positivo CHECK (tamaño_bytes > 0)
-                )
-            """)
-            
-            # Índices
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_numero ON contratos_pemex(numero_contrato)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_contratista ON contratos_pemex(contratista)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_fecha ON contratos_pemex(fecha_subida)")
-            
-            conn.commit()
+            migraciones.asegurar_esquema(self.connection_string)
             return True
-            
         except Exception as e:
-            conn.rollback()
             raise Exception(f"❌ Error inicializando BD: {str(e)}")
-        finally:
-            conn.close()
     
     def calcular_hash(self, file_bytes):
         return hashlib.sha256(file_bytes).hexdigest()
@@ -90,7 +1232,79 @@ class ContratosManager:
         """Debugging extensivo"""
         print(f"🔍 {titulo}:")
         for key, value in datos.items():
-            print(f"  {key}: {repr(value)} (tipo: {type(value).__name__})")
+            texto = repr(value)
+            if len(texto) > 300:
+                texto = f"{texto[:300]}... ({len(texto)} caracteres)"
+            print(f"  {key}: {texto} (tipo: {type(value).__name__})")
+
+    def _insertar_contrato(self, conn, archivo, datos_extraidos, usuario="sistema", blob=None):
+        """
+        Inserta el contrato y su archivo principal sin confirmar la transacción.
+        blob: resultado de _guardar_blob si el large object ya se escribió.
+        Devuelve (contrato_id, hash_sha256, reutilizado)
+        """
+        # Large Object deduplicado por hash (reutiliza el existente si ya hay uno)
+        lo_oid, tamaño_bytes, file_hash, reutilizado = blob or _guardar_blob(conn, archivo)
+        
+        # CONVERSIÓN 100% SEGURA
+        contrato = self._safe_string(datos_extraidos.get('contrato', ''))
+        contratista = self._safe_string(datos_extraidos.get('contratista', ''))
+        monto = self._safe_string(datos_extraidos.get('monto', ''))
+        
+        plazo = self._safe_string(datos_extraidos.get('plazo', ''))
+        if not isinstance(plazo, str):
+            plazo = str(plazo) if plazo is not None else ""
+        
+        objeto = self._safe_string(datos_extraidos.get('objeto', ''))
+        # Lista JSON (no una cadena con JSON adentro): @> y el índice GIN la necesitan
+        anexos = json.dumps(_anexos_como_lista(datos_extraidos.get('anexos')), ensure_ascii=False)
+        
+        # Valores numéricos normalizados (el texto original se guarda aparte)
+        monto_num = normalizar_monto(monto)
+        plazo_num = normalizar_plazo(plazo)
+        
+        # Texto OCR para reprocesar sin repetir el OCR (PostgreSQL no admite NUL)
+        texto_ocr = self._safe_string(datos_extraidos.get('texto_ocr', '')).replace('\x00', '') or None
+        version_extractor = VERSION_EXTRACTOR if texto_ocr else None
+        
+        # Lo que produjo el extractor antes de que el usuario editara el formulario;
+        # sin ella el reprocesamiento solo llenará campos vacíos
+        extraccion = datos_extraidos.get('extraccion')
+        if isinstance(extraccion, str):
+            try:
+                extraccion = json.loads(extraccion)
+            except ValueError:
+                extraccion = None
+        extraccion_original = (
+            json.dumps(_instantanea_extraccion(extraccion), ensure_ascii=False)
+            if texto_ocr and isinstance(extraccion, dict) else None
+        )
+        
+        self._debug_datos({
+            'contrato': contrato,
+            'contratista': contratista,
+            'monto': monto,
+            'plazo': plazo,
+            'objeto': objeto
+        }, "DATOS FINALES PARA POSTGRESQL")
+        
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO contratos_pemex (
+                numero_contrato, contratista, monto_contrato, 
+                plazo_dias, monto_contrato_num, plazo_dias_num, descripcion, anexos,
+                texto_ocr, version_extractor, extraccion_original,
+                lo_oid, nombre_archivo, tipo_archivo, tamaño_bytes, hash_sha256, usuario_subio
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (
+            contrato, contratista, monto, plazo, monto_num, plazo_num, objeto, anexos,
+            texto_ocr, version_extractor, extraccion_original, lo_oid, _nombre_origen(archivo),
+            getattr(archivo, 'type', 'application/pdf'),
+            tamaño_bytes, file_hash, usuario
+        ))
+        
+        return cur.fetchone()[0], file_hash, reutilizado
 
     def guardar_contrato_pemex(self, archivo, datos_extraidos, usuario="sistema"):
         """
@@ -100,71 +1314,12 @@ class ContratosManager:
         try:
             self._debug_datos(datos_extraidos, "DEBUG DATOS CRUDOS")
             
-            file_bytes = archivo.getvalue()
-            file_hash = self.calcular_hash(file_bytes)
-            
-            # CORRECCIÓN: Large Object con None en lugar de True
-            lo_oid = conn.lobject(0, 'wb', 0, None)  # ← CORREGIDO AQUÍ
-            
-            # Escribir archivo en chunks
-            chunk_size = 1024 * 1024
-            with io.BytesIO(file_bytes) as file_stream:
-                while True:
-                    chunk = file_stream.read(chunk_size)
-                    if not chunk:
-                        break
-                    lo_oid.write(chunk)
-            
-            # CONVERSIÓN 100% SEGURA
-            contrato = self._safe_string(datos_extraidos.get('contrato', ''))
-            contratista = self._safe_string(datos_extraidos.get('contratista', ''))
-            monto = self._safe_string(datos_extraidos.get('monto', ''))
-            
-            # SOLUCIÓN DEFINITIVA PARA PLAZO
-            plazo_original = datos_extraidos.get('plazo', '')
-            print(f"🚨 PLAZO ORIGINAL: {repr(plazo_original)} (tipo: {type(plazo_original).__name__})")
-            
-            plazo = self._safe_string(plazo_original)
-            print(f"🚨 PLAZO CONVERTIDO: {repr(plazo)} (tipo: {type(plazo).__name__})")
-            
-            if not isinstance(plazo, str):
-                plazo = str(plazo) if plazo is not None else ""
-                print(f"🚨 PLAZO FORZADO: {repr(plazo)}")
-            
-            objeto = self._safe_string(datos_extraidos.get('objeto', ''))
-            anexos = json.dumps(datos_extraidos.get('anexos', []), ensure_ascii=False)
-            
-            # Datos finales para debug
-            datos_finales = {
-                'contrato': contrato,
-                'contratista': contratista,
-                'monto': monto,
-                'plazo': plazo,
-                'objeto': objeto
-            }
-            self._debug_datos(datos_finales, "DATOS FINALES PARA POSTGRESQL")
-            
-            # Insertar en PostgreSQL
-            cur = conn.cursor()
-            query = sql.SQL("""
-                INSERT INTO contratos_pemex (
-                    numero_contrato, contratista, monto_contrato, 
-                    plazo_dias, descripcion, anexos,
-                    lo_oid, nombre_archivo, tipo_archivo, tamaño_bytes, hash_sha256, usuario_subio
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-            
-            cur.execute(query, (
-                contrato, contratista, monto, plazo, objeto, anexos,
-                lo_oid.oid, archivo.name, getattr(archivo, 'type', 'application/pdf'),
-                len(file_bytes), file_hash, usuario
-            ))
-            
-            contrato_id = cur.fetchone()[0]
+            contrato_id, file_hash, reutilizado = self._insertar_contrato(conn, archivo, datos_extraidos, usuario)
             conn.commit()
             
             print(f"✅ CONTRATO GUARDADO EN POSTGRESQL - ID: {contrato_id}")
+            if reutilizado:
+                print(f"♻️ Contenido ya guardado (hash {file_hash[:12]}...): se reutilizó su large object")
             return contrato_id
             
         except psycopg2.IntegrityError:
@@ -177,83 +1332,216 @@ class ContratosManager:
         finally:
             conn.close()
 
-    def guardar_contrato_completo(self, archivos_data, datos_contrato, usuario="sistema"):
+    # Categoría de archivos_pemex para cada grupo de archivos_data
+    CATEGORIAS_PAQUETE = (
+        ('cedulas', 'CEDULAS'),
+        ('anexos', 'ANEXOS'),
+        ('soportes', 'SOPORTES FISICOS'),
+    )
+
+    def _guardar_contrato_completo(self, conn, archivos_data, datos_contrato, usuario="sistema"):
         """
-        Guardar contrato completo - SOLO POSTGRESQL
+        Contrato principal más cédulas, anexos y soportes en una sola
+        transacción: si algo falla no queda nada guardado.
+        Devuelve (contrato_id, ids de archivos)
         """
         try:
             self._debug_datos(datos_contrato, "DATOS CONTRATO ORIGINAL")
             
-            # Limpiar datos
+            # Limpiar datos (los anexos se quedan como lista y la extracción
+            # original como diccionario: _insertar_contrato los serializa)
             datos_limpios = {}
             for key, value in datos_contrato.items():
-                datos_limpios[key] = self._safe_string(value)
+                datos_limpios[key] = value if key in ('anexos', 'extraccion') else self._safe_string(value)
             
             self._debug_datos(datos_limpios, "DATOS LIMPIOS")
             
-            # Guardar en PostgreSQL
-            archivo_principal = archivos_data['principal']
-            contrato_id = self.guardar_contrato_pemex(archivo_principal, datos_limpios, usuario)
+            archivos = [
+                (archivo, categoria, None)
+                for clave, categoria in self.CATEGORIAS_PAQUETE
+                for archivo in archivos_data.get(clave) or []
+            ]
             
-            if contrato_id:
-                st.success(f"🗄️ **Contrato guardado en PostgreSQL** (ID: {contrato_id})")
-                return contrato_id
-            else:
-                raise Exception("No se pudo obtener ID del contrato")
-                
+            # Primero todos los large objects (lo lento); las filas de
+            # contratos_pemex y archivos_pemex van al final, justo antes del
+            # commit, para que los bloqueos del trigger de estadísticas duren poco
+            blob_principal = _guardar_blob(conn, archivos_data['principal'])
+            blobs = _guardar_blobs_lote(conn, archivos)
+            
+            contrato_id, _, _ = self._insertar_contrato(
+                conn, archivos_data['principal'], datos_limpios, usuario, blob=blob_principal
+            )
+            ids_archivos = _guardar_archivos_lote(conn, contrato_id, archivos, usuario, blobs=blobs)
+            conn.commit()
+            
+            print(f"✅ CONTRATO COMPLETO GUARDADO - ID: {contrato_id} | {len(ids_archivos)} archivos adjuntos")
+            return contrato_id, ids_archivos
+            
+        except psycopg2.IntegrityError:
+            conn.rollback()
+            raise Exception("❌ Ya existe un contrato con ese número")
+        except Exception as e:
+            conn.rollback()
+            print(f"🔴 ERROR DETALLADO: {traceback.format_exc()}")
+            raise Exception(f"❌ Error guardando contrato completo: {str(e)}")
+
+    def guardar_contrato_completo(self, archivos_data, datos_contrato, usuario="sistema"):
+        """
+        Guardar contrato completo - SOLO POSTGRESQL
+        El principal va a contratos_pemex y cédulas/anexos/soportes a
+        archivos_pemex, todo con una conexión y un solo commit
+        """
+        conn = self._get_connection()
+        try:
+            contrato_id, ids_archivos = self._guardar_contrato_completo(conn, archivos_data, datos_contrato, usuario)
+            st.success(f"🗄️ **Contrato guardado en PostgreSQL** (ID: {contrato_id}, {len(ids_archivos)} archivos adjuntos)")
+            return contrato_id
         except Exception as e:
             st.error(f"❌ Error guardando en PostgreSQL: {str(e)}")
             raise Exception(f"Error guardando contrato: {str(e)}")
+        finally:
+            conn.close()
+
+    def guardar_archivos_lote(self, contrato_id, archivos, categoria=None, usuario="sistema"):
+        """
+        Guardar varios archivos de un contrato con una conexión y un commit
+        archivos: subidas/flujos/bytes/rutas (todos en categoria) o tuplas
+        (archivo, categoria) / (archivo, categoria, tipo_archivo)
+        Devuelve la lista de ids; si uno falla no se guarda ninguno
+        """
+        conn = self._get_connection()
+        try:
+            ids = _guardar_archivos_lote(conn, contrato_id, _normalizar_lote(archivos, categoria), usuario)
+            conn.commit()
+            print(f"✅ Lote guardado: {len(ids)} archivos para contrato {contrato_id}")
+            return ids
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ ERROR guardando lote de archivos: {str(e)}")
+            raise Exception(f"❌ Error guardando lote de archivos: {str(e)}")
+        finally:
+            conn.close()
     
-    def buscar_contratos_pemex(self, filtros=None):
-        """Búsqueda en PostgreSQL"""
+    def buscar_contratos_pemex(self, filtros=None, limite=None):
+        """
+        Búsqueda en PostgreSQL
+        Sin limite trae todos: para listas en pantalla use listar_contratos_pagina
+        """
         conn = self._get_connection()
         try:
-            cur = conn.cursor()
-            
-            where_conditions = []
-            params = []
-            
-            if filtros:
-                if 'numero_contrato' in filtros and filtros['numero_contrato']:
-                    where_conditions.append("numero_contrato ILIKE %s")
-                    params.append(f"%{filtros['numero_contrato']}%")
-                if 'contratista' in filtros and filtros['contratista']:
-                    where_conditions.append("contratista ILIKE %s")
-                    params.append(f"%{filtros['contratista']}%")
-            
-            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-            
-            query = f"""
-                SELECT id, area, numero_contrato, contratista, monto_contrato, 
-                       plazo_dias, descripcion, anexos, nombre_archivo, tipo_archivo,
-                       fecha_subida, tamaño_bytes, usuario_subio
-                FROM contratos_pemex
-                WHERE {where_clause}
-                ORDER BY fecha_subida DESC
-            """
-            
-            cur.execute(query, params)
-            resultados = cur.fetchall()
-            
-            columnas = [desc[0] for desc in cur.description]
-            contratos = [dict(zip(columnas, fila)) for fila in resultados]
-            
-            # Convertir JSON de anexos
-            for contrato in contratos:
-                if contrato.get('anexos'):
-                    try:
-                        contrato['anexos'] = json.loads(contrato['anexos'])
-                    except:
-                        contrato['anexos'] = []
-            
-            return contratos
-            
+            return _buscar_contratos(conn, filtros, limite)
         except Exception as e:
             raise Exception(f"❌ Error buscando contratos: {str(e)}")
         finally:
             conn.close()
     
+    def listar_contratos_pagina(self, filtros=None, tamaño_pagina=TAMAÑO_PAGINA_CONTRATOS, cursor=None):
+        """
+        Una página de contratos (más recientes primero)
+        Para la siguiente página pase cursor=resultado['siguiente']
+        """
+        conn = self._get_connection()
+        try:
+            return _pagina_contratos(conn, filtros, tamaño_pagina, cursor)
+        except Exception as e:
+            raise Exception(f"❌ Error listando contratos: {str(e)}")
+        finally:
+            conn.close()
+    
+    def contar_contratos(self, filtros=None, exacto=False):
+        """Total (estimado si es grande) de contratos que cumplen los filtros"""
+        conn = self._get_connection()
+        try:
+            return _contar_contratos(conn, filtros, exacto)
+        except Exception as e:
+            raise Exception(f"❌ Error contando contratos: {str(e)}")
+        finally:
+            conn.close()
+    
+    def contar_anexos(self, limite=None):
+        """
+        Cuántos contratos incluyen cada anexo, para el tablero y los filtros:
+        [(anexo, contratos)]. Para buscar los contratos de un anexo use
+        filtros={'anexos_contiene': ['SSPA']}
+        """
+        conn = self._get_connection()
+        try:
+            return _contar_anexos(conn, limite)
+        except Exception as e:
+            raise Exception(f"❌ Error contando anexos: {str(e)}")
+        finally:
+            conn.close()
+    
+    def iterar_contratos(self, filtros=None, itersize=ITERSIZE_SERVIDOR):
+        """
+        Contratos como tuplas (columnas de COLUMNAS_CONTRATO) desde un cursor
+        del servidor, itersize filas por viaje. La conexión queda prestada
+        hasta que el generador termina o se cierra.
+        """
+        conn = self._get_connection()
+        try:
+            yield from _iterar_contratos(conn, filtros, itersize)
+        finally:
+            conn.close()
+    
+    def exportar_contratos(self, destino, filtros=None, itersize=ITERSIZE_SERVIDOR):
+        """
+        Exportar contratos (sin archivos ni texto OCR) a CSV: ruta o archivo
+        de texto abierto. La memoria no crece con el número de contratos
+        """
+        conn = self._get_connection()
+        try:
+            total = _exportar_contratos_csv(conn, destino, filtros, itersize)
+            print(f"✅ {total} contratos exportados")
+            return total
+        except Exception as e:
+            raise Exception(f"❌ Error exportando contratos: {str(e)}")
+        finally:
+            conn.close()
+    
+    def buscar_texto(self, consulta, limit=50, offset=0):
+        """
+        Búsqueda de texto completo (número, contratista, descripción, área y
+        texto OCR) con ranking y fragmento resaltado. Cada contrato trae
+        'rango', 'fragmento' y 'total' (coincidencias sin paginar)
+        """
+        consulta = (consulta or '').strip()
+        if not consulta:
+            return []
+        conn = self._get_connection()
+        try:
+            return _buscar_texto(conn, consulta, limit, offset)
+        except Exception as e:
+            raise Exception(f"❌ Error en búsqueda de texto: {str(e)}")
+        finally:
+            conn.close()
+    
+    def buscar_similares(self, texto, limit=20, umbral=None):
+        """
+        Búsqueda tolerante a errores de OCR y de tecleo en número de contrato
+        y contratista (índices de trigramas). Cada contrato trae 'similitud'
+        """
+        texto = (texto or '').strip()
+        if not texto:
+            return []
+        conn = self._get_connection()
+        try:
+            return _buscar_similares(conn, texto, limit, umbral)
+        except Exception as e:
+            raise Exception(f"❌ Error en búsqueda por similitud: {str(e)}")
+        finally:
+            conn.close()
+    
+    def diagnosticar_busqueda_similar(self, texto="CONSTRUCTORA", forzar_indice=True):
+        """EXPLAIN de buscar_similares: índices que usaría el planificador"""
+        conn = self._get_connection()
+        try:
+            return _explicar_busqueda_similar(conn, texto, forzar_indice)
+        except Exception as e:
+            raise Exception(f"❌ Error diagnosticando búsqueda: {str(e)}")
+        finally:
+            conn.close()
+    
     def obtener_contrato_por_id(self, contrato_id):
         """Obtener contrato completo por ID"""
         conn = self._get_connection()
@@ -276,17 +1564,7 @@ class ContratosManager:
             
             # CORRECCIÓN: Large Object con parámetros correctos
             lo_oid = metadata['lo_oid']
-            large_obj = conn.lobject(lo_oid, 'rb', 0, None)  # ← CORREGIDO AQUÍ
-            
-            chunks = []
-            chunk_size = 1024 * 1024
-            while True:
-                chunk = large_obj.read(chunk_size)
-                if not chunk:
-                    break
-                chunks.append(chunk)
-            
-            contenido = b''.join(chunks)
+            contenido = _leer_large_object(conn, lo_oid)
             
             return {
                 'metadata': metadata,
@@ -304,22 +1582,23 @@ class ContratosManager:
         try:
             cur = conn.cursor()
             
-            # Obtener OID antes de eliminar
-            cur.execute("SELECT lo_oid FROM contratos_pemex WHERE id = %s", (contrato_id,))
+            # Obtener OID y hash antes de eliminar
+            cur.execute("SELECT lo_oid, hash_sha256 FROM contratos_pemex WHERE id = %s", (contrato_id,))
             resultado = cur.fetchone()
             
             if resultado:
-                lo_oid = resultado[0]
+                # Archivos asociados (el ON DELETE CASCADE no libera sus blobs)
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE contrato_id = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (contrato_id,))
+                referencias = cur.fetchall()
                 
                 # Eliminar de la tabla
                 cur.execute("DELETE FROM contratos_pemex WHERE id = %s", (contrato_id,))
                 
-                # Eliminar Large Object
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+                # Large Objects: solo se eliminan si ya nadie los usa
+                _liberar_blobs(conn, [resultado] + referencias)
             
             conn.commit()
             return True
@@ -331,166 +1610,299 @@ class ContratosManager:
             conn.close()
     
     def obtener_estadisticas_pemex(self):
-        """Obtener estadísticas de PostgreSQL"""
+        """Obtener estadísticas de PostgreSQL
+        Lee estadisticas_pemex (mantenida por triggers): no recorre la tabla
+        """
         conn = self._get_connection()
+        try:
+            return _formato_estadisticas_pemex(_estadisticas_totales(conn))
+        except Exception as e:
+            raise Exception(f"❌ Error obteniendo estadísticas: {str(e)}")
+        finally:
+            conn.close()
+
+    def obtener_estadisticas_detalle(self, dimension, limite=None):
+        """
+        Totales por 'contratista', 'dia' (AAAA-MM-DD) o 'categoria' de archivos
+        """
+        conn = self._get_connection()
+        try:
+            return _estadisticas_por(conn, dimension, limite)
+        except Exception as e:
+            raise Exception(f"❌ Error obteniendo estadísticas por {dimension}: {str(e)}")
+        finally:
+            conn.close()
+
+    def reconstruir_estadisticas(self):
+        """Recalcular estadisticas_pemex desde las tablas"""
+        conn = self._get_connection()
+        try:
+            return _reconstruir_estadisticas(conn)
+        finally:
+            conn.close()
+
+    def rellenar_columnas_numericas(self, tamaño_lote=500, recalcular=False):
+        """
+        Llenar monto_contrato_num / plazo_dias_num de contratos existentes
+        a partir del texto original, por lotes. Con recalcular también se
+        corrigen los valores ya guardados (p. ej. tras arreglar la lectura de
+        separadores de miles)
+        """
+        conn = self._get_connection()
+        try:
+            return self._rellenar_columnas_numericas(conn, tamaño_lote, recalcular)
+        finally:
+            conn.close()
+
+    def _rellenar_columnas_numericas(self, conn, tamaño_lote, recalcular=False):
+        """
+        Recorre los contratos pendientes por id (keyset) y actualiza cada lote
+        con un solo UPDATE ... FROM (VALUES ...), confirmando lote por lote para
+        no mantener bloqueos largos. Los textos sin cifra se quedan en NULL.
+        Con recalcular se revisan todas las filas con texto y se reemplaza el
+        valor numérico que no coincida con la lectura actual.
+        """
+        resumen = {'revisados': 0, 'actualizados': 0, 'sin_cifra': 0}
+        ultimo_id = 0
+        if recalcular:
+            pendientes = "(COALESCE(monto_contrato, '') <> '' OR COALESCE(plazo_dias, '') <> '')"
+            asignacion = """
+                        SET monto_contrato_num = v.monto,
+                            plazo_dias_num = v.plazo
+                        FROM (VALUES %s) AS v(id, monto, plazo)
+                        WHERE c.id = v.id
+                          AND (c.monto_contrato_num IS DISTINCT FROM v.monto
+                            OR c.plazo_dias_num IS DISTINCT FROM v.plazo)"""
+        else:
+            pendientes = """((monto_contrato_num IS NULL AND COALESCE(monto_contrato, '') <> '')
+                        OR (plazo_dias_num IS NULL AND COALESCE(plazo_dias, '') <> ''))"""
+            asignacion = """
+                        SET monto_contrato_num = COALESCE(c.monto_contrato_num, v.monto),
+                            plazo_dias_num = COALESCE(c.plazo_dias_num, v.plazo)
+                        FROM (VALUES %s) AS v(id, monto, plazo)
+                        WHERE c.id = v.id"""
         try:
             cur = conn.cursor()
             
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_contratos,
-                    COALESCE(SUM(tamaño_bytes), 0) as total_bytes,
-                    COUNT(DISTINCT contratista) as contratistas_unicos,
-                    MIN(fecha_subida) as fecha_mas_antigua,
-                    MAX(fecha_subida) as fecha_mas_reciente
-                FROM contratos_pemex
-            """)
-            
-            stats = dict(zip(['total_contratos', 'total_bytes', 'contratistas_unicos', 
-                            'fecha_mas_antigua', 'fecha_mas_reciente'], 
-                           cur.fetchone()))
-            
-            # Formatear fechas
-            for key in ['fecha_mas_antigua', 'fecha_mas_reciente']:
-                if stats[key]:
-                    stats[key] = stats[key].strftime('%Y-%m-%d')
+            while True:
+                cur.execute(f"""
+                    SELECT id, monto_contrato, plazo_dias
+                    FROM contratos_pemex
+                    WHERE id > %s
+                      AND {pendientes}
+                    ORDER BY id
+                    LIMIT %s
+                """, (ultimo_id, tamaño_lote))
+                filas = cur.fetchall()
+                if not filas:
+                    break
+                
+                valores = []
+                for contrato_id, monto, plazo in filas:
+                    monto_num = normalizar_monto(monto)
+                    plazo_num = normalizar_plazo(plazo)
+                    if monto_num is None and plazo_num is None:
+                        resumen['sin_cifra'] += 1
+                    # Al recalcular también se limpia un valor que ya no se puede leer
+                    if recalcular or monto_num is not None or plazo_num is not None:
+                        valores.append((contrato_id, monto_num, plazo_num))
+                
+                actualizados = 0
+                if valores:
+                    # Una sola sentencia por lote: rowcount cuenta todo el lote
+                    execute_values(cur, "UPDATE contratos_pemex AS c" + asignacion,
+                                   valores, template="(%s, %s::numeric, %s::integer)",
+                                   page_size=len(valores))
+                    actualizados = cur.rowcount
+                conn.commit()
+                
+                resumen['revisados'] += len(filas)
+                resumen['actualizados'] += actualizados
+                ultimo_id = filas[-1][0]
             
-            return stats
+            print(f"✅ Columnas numéricas rellenadas: {resumen}")
+            return resumen
             
         except Exception as e:
-            raise Exception(f"❌ Error obteniendo estadísticas: {str(e)}")
+            conn.rollback()
+            raise Exception(f"❌ Error rellenando columnas numéricas: {str(e)}")
+
+    def reporte_almacenamiento(self):
+        """
+        Almacenamiento de archivos: bytes referenciados por las filas
+        (bytes_logicos), bytes guardados en large objects (bytes_fisicos) y
+        lo ahorrado por la deduplicación
+        """
+        conn = self._get_connection()
+        try:
+            return _reporte_almacenamiento(conn)
         finally:
             conn.close()
 
-    # ============================================
-    # MÉTODOS NUEVOS CORREGIDOS PARA ARCHIVOS
-    # ============================================
-    
-    def verificar_tabla_archivos(self):
-        """Verificar y crear la tabla archivos_pemex si no existe"""
+    def deduplicar_archivos(self, aplicar=True):
+        """Unir large objects duplicados guardados antes de blobs_pemex"""
+        conn = self._get_connection()
+        try:
+            return _deduplicar_blobs(conn, aplicar)
+        finally:
+            conn.close()
+
+    def reprocesar_contratos(self, tamaño_lote=100, campos=None, aplicar=False):
+        """
+        Volver a extraer los campos de los contratos cuyo texto OCR está
+        guardado y que se procesaron con una versión anterior del extractor.
+        Por defecto solo reporta; aplicar=True escribe los cambios.
+        """
         conn = self._get_connection()
+        try:
+            return self._reprocesar_contratos(conn, tamaño_lote, campos, aplicar)
+        finally:
+            conn.close()
+
+    def _reprocesar_contratos(self, conn, tamaño_lote, campos=None, aplicar=False):
+        """
+        Recorre por id (keyset) los contratos con texto_ocr y version_extractor
+        anterior a VERSION_EXTRACTOR, ejecuta el extractor actual, compara con
+        lo guardado y aplica cada lote con un solo UPDATE ... FROM (VALUES ...),
+        confirmando lote por lote. numero_contrato nunca se modifica, ni los
+        campos corregidos a mano (ver _comparar_reextraccion).
+        campos: subconjunto de CAMPOS_REPROCESABLES (por defecto todos)
+        aplicar=False: solo reporta las diferencias, sin escribir
+        """
+        campos = list(campos or CAMPOS_REPROCESABLES)
+        resumen = {
+            'revisados': 0, 'actualizados': 0, 'sin_cambios': 0,
+            'cambios_por_campo': {campo: 0 for campo in campos},
+            'protegidos_por_campo': {campo: 0 for campo in campos},
+            'ejemplos': []
+        }
+        ultimo_id = 0
         try:
             cur = conn.cursor()
             
-            # Verificar si la tabla existe
-            cur.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'archivos_pemex'
-                )
-            """)
-            
-            tabla_existe = cur.fetchone()[0]
-            
-            if not tabla_existe:
-                print("📁 Creando tabla archivos_pemex...")
+            while True:
                 cur.execute("""
-                    CREATE TABLE archivos_pemex (
-                        id BIGSERIAL PRIMARY KEY,
-                        contrato_id BIGINT NOT NULL REFERENCES contratos_pemex(id) ON DELETE CASCADE,
-                        categoria VARCHAR(50) NOT NULL,
-                        tipo_archivo VARCHAR(50),
-                        lo_oid OID NOT NULL,
-                        nombre_archivo VARCHAR(300) NOT NULL,
-                        tamaño_bytes BIGINT NOT NULL,
-                        hash_sha256 VARCHAR(64) NOT NULL,
-                        fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                        usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                        CONSTRAINT check_tamaño_archivo CHECK (tamaño_bytes > 0)
-                    )
-                """)
+                    SELECT id, numero_contrato, contratista, descripcion,
+                           monto_contrato, plazo_dias, anexos, extraccion_original, texto_ocr
+                    FROM contratos_pemex
+                    WHERE id > %s
+                      AND texto_ocr IS NOT NULL
+                      AND (version_extractor IS NULL OR version_extractor < %s)
+                    ORDER BY id
+                    LIMIT %s
+                """, (ultimo_id, VERSION_EXTRACTOR, tamaño_lote))
+                filas = cur.fetchall()
+                if not filas:
+                    break
                 
-                # Crear índices
-                cur.execute("CREATE INDEX idx_archivos_contrato_id ON archivos_pemex(contrato_id)")
-                cur.execute("CREATE INDEX idx_archivos_categoria ON archivos_pemex(categoria)")
-                cur.execute("CREATE INDEX idx_archivos_fecha ON archivos_pemex(fecha_subida)")
+                columnas = [desc[0] for desc in cur.description]
+                valores = []
+                for fila in filas:
+                    guardado = dict(zip(columnas, fila))
+                    extraido = extract_contract_data(guardado['texto_ocr'])
+                    cambios, protegidos = _comparar_reextraccion(guardado, extraido, campos)
+                    for campo in protegidos:
+                        resumen['protegidos_por_campo'][campo] += 1
+                    
+                    if not cambios:
+                        resumen['sin_cambios'] += 1
+                    else:
+                        resumen['actualizados'] += 1
+                        for campo, (antes, despues) in cambios.items():
+                            resumen['cambios_por_campo'][campo] += 1
+                            if len(resumen['ejemplos']) < 50:
+                                resumen['ejemplos'].append({
+                                    'id': guardado['id'],
+                                    'numero_contrato': guardado['numero_contrato'],
+                                    'campo': campo, 'antes': antes, 'despues': despues
+                                })
+                    
+                    # NULL = conservar lo guardado; la versión y la instantánea
+                    # de la extracción se actualizan siempre
+                    nuevo = {campo: despues for campo, (antes, despues) in cambios.items()}
+                    valores.append((
+                        guardado['id'],
+                        nuevo.get('contratista'),
+                        nuevo.get('objeto'),
+                        nuevo.get('monto'),
+                        normalizar_monto(nuevo['monto']) if 'monto' in nuevo else None,
+                        nuevo.get('plazo'),
+                        normalizar_plazo(nuevo['plazo']) if 'plazo' in nuevo else None,
+                        json.dumps(nuevo['anexos'], ensure_ascii=False) if 'anexos' in nuevo else None,
+                        json.dumps(_instantanea_extraccion(extraido), ensure_ascii=False),
+                        VERSION_EXTRACTOR,
+                    ))
                 
-                conn.commit()
-                print("✅ Tabla archivos_pemex creada exitosamente")
+                if aplicar:
+                    execute_values(cur, """
+                        UPDATE contratos_pemex AS c
+                        SET contratista = COALESCE(v.contratista, c.contratista),
+                            descripcion = COALESCE(v.descripcion, c.descripcion),
+                            monto_contrato = COALESCE(v.monto, c.monto_contrato),
+                            monto_contrato_num = CASE WHEN v.monto IS NULL
+                                THEN c.monto_contrato_num ELSE v.monto_num END,
+                            plazo_dias = COALESCE(v.plazo, c.plazo_dias),
+                            plazo_dias_num = CASE WHEN v.plazo IS NULL
+                                THEN c.plazo_dias_num ELSE v.plazo_num END,
+                            anexos = COALESCE(v.anexos, c.anexos),
+                            extraccion_original = v.extraccion,
+                            version_extractor = v.version
+                        FROM (VALUES %s) AS v(id, contratista, descripcion, monto, monto_num,
+                                              plazo, plazo_num, anexos, extraccion, version)
+                        WHERE c.id = v.id
+                    """, valores, template=(
+                        "(%s, %s::text, %s::text, %s::text, %s::numeric,"
+                        " %s::text, %s::integer, %s::jsonb, %s::jsonb, %s::integer)"
+                    ), page_size=len(valores))
+                    conn.commit()
+                
+                resumen['revisados'] += len(filas)
+                ultimo_id = filas[-1][0]
             
-            return True
+            modo = "aplicado" if aplicar else "simulación"
+            print(f"✅ Reprocesamiento de contratos ({modo}, extractor v{VERSION_EXTRACTOR}): "
+                  f"{resumen['revisados']} revisados, {resumen['actualizados']} con cambios "
+                  f"{resumen['cambios_por_campo']}, protegidos por edición manual "
+                  f"{resumen['protegidos_por_campo']}")
+            return resumen
             
         except Exception as e:
             conn.rollback()
+            raise Exception(f"❌ Error reprocesando contratos: {str(e)}")
+
+    # ============================================
+    # MÉTODOS NUEVOS CORREGIDOS PARA ARCHIVOS
+    # ============================================
+    
+    def verificar_tabla_archivos(self):
+        """
+        Verificar que existan las tablas (archivos_pemex incluida). Las crea
+        la migración 1; después de la primera vez no consulta la base.
+        """
+        try:
+            return self.init_db()
+        except Exception as e:
             print(f"❌ Error verificando tabla archivos: {str(e)}")
             return False
-        finally:
-            conn.close()
 
     def guardar_archivo_completo(self, contrato_id, archivo, categoria, tipo_archivo, usuario="sistema"):
         """
         GUARDAR ARCHIVO INDIVIDUAL - VERSIÓN MEJORADA Y CORREGIDA
+        Un lote de un solo archivo: el nombre repetido en la categoría se
+        resuelve en la misma conexión con un sufijo único
         """
         conn = self._get_connection()
         try:
-            # Asegurar que la tabla existe
-            self.verificar_tabla_archivos()
-            
-            # Manejar diferentes tipos de entrada
-            if hasattr(archivo, 'read'):
-                # Es un objeto tipo archivo (de Streamlit)
-                file_bytes = archivo.read()
-                file_name = archivo.name
-            elif isinstance(archivo, bytes):
-                # Son bytes directos
-                file_bytes = archivo
-                file_name = f"archivo_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            elif isinstance(archivo, str):
-                # Es una ruta de archivo
-                with open(archivo, 'rb') as f:
-                    file_bytes = f.read()
-                file_name = archivo.split('/')[-1]
-            else:
-                raise ValueError("Tipo de archivo no soportado")
-            
-            file_hash = self.calcular_hash(file_bytes)
-            
-            # Verificar si ya existe un archivo con el mismo nombre en la misma categoría
-            if self.validar_archivo(contrato_id, categoria, file_name):
-                # Generar nombre único
-                import uuid
-                nombre_base = file_name.rsplit('.', 1)[0] if '.' in file_name else file_name
-                extension = file_name.split('.')[-1] if '.' in file_name else ''
-                file_name = f"{nombre_base}_{uuid.uuid4().hex[:8]}.{extension}"
-            
-            # Crear Large Object
-            lo_oid = conn.lobject(0, 'wb', 0, None)
-            
-            # Escribir en chunks
-            chunk_size = 1024 * 1024
-            with io.BytesIO(file_bytes) as file_stream:
-                while True:
-                    chunk = file_stream.read(chunk_size)
-                    if not chunk:
-                        break
-                    lo_oid.write(chunk)
-            
-            # Insertar archivo
-            cur = conn.cursor()
-            query = sql.SQL("""
-                INSERT INTO archivos_pemex (
-                    contrato_id, categoria, tipo_archivo,
-                    lo_oid, nombre_archivo, tamaño_bytes, hash_sha256, usuario_subio
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-            
-            cur.execute(query, (
-                contrato_id, categoria, tipo_archivo,
-                lo_oid.oid, file_name, len(file_bytes), file_hash, usuario
-            ))
-            
-            archivo_id = cur.fetchone()[0]
+            # Subida de Streamlit, flujo, bytes o ruta (se lee una sola vez al escribir)
+            archivo_id, = _guardar_archivos_lote(conn, contrato_id, [(archivo, categoria, tipo_archivo)], usuario)
             conn.commit()
             
-            print(f"✅ Archivo guardado: {file_name} | ID: {archivo_id} | Categoría: {categoria}")
+            print(f"✅ Archivo guardado: {_nombre_origen(archivo)} | ID: {archivo_id} | Categoría: {categoria}")
             return archivo_id
             
         except Exception as e:
             conn.rollback()
             print(f"❌ ERROR guardando archivo: {str(e)}")
-            import traceback
             print(f"Traceback: {traceback.format_exc()}")
             raise Exception(f"Error guardando archivo: {str(e)}")
         finally:
@@ -501,19 +1913,10 @@ class ContratosManager:
         VERSIÓN ESPECÍFICA para archivos de Streamlit
         """
         try:
-            # Verificar tabla primero
-            self.verificar_tabla_archivos()
-            
-            # Leer el archivo de Streamlit
-            archivo_bytes = archivo_streamlit.read()
-            
-            # Volver al inicio
-            archivo_streamlit.seek(0)
-            
-            # Usar el método existente pero adaptado
+            # Se pasa la subida tal cual: se recorre una sola vez al escribirla
             return self.guardar_archivo_completo(
                 contrato_id=contrato_id,
-                archivo=archivo_bytes,  # Enviar bytes, no el objeto streamlit
+                archivo=archivo_streamlit,
                 categoria=categoria,
                 tipo_archivo=getattr(archivo_streamlit, 'type', 'application/octet-stream'),
                 usuario=usuario
@@ -525,86 +1928,128 @@ class ContratosManager:
     def obtener_archivos(self, contrato_id, categoria=None):
         """
         OBTENER ARCHIVOS POR CONTRATO Y CATEGORÍA - VERSIÓN CORREGIDA
+        Lee el contenido de TODOS los archivos; para mostrar una lista use
+        listar_archivos() y leer_archivo() solo para el que se descarga
         """
         conn = self._get_connection()
         try:
-            # Verificar tabla primero
-            self.verificar_tabla_archivos()
-            
-            cur = conn.cursor()
-            
-            if categoria:
-                cur.execute("""
-                    SELECT id, contrato_id, categoria, tipo_archivo,
-                           lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
-                           fecha_subida, usuario_subio
-                    FROM archivos_pemex
-                    WHERE contrato_id = %s AND categoria = %s
-                    ORDER BY fecha_subida DESC
-                """, (contrato_id, categoria))
-            else:
-                cur.execute("""
-                    SELECT id, contrato_id, categoria, tipo_archivo,
-                           lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
-                           fecha_subida, usuario_subio
-                    FROM archivos_pemex
-                    WHERE contrato_id = %s
-                    ORDER BY categoria, fecha_subida DESC
-                """, (contrato_id,))
-            
-            resultados = cur.fetchall()
-            
-            if not resultados:
-                return []
-            
-            columnas = [desc[0] for desc in cur.description]
-            archivos = []
-            
-            for fila in resultados:
-                metadata = dict(zip(columnas, fila))
-                
-                # Obtener contenido
-                lo_oid = metadata['lo_oid']
-                try:
-                    large_obj = conn.lobject(lo_oid, 'rb', 0, None)
-                    
-                    chunks = []
-                    chunk_size = 1024 * 1024
-                    while True:
-                        chunk = large_obj.read(chunk_size)
-                        if not chunk:
-                            break
-                        chunks.append(chunk)
-                    
-                    contenido = b''.join(chunks)
-                    
-                    archivo_completo = {
-                        'id': metadata['id'],
-                        'contrato_id': metadata['contrato_id'],
-                        'categoria': metadata['categoria'],
-                        'nombre_archivo': metadata['nombre_archivo'],
-                        'tipo_archivo': metadata['tipo_archivo'],
-                        'tamaño_bytes': metadata['tamaño_bytes'],
-                        'hash_sha256': metadata['hash_sha256'],
-                        'fecha_subida': metadata['fecha_subida'],
-                        'usuario_subio': metadata['usuario_subio'],
-                        'contenido': contenido
-                    }
-                    
-                    archivos.append(archivo_completo)
-                    
-                except Exception as e:
-                    print(f"⚠️ Error obteniendo contenido del archivo {metadata['id']}: {e}")
-                    continue
-            
-            return archivos
-            
+            return _obtener_archivos(conn, contrato_id, categoria)
         except Exception as e:
             print(f"⚠️ Error obteniendo archivos: {e}")
             return []
         finally:
             conn.close()
 
+    def listar_archivos(self, contrato_id, categoria=None):
+        """
+        Metadatos de los archivos de un contrato (nombre, tamaño, categoría...)
+        SIN leer su contenido. Para descargar uno: leer_archivo(id)
+        """
+        conn = self._get_connection()
+        try:
+            return self._listar_archivos(conn, contrato_id, categoria)
+        finally:
+            conn.close()
+
+    def _listar_archivos(self, conn, contrato_id, categoria=None):
+        cur = conn.cursor()
+        if categoria:
+            cur.execute(f"""
+                SELECT {COLUMNAS_ARCHIVO}
+                FROM archivos_pemex
+                WHERE contrato_id = %s AND categoria = %s
+                ORDER BY fecha_subida DESC
+            """, (contrato_id, categoria))
+        else:
+            cur.execute(f"""
+                SELECT {COLUMNAS_ARCHIVO}
+                FROM archivos_pemex
+                WHERE contrato_id = %s
+                ORDER BY categoria, fecha_subida DESC
+            """, (contrato_id,))
+        
+        columnas = [desc[0] for desc in cur.description]
+        return [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+
+    def abrir_archivo(self, archivo_id):
+        """
+        Un solo archivo con su contenido: dict de metadatos + 'flujo'
+        (SpooledTemporaryFile posicionado al inicio: en memoria si es chico,
+        en disco si supera UMBRAL_MEMORIA_DESCARGA; cerrarlo al terminar).
+        archivo_id puede ser el id de archivos_pemex o 'principal_<id
+        contrato>' para el PDF del contrato. Retorna None si no existe.
+        """
+        conn = self._get_connection()
+        try:
+            return self._abrir_archivo(conn, archivo_id)
+        except Exception as e:
+            raise Exception(f"❌ Error leyendo archivo {archivo_id}: {str(e)}")
+        finally:
+            conn.close()
+
+    def _abrir_archivo(self, conn, archivo_id):
+        cur = conn.cursor()
+        if str(archivo_id).startswith(PREFIJO_PRINCIPAL):
+            cur.execute("""
+                SELECT id AS contrato_id, 'CONTRATO' AS categoria, tipo_archivo,
+                       nombre_archivo, tamaño_bytes, hash_sha256, fecha_subida,
+                       usuario_subio, lo_oid
+                FROM contratos_pemex
+                WHERE id = %s
+            """, (int(str(archivo_id)[len(PREFIJO_PRINCIPAL):]),))
+        else:
+            cur.execute(f"""
+                SELECT {COLUMNAS_ARCHIVO}, lo_oid
+                FROM archivos_pemex
+                WHERE id = %s
+            """, (archivo_id,))
+        
+        fila = cur.fetchone()
+        if not fila:
+            return None
+        
+        columnas = [desc[0] for desc in cur.description]
+        metadata = dict(zip(columnas, fila))
+        metadata['id'] = archivo_id
+        lo_oid = metadata.pop('lo_oid')
+        metadata['flujo'] = _volcar_large_object(conn, lo_oid)
+        return metadata
+
+    def leer_archivo(self, archivo_id):
+        """Contenido (bytes) de un solo archivo, o None si no existe"""
+        archivo = self.abrir_archivo(archivo_id)
+        if archivo is None:
+            return None
+        with archivo['flujo'] as flujo:
+            return flujo.read()
+
+    def iterar_archivo(self, archivo_id, tamaño_bloque=TAMAÑO_BLOQUE_LO):
+        """
+        Genera el contenido de un archivo por bloques sin cargarlo completo,
+        p. ej. para copiarlo a disco o a una respuesta HTTP:
+            with open(destino, 'wb') as f:
+                for bloque in manager.iterar_archivo(archivo_id):
+                    f.write(bloque)
+        La conexión queda prestada hasta que el generador termina o se cierra.
+        """
+        conn = self._get_connection()
+        try:
+            yield from self._iterar_archivo(conn, archivo_id, tamaño_bloque)
+        finally:
+            conn.close()
+
+    def _iterar_archivo(self, conn, archivo_id, tamaño_bloque):
+        cur = conn.cursor()
+        if str(archivo_id).startswith(PREFIJO_PRINCIPAL):
+            cur.execute("SELECT lo_oid FROM contratos_pemex WHERE id = %s",
+                        (int(str(archivo_id)[len(PREFIJO_PRINCIPAL):]),))
+        else:
+            cur.execute("SELECT lo_oid FROM archivos_pemex WHERE id = %s", (archivo_id,))
+        fila = cur.fetchone()
+        if not fila:
+            raise Exception(f"❌ Archivo {archivo_id} no encontrado")
+        yield from _iterar_large_object(conn, fila[0], tamaño_bloque)
+
     def obtener_archivos_por_contrato(self, contrato_id):
         """
         OBTENER TODOS LOS ARCHIVOS DE UN CONTRATO
@@ -663,27 +2108,18 @@ class ContratosManager:
             cur = conn.cursor()
             
             if categoria:
-                cur.execute("SELECT lo_oid FROM archivos_pemex WHERE id = %s AND categoria = %s", 
-                          (archivo_id, categoria))
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE id = %s AND categoria = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (archivo_id, categoria))
             else:
-                cur.execute("SELECT lo_oid FROM archivos_pemex WHERE id = %s", (archivo_id,))
-            
-            resultado = cur.fetchone()
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE id = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (archivo_id,))
             
-            if resultado:
-                lo_oid = resultado[0]
-                
-                if categoria:
-                    cur.execute("DELETE FROM archivos_pemex WHERE id = %s AND categoria = %s", 
-                              (archivo_id, categoria))
-                else:
-                    cur.execute("DELETE FROM archivos_pemex WHERE id = %s", (archivo_id,))
-                
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+            # El Large Object solo se elimina si era su última referencia
+            _liberar_blobs(conn, cur.fetchall())
             
             conn.commit()
             return True
@@ -702,17 +2138,13 @@ class ContratosManager:
         try:
             cur = conn.cursor()
             
-            cur.execute("SELECT lo_oid FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
-            oids = cur.fetchall()
-            
-            cur.execute("DELETE FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
+            cur.execute("""
+                DELETE FROM archivos_pemex WHERE contrato_id = %s
+                RETURNING lo_oid, hash_sha256
+            """, (contrato_id,))
             
-            for (lo_oid,) in oids:
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+            # Large Objects: solo se eliminan si ya nadie los usa
+            _liberar_blobs(conn, cur.fetchall())
             
             conn.commit()
             return True
@@ -731,8 +2163,6 @@ class ContratosManager:
         """Contar cuántos archivos tiene un contrato"""
         conn = self._get_connection()
         try:
-            self.verificar_tabla_archivos()
-            
             cur = conn.cursor()
             
             cur.execute("""
@@ -754,8 +2184,6 @@ class ContratosManager:
         """Obtener las categorías únicas de archivos que tiene un contrato"""
         conn = self._get_connection()
         try:
-            self.verificar_tabla_archivos()
-            
             cur = conn.cursor()
             
             cur.execute("""
@@ -775,44 +2203,13 @@ class ContratosManager:
             conn.close()
 
     def obtener_estadisticas_archivos(self):
-        """Obtener estadísticas de archivos"""
+        """
+        Obtener estadísticas de archivos: totales y desglose por categoría
+        desde estadisticas_pemex
+        """
         conn = self._get_connection()
         try:
-            self.verificar_tabla_archivos()
-            
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_archivos,
-                    COUNT(DISTINCT contrato_id) as contratos_con_archivos,
-                    SUM(tamaño_bytes) as total_bytes,
-                    categoria,
-                    COUNT(*) as cantidad_por_categoria
-                FROM archivos_pemex
-                GROUP BY categoria
-                ORDER BY cantidad_por_categoria DESC
-            """)
-            
-            resultados = cur.fetchall()
-            columnas = [desc[0] for desc in cur.description]
-            
-            stats = {
-                'total_archivos': 0,
-                'contratos_con_archivos': 0,
-                'total_bytes': 0,
-                'categorias': []
-            }
-            
-            for fila in resultados:
-                row_dict = dict(zip(columnas, fila))
-                stats['total_archivos'] += row_dict['cantidad_por_categoria']
-                stats['contratos_con_archivos'] = row_dict['contratos_con_archivos']
-                stats['total_bytes'] = row_dict['total_bytes'] or 0
-                stats['categorias'].append(row_dict)
-            
-            return stats
-            
+            return _estadisticas_archivos(conn)
         except Exception as e:
             print(f"⚠️ Error obteniendo estadísticas de archivos: {e}")
             return None
@@ -825,8 +2222,6 @@ class ContratosManager:
         """
         conn = self._get_connection()
         try:
-            self.verificar_tabla_archivos()
-            
             cur = conn.cursor()
             
             cur.execute("""
@@ -850,8 +2245,6 @@ class ContratosManager:
         """Obtener los últimos archivos subidos"""
         conn = self._get_connection()
         try:
-            self.verificar_tabla_archivos()
-            
             cur = conn.cursor()
             
             cur.execute("""
@@ -908,132 +2301,52 @@ class SistemaEsquemasUsuarios:
         self.connection_string = connection_string
     
     def _get_connection(self):
-        conn = psycopg2.connect(self.connection_string)
-        conn.autocommit = False
-        return conn
+        """Conexión prestada por el pool del proceso (conn.close() la devuelve)"""
+        return obtener_pool(self.connection_string).obtener()
     
     def crear_esquema_usuario(self, usuario):
         """
-        Crear un esquema PostgreSQL completo para un usuario nuevo
-        Retorna True si se creó o ya existe
+        Crear un esquema PostgreSQL completo para un usuario nuevo (o llevar
+        uno existente a la versión actual con las migraciones pendientes)
+        Retorna True si se creó o ya existe. Solo la primera llamada del
+        proceso por usuario consulta la base.
         """
-        usuario_normalizado = usuario.upper().replace(" ", "_").replace("-", "_")
-        esquema_nombre = f"usuario_{usuario_normalizado}"
+        esquema_nombre = self.obtener_esquema_usuario(usuario)
+        if migraciones.esquema_al_dia(self.connection_string, esquema_nombre):
+            return True
+        
+        try:
+            # public primero: ahí vive el registro de usuarios
+            migraciones.asegurar_esquema(self.connection_string)
+            aplicadas = migraciones.asegurar_esquema(
+                self.connection_string, esquema_nombre, crear_esquema=True
+            )
+        except Exception as e:
+            print(f"❌ Error creando esquema {esquema_nombre}: {str(e)}")
+            raise Exception(f"Error creando esquema para usuario {usuario}: {str(e)}")
+        
+        if aplicadas:
+            print(f"✅ ESQUEMA {esquema_nombre} ACTUALIZADO (migraciones {aplicadas})")
+        else:
+            print(f"✅ Esquema {esquema_nombre} ya existe")
         
+        # Registrar usuario en tabla maestra (no es crítico)
         conn = self._get_connection()
         try:
             cur = conn.cursor()
-            
-            # 1. Verificar si el esquema ya existe
             cur.execute("""
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.schemata 
-                    WHERE schema_name = %s
-                )
-            """, (esquema_nombre,))
-            
-            esquema_existe = cur.fetchone()[0]
-            
-            if esquema_existe:
-                print(f"✅ Esquema {esquema_nombre} ya existe")
-                conn.close()
-                return True
-            
-            print(f"🎯 Creando nuevo esquema para usuario: {usuario} -> {esquema_nombre}")
-            
-            # 2. Crear el esquema
-            cur.execute(sql.SQL("CREATE SCHEMA {}").format(
-                sql.Identifier(esquema_nombre)
-            ))
-            
-            # 3. Establecer el esquema actual
-            cur.execute(sql.SQL("SET search_path TO {}").format(
-                sql.Identifier(esquema_nombre)
-            ))
-            
-            # 4. Crear tabla de contratos en el nuevo esquema
-            cur.execute("""
-                CREATE TABLE contratos_pemex (
-                    id BIGSERIAL PRIMARY KEY,
-                    area VARCHAR(500) NOT NULL DEFAULT 'SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN',
-                    numero_contrato VARCHAR(100) UNIQUE NOT NULL,
-                    contratista VARCHAR(300) NOT NULL,
-                    monto_contrato VARCHAR(100),
-                    plazo_dias VARCHAR(50),
-                    descripcion TEXT,
-                    anexos JSONB,
-                    
-                    lo_oid OID NOT NULL,
-                    nombre_archivo VARCHAR(300) NOT NULL,
-                    tipo_archivo VARCHAR(50),
-                    tamaño_bytes BIGINT NOT NULL,
-                    hash_sha256 VARCHAR(64) NOT NULL,
-                    
-                    fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                    usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                    procesado BOOLEAN DEFAULT TRUE,
-                    
-                    CONSTRAINT check_tamaño_positivo CHECK (tamaño_bytes > 0)
-                )
-            """)
-            
-            # 5. Crear tabla de archivos en el nuevo esquema
-            cur.execute("""
-                CREATE TABLE archivos_pemex (
-                    id BIGSERIAL PRIMARY KEY,
-                    contrato_id BIGINT NOT NULL,
-                    categoria VARCHAR(50) NOT NULL,
-                    tipo_archivo VARCHAR(50),
-                    lo_oid OID NOT NULL,
-                    nombre_archivo VARCHAR(300) NOT NULL,
-                    tamaño_bytes BIGINT NOT NULL,
-                    hash_sha256 VARCHAR(64) NOT NULL,
-                    fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                    usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                    CONSTRAINT check_tamaño_archivo CHECK (tamaño_bytes > 0)
-                )
-            """)
-            
-            # 6. Crear índices
-            cur.execute("CREATE INDEX idx_contratos_numero ON contratos_pemex(numero_contrato)")
-            cur.execute("CREATE INDEX idx_contratos_contratista ON contratos_pemex(contratista)")
-            cur.execute("CREATE INDEX idx_contratos_fecha ON contratos_pemex(fecha_subida)")
-            cur.execute("CREATE INDEX idx_archivos_contrato_id ON archivos_pemex(contrato_id)")
-            cur.execute("CREATE INDEX idx_archivos_categoria ON archivos_pemex(categoria)")
-            
-            # 7. Registrar usuario en tabla maestra (si existe)
-            try:
-                cur.execute("SET search_path TO public")
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS usuarios_registrados (
-                        id SERIAL PRIMARY KEY,
-                        usuario VARCHAR(100) UNIQUE NOT NULL,
-                        esquema VARCHAR(150) NOT NULL,
-                        fecha_registro TIMESTAMPTZ DEFAULT NOW(),
-                        ultimo_login TIMESTAMPTZ,
-                        estado VARCHAR(20) DEFAULT 'activo'
-                    )
-                """)
-                
-                cur.execute("""
-                    INSERT INTO usuarios_registrados (usuario, esquema, ultimo_login)
-                    VALUES (%s, %s, NOW())
-                    ON CONFLICT (usuario) DO UPDATE SET ultimo_login = NOW()
-                """, (usuario, esquema_nombre))
-            except Exception as e:
-                print(f"⚠️ Error registrando usuario en tabla maestra: {e}")
-                # No es crítico, continuar
-            
+                INSERT INTO public.usuarios_registrados (usuario, esquema, ultimo_login)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (usuario) DO UPDATE SET ultimo_login = NOW()
+            """, (usuario, esquema_nombre))
             conn.commit()
-            print(f"✅ ESQUEMA CREADO EXITOSAMENTE: {esquema_nombre}")
-            return True
-            
         except Exception as e:
             conn.rollback()
-            print(f"❌ Error creando esquema {esquema_nombre}: {str(e)}")
-            raise Exception(f"Error creando esquema para usuario {usuario}: {str(e)}")
+            print(f"⚠️ Error registrando usuario en tabla maestra: {e}")
         finally:
             conn.close()
+        
+        return True
     
     def verificar_esquema_usuario(self, usuario):
         """
@@ -1080,43 +2393,46 @@ class SistemaEsquemasUsuarios:
         
         conn = self._get_connection()
         try:
-            cur = conn.cursor()
-            
-            # Establecer el esquema del usuario
-            cur.execute(sql.SQL("SET search_path TO {}").format(
-                sql.Identifier(esquema)
-            ))
+            # Nombres calificados con el esquema: no hace falta cambiar el search_path
+            totales = _estadisticas_totales(conn, esquema)
+            stats = {
+                'total_contratos': totales['contratos'],
+                'total_archivos': totales['archivos'],
+                'bytes_contratos': totales['bytes_contratos'],
+                'bytes_archivos': totales['bytes_archivos'],
+                'primer_contrato': totales['primer_contrato'],
+                'ultimo_contrato': totales['ultimo_contrato'],
+            }
             
-            cur.execute("""
-                SELECT 
-                    (SELECT COUNT(*) FROM contratos_pemex) as total_contratos,
-                    (SELECT COUNT(*) FROM archivos_pemex) as total_archivos,
-                    (SELECT COALESCE(SUM(tamaño_bytes), 0) FROM contratos_pemex) as bytes_contratos,
-                    (SELECT COALESCE(SUM(tamaño_bytes), 0) FROM archivos_pemex) as bytes_archivos,
-                    (SELECT MIN(fecha_subida) FROM contratos_pemex) as primer_contrato,
-                    (SELECT MAX(fecha_subida) FROM contratos_pemex) as ultimo_contrato
-            """)
+            # Formatear fechas
+            for key in ['primer_contrato', 'ultimo_contrato']:
+                if stats[key]:
+                    stats[key] = stats[key].strftime('%Y-%m-%d %H:%M')
             
-            resultado = cur.fetchone()
-            columnas = [desc[0] for desc in cur.description]
+            return stats
             
-            if resultado:
-                stats = dict(zip(columnas, resultado))
-                
-                # Formatear fechas
-                for key in ['primer_contrato', 'ultimo_contrato']:
-                    if stats[key]:
-                        stats[key] = stats[key].strftime('%Y-%m-%d %H:%M')
-                
-                return stats
-            else:
-                return None
-                
         except Exception as e:
             print(f"⚠️ Error obteniendo estadísticas del esquema {esquema}: {e}")
             return None
         finally:
             conn.close()
+    
+    def obtener_estadisticas_organizacion(self, exacto=True):
+        """
+        Contratos, archivos y bytes de todos los usuarios registrados y el
+        total de la organización, sin abrir una conexión por usuario.
+        exacto=True lee las estadísticas precalculadas de cada esquema;
+        exacto=False solo usa el catálogo (reltuples), más rápido pero
+        aproximado y sin bytes de archivos
+        """
+        conn = self._get_connection()
+        try:
+            return _estadisticas_organizacion(conn, exacto)
+        except Exception as e:
+            print(f"⚠️ Error obteniendo estadísticas de la organización: {e}")
+            return None
+        finally:
+            conn.close()
 
 # ============================================
 # MANAGER DE USUARIOS CORREGIDO - VERSIÓN COMPLETA
@@ -1131,165 +2447,158 @@ class ContratosManagerUsuarios(ContratosManager):
         super().__init__(connection_string)
         self.usuario = usuario.upper() if usuario else "SISTEMA"
         self.esquema_manager = SistemaEsquemasUsuarios(connection_string)
+        # Esquema fijo del manager (None = search_path por defecto del servidor)
+        self.esquema = (
+            self.esquema_manager.obtener_esquema_usuario(self.usuario)
+            if self.usuario != "SISTEMA" else None
+        )
         
-        # Crear esquema para el usuario si no existe
-        if self.usuario and self.usuario != "SISTEMA":
-            self._inicializar_usuario()
+        # Crear esquema para el usuario si no existe (SISTEMA usa public)
+        self._inicializar_usuario()
+    
+    def _inicializar_usuario(self):
+        """
+        Inicializar el esquema PostgreSQL para el usuario. Las migraciones
+        se aplican una vez por proceso; después esto no toca la base.
+        """
+        if migraciones.esquema_al_dia(self.connection_string, self.esquema):
+            return
+        try:
+            if self.usuario and self.usuario != "SISTEMA":
+                self.esquema_manager.verificar_esquema_usuario(self.usuario)
+                print(f"✅ Usuario {self.usuario} inicializado con su propio esquema")
+            else:
+                migraciones.asegurar_esquema(self.connection_string)
+        except Exception as e:
+            print(f"⚠️ Error inicializando usuario {self.usuario}: {e}")
+    
+    def _crear_tablas_en_esquema_usuario(self):
+        """Crear tablas en el esquema del usuario (migraciones, una vez por proceso)"""
+        try:
+            migraciones.asegurar_esquema(self.connection_string, self.esquema, crear_esquema=True)
+        except Exception as e:
+            print(f"⚠️ Error creando tablas en esquema usuario: {e}")
+    
+    def _get_connection_with_schema(self):
+        """
+        Obtener conexión CON el esquema del usuario establecido. El pool
+        recuerda el search_path de cada conexión y solo emite SET cuando
+        la conexión venía de otro usuario (sin COMMIT adicional)
+        """
+        return obtener_pool(self.connection_string).obtener(self.esquema)
+    
+    def verificar_conexion(self):
+        """Prueba barata de que el esquema del usuario responde"""
+        conn = self._get_connection_with_schema()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM contratos_pemex LIMIT 1")
+            cur.fetchall()
+            return True
+        finally:
+            conn.close()
+    
+    # ========== MÉTODOS SOBRESCRITOS PARA ESQUEMAS POR USUARIO ==========
+    
+    def buscar_contratos_pemex(self, filtros=None, limite=None):
+        """
+        Búsqueda en PostgreSQL - EN ESQUEMA DEL USUARIO
+        Sin limite trae todos: para listas en pantalla use listar_contratos_pagina
+        """
+        conn = self._get_connection_with_schema()
+        try:
+            return _buscar_contratos(conn, filtros, limite)
+        except Exception as e:
+            raise Exception(f"❌ Error buscando contratos en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
+    
+    def listar_contratos_pagina(self, filtros=None, tamaño_pagina=TAMAÑO_PAGINA_CONTRATOS, cursor=None):
+        """
+        Una página de contratos (más recientes primero) - EN ESQUEMA DEL USUARIO
+        Para la siguiente página pase cursor=resultado['siguiente']
+        """
+        conn = self._get_connection_with_schema()
+        try:
+            return _pagina_contratos(conn, filtros, tamaño_pagina, cursor)
+        except Exception as e:
+            raise Exception(f"❌ Error listando contratos en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
+    
+    def contar_contratos(self, filtros=None, exacto=False):
+        """Total (estimado si es grande) de contratos que cumplen los filtros - EN ESQUEMA DEL USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _contar_contratos(conn, filtros, exacto)
+        except Exception as e:
+            raise Exception(f"❌ Error contando contratos en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
+    
+    def contar_anexos(self, limite=None):
+        """Cuántos contratos incluyen cada anexo - EN ESQUEMA DEL USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _contar_anexos(conn, limite)
+        except Exception as e:
+            raise Exception(f"❌ Error contando anexos en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
+    
+    def iterar_contratos(self, filtros=None, itersize=ITERSIZE_SERVIDOR):
+        """Contratos como tuplas desde un cursor del servidor - EN ESQUEMA DEL USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            yield from _iterar_contratos(conn, filtros, itersize)
+        finally:
+            conn.close()
     
-    def _inicializar_usuario(self):
-        """Inicializar el esquema PostgreSQL para el usuario"""
+    def exportar_contratos(self, destino, filtros=None, itersize=ITERSIZE_SERVIDOR):
+        """Exportar contratos a CSV con memoria constante - EN ESQUEMA DEL USUARIO"""
+        conn = self._get_connection_with_schema()
         try:
-            if self.usuario and self.usuario != "SISTEMA":
-                self.esquema_manager.verificar_esquema_usuario(self.usuario)
-                print(f"✅ Usuario {self.usuario} inicializado con su propio esquema")
-                
-                # Crear tablas en el esquema del usuario
-                self._crear_tablas_en_esquema_usuario()
+            total = _exportar_contratos_csv(conn, destino, filtros, itersize)
+            print(f"✅ {total} contratos del esquema {self.usuario} exportados")
+            return total
         except Exception as e:
-            print(f"⚠️ Error inicializando usuario {self.usuario}: {e}")
+            raise Exception(f"❌ Error exportando contratos en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
     
-    def _crear_tablas_en_esquema_usuario(self):
-        """Crear tablas en el esquema del usuario"""
-        if not self.usuario or self.usuario == "SISTEMA":
-            return
-        
-        conn = self._get_connection()
+    def buscar_texto(self, consulta, limit=50, offset=0):
+        """Búsqueda de texto completo con ranking - EN ESQUEMA DEL USUARIO"""
+        consulta = (consulta or '').strip()
+        if not consulta:
+            return []
+        conn = self._get_connection_with_schema()
         try:
-            cur = conn.cursor()
-            
-            # Establecer esquema del usuario
-            esquema = self.esquema_manager.obtener_esquema_usuario(self.usuario)
-            cur.execute(sql.SQL("SET search_path TO {}").format(
-                sql.Identifier(esquema)
-            ))
-            
-            # 1. Crear tabla contratos_pemex si no existe
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS contratos_pemex (
-                    id BIGSERIAL PRIMARY KEY,
-                    area VARCHAR(500) NOT NULL DEFAULT 'SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN',
-                    numero_contrato VARCHAR(100) UNIQUE NOT NULL,
-                    contratista VARCHAR(300) NOT NULL,
-                    monto_contrato VARCHAR(100),
-                    plazo_dias VARCHAR(50),
-                    descripcion TEXT,
-                    anexos JSONB,
-                    
-                    lo_oid OID NOT NULL,
-                    nombre_archivo VARCHAR(300) NOT NULL,
-                    tipo_archivo VARCHAR(50),
-                    tamaño_bytes BIGINT NOT NULL,
-                    hash_sha256 VARCHAR(64) NOT NULL,
-                    
-                    fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                    usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                    procesado BOOLEAN DEFAULT TRUE,
-                    
-                    CONSTRAINT check_tamaño_positivo CHECK (tamaño_bytes > 0)
-                )
-            """)
-            
-            # 2. Crear tabla archivos_pemex si no existe
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS archivos_pemex (
-                    id BIGSERIAL PRIMARY KEY,
-                    contrato_id BIGINT NOT NULL,
-                    categoria VARCHAR(50) NOT NULL,
-                    tipo_archivo VARCHAR(50),
-                    lo_oid OID NOT NULL,
-                    nombre_archivo VARCHAR(300) NOT NULL,
-                    tamaño_bytes BIGINT NOT NULL,
-                    hash_sha256 VARCHAR(64) NOT NULL,
-                    fecha_subida TIMESTAMPTZ DEFAULT NOW(),
-                    usuario_subio VARCHAR(100) DEFAULT 'sistema',
-                    CONSTRAINT check_tamaño_archivo CHECK (tamaño_bytes > 0)
-                )
-            """)
-            
-            # 3. Crear índices
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_numero ON contratos_pemex(numero_contrato)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_contratista ON contratos_pemex(contratista)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_fecha ON contratos_pemex(fecha_subida)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_contrato_id ON archivos_pemex(contrato_id)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_categoria ON archivos_pemex(categoria)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_fecha ON archivos_pemex(fecha_subida)")
-            
-            conn.commit()
-            print(f"✅ Tablas creadas en esquema {esquema}")
-            
+            return _buscar_texto(conn, consulta, limit, offset)
         except Exception as e:
-            conn.rollback()
-            print(f"⚠️ Error creando tablas en esquema usuario: {e}")
+            raise Exception(f"❌ Error en búsqueda de texto en esquema usuario: {str(e)}")
         finally:
             conn.close()
     
-    def _get_connection_with_schema(self):
-        """Obtener conexión CON el esquema del usuario establecido"""
-        conn = self._get_connection()
-        
-        if self.usuario and self.usuario != "SISTEMA":
-            try:
-                esquema = self.esquema_manager.obtener_esquema_usuario(self.usuario)
-                cur = conn.cursor()
-                cur.execute(sql.SQL("SET search_path TO {}").format(
-                    sql.Identifier(esquema)
-                ))
-                cur.close()
-                conn.commit()  # Confirmar el cambio de esquema
-                print(f"🔧 Conexión establecida al esquema: {esquema}")
-            except Exception as e:
-                print(f"⚠️ Error estableciendo esquema: {e}")
-        
-        return conn
-    
-    # ========== MÉTODOS SOBRESCRITOS PARA ESQUEMAS POR USUARIO ==========
+    def buscar_similares(self, texto, limit=20, umbral=None):
+        """Búsqueda por similitud (trigramas) - EN ESQUEMA DEL USUARIO"""
+        texto = (texto or '').strip()
+        if not texto:
+            return []
+        conn = self._get_connection_with_schema()
+        try:
+            return _buscar_similares(conn, texto, limit, umbral)
+        except Exception as e:
+            raise Exception(f"❌ Error en búsqueda por similitud en esquema usuario: {str(e)}")
+        finally:
+            conn.close()
     
-    def buscar_contratos_pemex(self, filtros=None):
-        """Búsqueda en PostgreSQL - EN ESQUEMA DEL USUARIO"""
+    def diagnosticar_busqueda_similar(self, texto="CONSTRUCTORA", forzar_indice=True):
+        """EXPLAIN de buscar_similares - EN ESQUEMA DEL USUARIO"""
         conn = self._get_connection_with_schema()
         try:
-            cur = conn.cursor()
-            
-            where_conditions = []
-            params = []
-            
-            if filtros:
-                if 'numero_contrato' in filtros and filtros['numero_contrato']:
-                    where_conditions.append("numero_contrato ILIKE %s")
-                    params.append(f"%{filtros['numero_contrato']}%")
-                if 'contratista' in filtros and filtros['contratista']:
-                    where_conditions.append("contratista ILIKE %s")
-                    params.append(f"%{filtros['contratista']}%")
-            
-            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-            
-            query = f"""
-                SELECT id, area, numero_contrato, contratista, monto_contrato, 
-                       plazo_dias, descripcion, anexos, nombre_archivo, tipo_archivo,
-                       fecha_subida, tamaño_bytes, usuario_subio
-                FROM contratos_pemex
-                WHERE {where_clause}
-                ORDER BY fecha_subida DESC
-            """
-            
-            cur.execute(query, params)
-            resultados = cur.fetchall()
-            
-            columnas = [desc[0] for desc in cur.description]
-            contratos = [dict(zip(columnas, fila)) for fila in resultados]
-            
-            # Convertir JSON de anexos
-            for contrato in contratos:
-                if contrato.get('anexos'):
-                    try:
-                        contrato['anexos'] = json.loads(contrato['anexos'])
-                    except:
-                        contrato['anexos'] = []
-            
-            return contratos
-            
+            return _explicar_busqueda_similar(conn, texto, forzar_indice)
         except Exception as e:
-            raise Exception(f"❌ Error buscando contratos en esquema usuario: {str(e)}")
+            raise Exception(f"❌ Error diagnosticando búsqueda en esquema usuario: {str(e)}")
         finally:
             conn.close()
     
@@ -1301,52 +2610,12 @@ class ContratosManagerUsuarios(ContratosManager):
         try:
             self._debug_datos(datos_extraidos, "DEBUG DATOS CRUDOS")
             
-            file_bytes = archivo.getvalue()
-            file_hash = self.calcular_hash(file_bytes)
-            
-            lo_oid = conn.lobject(0, 'wb', 0, None)
-            
-            chunk_size = 1024 * 1024
-            with io.BytesIO(file_bytes) as file_stream:
-                while True:
-                    chunk = file_stream.read(chunk_size)
-                    if not chunk:
-                        break
-                    lo_oid.write(chunk)
-            
-            contrato = self._safe_string(datos_extraidos.get('contrato', ''))
-            contratista = self._safe_string(datos_extraidos.get('contratista', ''))
-            monto = self._safe_string(datos_extraidos.get('monto', ''))
-            
-            plazo_original = datos_extraidos.get('plazo', '')
-            plazo = self._safe_string(plazo_original)
-            
-            if not isinstance(plazo, str):
-                plazo = str(plazo) if plazo is not None else ""
-            
-            objeto = self._safe_string(datos_extraidos.get('objeto', ''))
-            anexos = json.dumps(datos_extraidos.get('anexos', []), ensure_ascii=False)
-            
-            query = sql.SQL("""
-                INSERT INTO contratos_pemex (
-                    numero_contrato, contratista, monto_contrato, 
-                    plazo_dias, descripcion, anexos,
-                    lo_oid, nombre_archivo, tipo_archivo, tamaño_bytes, hash_sha256, usuario_subio
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-            
-            cur = conn.cursor()
-            cur.execute(query, (
-                contrato, contratista, monto, plazo, objeto, anexos,
-                lo_oid.oid, archivo.name, getattr(archivo, 'type', 'application/pdf'),
-                len(file_bytes), file_hash, usuario
-            ))
-            
-            contrato_id = cur.fetchone()[0]
+            contrato_id, file_hash, reutilizado = self._insertar_contrato(conn, archivo, datos_extraidos, usuario)
             conn.commit()
             
             print(f"✅ CONTRATO GUARDADO EN ESQUEMA {self.usuario} - ID: {contrato_id}")
+            if reutilizado:
+                print(f"♻️ Contenido ya guardado (hash {file_hash[:12]}...): se reutilizó su large object")
             return contrato_id
             
         except psycopg2.IntegrityError:
@@ -1362,62 +2631,21 @@ class ContratosManagerUsuarios(ContratosManager):
     def guardar_archivo_completo(self, contrato_id, archivo, categoria, tipo_archivo, usuario="sistema"):
         """
         GUARDAR ARCHIVO EN ESQUEMA DEL USUARIO - VERSIÓN CORREGIDA
+        Un lote de un solo archivo: el nombre repetido en la categoría se
+        resuelve en la misma conexión con un sufijo único
         """
         conn = self._get_connection_with_schema()
         try:
-            # Manejar diferentes tipos de entrada
-            if hasattr(archivo, 'read'):
-                file_bytes = archivo.read()
-                file_name = archivo.name
-            elif isinstance(archivo, bytes):
-                file_bytes = archivo
-                file_name = f"archivo_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            elif isinstance(archivo, str):
-                with open(archivo, 'rb') as f:
-                    file_bytes = f.read()
-                file_name = archivo.split('/')[-1]
-            else:
-                raise ValueError("Tipo de archivo no soportado")
-            
-            file_hash = self.calcular_hash(file_bytes)
-            
-            # Crear Large Object
-            lo_oid = conn.lobject(0, 'wb', 0, None)
-            
-            # Escribir en chunks
-            chunk_size = 1024 * 1024
-            with io.BytesIO(file_bytes) as file_stream:
-                while True:
-                    chunk = file_stream.read(chunk_size)
-                    if not chunk:
-                        break
-                    lo_oid.write(chunk)
-            
-            # Insertar archivo
-            cur = conn.cursor()
-            query = sql.SQL("""
-                INSERT INTO archivos_pemex (
-                    contrato_id, categoria, tipo_archivo,
-                    lo_oid, nombre_archivo, tamaño_bytes, hash_sha256, usuario_subio
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-            
-            cur.execute(query, (
-                contrato_id, categoria, tipo_archivo,
-                lo_oid.oid, file_name, len(file_bytes), file_hash, usuario
-            ))
-            
-            archivo_id = cur.fetchone()[0]
+            # Subida de Streamlit, flujo, bytes o ruta (se lee una sola vez al escribir)
+            archivo_id, = _guardar_archivos_lote(conn, contrato_id, [(archivo, categoria, tipo_archivo)], usuario)
             conn.commit()
             
-            print(f"✅ Archivo guardado en esquema {self.usuario}: {file_name} (ID: {archivo_id})")
+            print(f"✅ Archivo guardado en esquema {self.usuario}: {_nombre_origen(archivo)} (ID: {archivo_id})")
             return archivo_id
             
         except Exception as e:
             conn.rollback()
             print(f"❌ ERROR guardando archivo en esquema usuario: {str(e)}")
-            import traceback
             print(f"Traceback: {traceback.format_exc()}")
             raise Exception(f"Error guardando archivo: {str(e)}")
         finally:
@@ -1428,14 +2656,10 @@ class ContratosManagerUsuarios(ContratosManager):
         VERSIÓN ESPECÍFICA para archivos de Streamlit - EN ESQUEMA USUARIO
         """
         try:
-            # Leer el archivo de Streamlit
-            archivo_bytes = archivo_streamlit.read()
-            archivo_streamlit.seek(0)
-            
-            # Usar el método existente
+            # Se pasa la subida tal cual: se recorre una sola vez al escribirla
             return self.guardar_archivo_completo(
                 contrato_id=contrato_id,
-                archivo=archivo_bytes,
+                archivo=archivo_streamlit,
                 categoria=categoria,
                 tipo_archivo=getattr(archivo_streamlit, 'type', 'application/octet-stream'),
                 usuario=usuario
@@ -1444,86 +2668,88 @@ class ContratosManagerUsuarios(ContratosManager):
         except Exception as e:
             raise Exception(f"Error guardando archivo Streamlit: {str(e)}")
     
+    def guardar_contrato_completo(self, archivos_data, datos_contrato, usuario="sistema"):
+        """
+        Guardar contrato completo con sus archivos - EN ESQUEMA USUARIO
+        """
+        conn = self._get_connection_with_schema()
+        try:
+            contrato_id, ids_archivos = self._guardar_contrato_completo(conn, archivos_data, datos_contrato, usuario)
+            st.success(f"🗄️ **Contrato guardado en PostgreSQL** (ID: {contrato_id}, {len(ids_archivos)} archivos adjuntos)")
+            return contrato_id
+        except Exception as e:
+            st.error(f"❌ Error guardando en PostgreSQL: {str(e)}")
+            raise Exception(f"Error guardando contrato: {str(e)}")
+        finally:
+            conn.close()
+    
+    def obtener_estadisticas_archivos(self):
+        """Obtener estadísticas de archivos - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _estadisticas_archivos(conn)
+        except Exception as e:
+            print(f"⚠️ Error obteniendo estadísticas de archivos en esquema usuario: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def guardar_archivos_lote(self, contrato_id, archivos, categoria=None, usuario="sistema"):
+        """
+        Guardar varios archivos en una transacción - EN ESQUEMA USUARIO
+        """
+        conn = self._get_connection_with_schema()
+        try:
+            ids = _guardar_archivos_lote(conn, contrato_id, _normalizar_lote(archivos, categoria), usuario)
+            conn.commit()
+            print(f"✅ Lote guardado en esquema {self.usuario}: {len(ids)} archivos para contrato {contrato_id}")
+            return ids
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ ERROR guardando lote de archivos en esquema usuario: {str(e)}")
+            raise Exception(f"❌ Error guardando lote de archivos: {str(e)}")
+        finally:
+            conn.close()
+    
     def obtener_archivos(self, contrato_id, categoria=None):
         """
         OBTENER ARCHIVOS DEL ESQUEMA DEL USUARIO - VERSIÓN CORREGIDA
         """
         conn = self._get_connection_with_schema()
         try:
-            cur = conn.cursor()
-            
-            if categoria:
-                cur.execute("""
-                    SELECT id, contrato_id, categoria, tipo_archivo,
-                           lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
-                           fecha_subida, usuario_subio
-                    FROM archivos_pemex
-                    WHERE contrato_id = %s AND categoria = %s
-                    ORDER BY fecha_subida DESC
-                """, (contrato_id, categoria))
-            else:
-                cur.execute("""
-                    SELECT id, contrato_id, categoria, tipo_archivo,
-                           lo_oid, nombre_archivo, tamaño_bytes, hash_sha256,
-                           fecha_subida, usuario_subio
-                    FROM archivos_pemex
-                    WHERE contrato_id = %s
-                    ORDER BY categoria, fecha_subida DESC
-                """, (contrato_id,))
-            
-            resultados = cur.fetchall()
-            
-            if not resultados:
-                return []
-            
-            columnas = [desc[0] for desc in cur.description]
-            archivos = []
-            
-            for fila in resultados:
-                metadata = dict(zip(columnas, fila))
-                
-                # Obtener contenido
-                lo_oid = metadata['lo_oid']
-                try:
-                    large_obj = conn.lobject(lo_oid, 'rb', 0, None)
-                    
-                    chunks = []
-                    chunk_size = 1024 * 1024
-                    while True:
-                        chunk = large_obj.read(chunk_size)
-                        if not chunk:
-                            break
-                        chunks.append(chunk)
-                    
-                    contenido = b''.join(chunks)
-                    
-                    archivo_completo = {
-                        'id': metadata['id'],
-                        'contrato_id': metadata['contrato_id'],
-                        'categoria': metadata['categoria'],
-                        'nombre_archivo': metadata['nombre_archivo'],
-                        'tipo_archivo': metadata['tipo_archivo'],
-                        'tamaño_bytes': metadata['tamaño_bytes'],
-                        'hash_sha256': metadata['hash_sha256'],
-                        'fecha_subida': metadata['fecha_subida'],
-                        'usuario_subio': metadata['usuario_subio'],
-                        'contenido': contenido
-                    }
-                    
-                    archivos.append(archivo_completo)
-                    
-                except Exception as e:
-                    print(f"⚠️ Error obteniendo contenido del archivo {metadata['id']}: {e}")
-                    continue
-            
-            return archivos
-            
+            return _obtener_archivos(conn, contrato_id, categoria)
         except Exception as e:
             print(f"⚠️ Error obteniendo archivos del esquema usuario: {e}")
             return []
         finally:
             conn.close()
     
+    def listar_archivos(self, contrato_id, categoria=None):
+        """Metadatos de los archivos (sin contenido) - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return self._listar_archivos(conn, contrato_id, categoria)
+        finally:
+            conn.close()
+
+    def iterar_archivo(self, archivo_id, tamaño_bloque=TAMAÑO_BLOQUE_LO):
+        """Contenido de un archivo por bloques - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            yield from self._iterar_archivo(conn, archivo_id, tamaño_bloque)
+        finally:
+            conn.close()
+
+    def abrir_archivo(self, archivo_id):
+        """Un solo archivo con su contenido - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return self._abrir_archivo(conn, archivo_id)
+        except Exception as e:
+            raise Exception(f"❌ Error leyendo archivo {archivo_id}: {str(e)}")
+        finally:
+            conn.close()
+
     def obtener_archivos_por_contrato(self, contrato_id):
         """
         Obtener todos los archivos de un contrato (ESQUEMA USUARIO)
@@ -1555,17 +2781,7 @@ class ContratosManagerUsuarios(ContratosManager):
             metadata = dict(zip(columnas, resultado))
             
             lo_oid = metadata['lo_oid']
-            large_obj = conn.lobject(lo_oid, 'rb', 0, None)
-            
-            chunks = []
-            chunk_size = 1024 * 1024
-            while True:
-                chunk = large_obj.read(chunk_size)
-                if not chunk:
-                    break
-                chunks.append(chunk)
-            
-            contenido = b''.join(chunks)
+            contenido = _leer_large_object(conn, lo_oid)
             
             return {
                 'metadata': metadata,
@@ -1584,27 +2800,18 @@ class ContratosManagerUsuarios(ContratosManager):
             cur = conn.cursor()
             
             if categoria:
-                cur.execute("SELECT lo_oid FROM archivos_pemex WHERE id = %s AND categoria = %s", 
-                          (archivo_id, categoria))
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE id = %s AND categoria = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (archivo_id, categoria))
             else:
-                cur.execute("SELECT lo_oid FROM archivos_pemex WHERE id = %s", (archivo_id,))
-            
-            resultado = cur.fetchone()
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE id = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (archivo_id,))
             
-            if resultado:
-                lo_oid = resultado[0]
-                
-                if categoria:
-                    cur.execute("DELETE FROM archivos_pemex WHERE id = %s AND categoria = %s", 
-                              (archivo_id, categoria))
-                else:
-                    cur.execute("DELETE FROM archivos_pemex WHERE id = %s", (archivo_id,))
-                
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+            # El Large Object solo se elimina si era su última referencia
+            _liberar_blobs(conn, cur.fetchall())
             
             conn.commit()
             return True
@@ -1621,37 +2828,23 @@ class ContratosManagerUsuarios(ContratosManager):
         try:
             cur = conn.cursor()
             
-            # Obtener OID antes de eliminar
-            cur.execute("SELECT lo_oid FROM contratos_pemex WHERE id = %s", (contrato_id,))
+            # Obtener OID y hash antes de eliminar
+            cur.execute("SELECT lo_oid, hash_sha256 FROM contratos_pemex WHERE id = %s", (contrato_id,))
             resultado = cur.fetchone()
             
             if resultado:
-                lo_oid = resultado[0]
-                
                 # Eliminar archivos asociados primero
-                cur.execute("SELECT lo_oid FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
-                archivos_oids = cur.fetchall()
-                
-                # Eliminar archivos
-                cur.execute("DELETE FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
-                
-                # Eliminar Large Objects de archivos
-                for (archivo_oid,) in archivos_oids:
-                    try:
-                        large_obj = conn.lobject(archivo_oid)
-                        large_obj.unlink()
-                    except:
-                        pass
+                cur.execute("""
+                    DELETE FROM archivos_pemex WHERE contrato_id = %s
+                    RETURNING lo_oid, hash_sha256
+                """, (contrato_id,))
+                referencias = cur.fetchall()
                 
                 # Eliminar contrato
                 cur.execute("DELETE FROM contratos_pemex WHERE id = %s", (contrato_id,))
                 
-                # Eliminar Large Object del contrato
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+                # Large Objects: solo se eliminan si ya nadie los usa
+                _liberar_blobs(conn, [resultado] + referencias)
             
             conn.commit()
             return True
@@ -1670,17 +2863,13 @@ class ContratosManagerUsuarios(ContratosManager):
         try:
             cur = conn.cursor()
             
-            cur.execute("SELECT lo_oid FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
-            oids = cur.fetchall()
-            
-            cur.execute("DELETE FROM archivos_pemex WHERE contrato_id = %s", (contrato_id,))
+            cur.execute("""
+                DELETE FROM archivos_pemex WHERE contrato_id = %s
+                RETURNING lo_oid, hash_sha256
+            """, (contrato_id,))
             
-            for (lo_oid,) in oids:
-                try:
-                    large_obj = conn.lobject(lo_oid)
-                    large_obj.unlink()
-                except:
-                    pass
+            # Large Objects: solo se eliminan si ya nadie los usa
+            _liberar_blobs(conn, cur.fetchall())
             
             conn.commit()
             return True
@@ -1692,37 +2881,69 @@ class ContratosManagerUsuarios(ContratosManager):
             conn.close()
     
     def obtener_estadisticas_pemex(self):
-        """Obtener estadísticas de PostgreSQL - EN ESQUEMA USUARIO"""
+        """Obtener estadísticas de PostgreSQL - EN ESQUEMA USUARIO
+        Lee estadisticas_pemex (mantenida por triggers): no recorre la tabla
+        """
         conn = self._get_connection_with_schema()
         try:
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_contratos,
-                    COALESCE(SUM(tamaño_bytes), 0) as total_bytes,
-                    COUNT(DISTINCT contratista) as contratistas_unicos,
-                    MIN(fecha_subida) as fecha_mas_antigua,
-                    MAX(fecha_subida) as fecha_mas_reciente
-                FROM contratos_pemex
-            """)
-            
-            stats = dict(zip(['total_contratos', 'total_bytes', 'contratistas_unicos', 
-                            'fecha_mas_antigua', 'fecha_mas_reciente'], 
-                           cur.fetchone()))
-            
-            # Formatear fechas
-            for key in ['fecha_mas_antigua', 'fecha_mas_reciente']:
-                if stats[key]:
-                    stats[key] = stats[key].strftime('%Y-%m-%d')
-            
-            return stats
-            
+            return _formato_estadisticas_pemex(_estadisticas_totales(conn))
         except Exception as e:
             raise Exception(f"❌ Error obteniendo estadísticas: {str(e)}")
         finally:
             conn.close()
 
+    def obtener_estadisticas_detalle(self, dimension, limite=None):
+        """
+        Totales por 'contratista', 'dia' (AAAA-MM-DD) o 'categoria' de archivos
+        """
+        conn = self._get_connection_with_schema()
+        try:
+            return _estadisticas_por(conn, dimension, limite)
+        except Exception as e:
+            raise Exception(f"❌ Error obteniendo estadísticas por {dimension}: {str(e)}")
+        finally:
+            conn.close()
+
+    def reconstruir_estadisticas(self):
+        """Recalcular estadisticas_pemex desde las tablas"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _reconstruir_estadisticas(conn)
+        finally:
+            conn.close()
+
+    def rellenar_columnas_numericas(self, tamaño_lote=500, recalcular=False):
+        """Llenar columnas numéricas de monto y plazo - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return self._rellenar_columnas_numericas(conn, tamaño_lote, recalcular)
+        finally:
+            conn.close()
+
+    def reporte_almacenamiento(self):
+        """Almacenamiento y ahorro por deduplicación - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _reporte_almacenamiento(conn)
+        finally:
+            conn.close()
+
+    def deduplicar_archivos(self, aplicar=True):
+        """Unir large objects duplicados - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return _deduplicar_blobs(conn, aplicar)
+        finally:
+            conn.close()
+
+    def reprocesar_contratos(self, tamaño_lote=100, campos=None, aplicar=False):
+        """Volver a extraer campos desde el texto OCR guardado - EN ESQUEMA USUARIO"""
+        conn = self._get_connection_with_schema()
+        try:
+            return self._reprocesar_contratos(conn, tamaño_lote, campos, aplicar)
+        finally:
+            conn.close()
+
     # ========== MÉTODOS ADICIONALES PARA COMPATIBILIDAD ==========
     
     def contar_archivos_por_contrato(self, contrato_id):
@@ -1816,7 +3037,7 @@ def get_db_manager_por_usuario(usuario=""):
         # Verificar que funciona
         try:
             # Probar conexión
-            contratos = manager.buscar_contratos_pemex({})
+            manager.verificar_conexion()
             st.success(f"✅ Usuario {usuario} conectado a su esquema PostgreSQL")
             return manager
         except Exception as test_error:
@@ -1833,6 +3054,91 @@ def get_db_manager_por_usuario(usuario=""):
 # MIGRACIÓN DE DATOS EXISTENTES (OPCIONAL)
 # ============================================
 
+def rellenar_columnas_numericas_todos(connection_string, tamaño_lote=500, recalcular=False):
+    """
+    Rellenar monto_contrato_num / plazo_dias_num en el esquema público y en
+    el esquema de cada usuario registrado. Se puede ejecutar varias veces:
+    solo procesa filas que aún no tienen valor numérico (o todas, con
+    recalcular).
+    """
+    resumenes = {}
+    
+    manager = ContratosManager(connection_string)
+    manager.init_db()
+    resumenes['public'] = manager.rellenar_columnas_numericas(tamaño_lote, recalcular)
+    
+    for registro in SistemaEsquemasUsuarios(connection_string).listar_usuarios():
+        try:
+            # El constructor asegura tablas y columnas en el esquema del usuario
+            manager_usuario = ContratosManagerUsuarios(connection_string, registro['usuario'])
+            resumenes[registro['esquema']] = manager_usuario.rellenar_columnas_numericas(tamaño_lote, recalcular)
+        except Exception as e:
+            print(f"⚠️ Error rellenando esquema {registro['esquema']}: {e}")
+    
+    return resumenes
+
+def reprocesar_contratos_todos(connection_string, tamaño_lote=100, campos=None, aplicar=False):
+    """
+    Reprocesar con el extractor actual los contratos del esquema público y
+    de cada usuario registrado. Solo toca filas con texto OCR guardado y
+    versión de extractor anterior, así que se puede ejecutar varias veces.
+    Por defecto es una simulación; aplicar=True escribe los cambios.
+    """
+    resumenes = {}
+    
+    manager = ContratosManager(connection_string)
+    manager.init_db()
+    resumenes['public'] = manager.reprocesar_contratos(tamaño_lote, campos, aplicar)
+    
+    for registro in SistemaEsquemasUsuarios(connection_string).listar_usuarios():
+        try:
+            manager_usuario = ContratosManagerUsuarios(connection_string, registro['usuario'])
+            resumenes[registro['esquema']] = manager_usuario.reprocesar_contratos(tamaño_lote, campos, aplicar)
+        except Exception as e:
+            print(f"⚠️ Error reprocesando esquema {registro['esquema']}: {e}")
+    
+    return resumenes
+
+def deduplicar_archivos_todos(connection_string, aplicar=True):
+    """
+    Registrar en blobs_pemex los archivos existentes y unir duplicados en el
+    esquema público y en el de cada usuario. Se puede ejecutar varias veces.
+    """
+    resumenes = {}
+    
+    manager = ContratosManager(connection_string)
+    manager.init_db()
+    resumenes['public'] = manager.deduplicar_archivos(aplicar)
+    
+    for registro in SistemaEsquemasUsuarios(connection_string).listar_usuarios():
+        try:
+            manager_usuario = ContratosManagerUsuarios(connection_string, registro['usuario'])
+            resumenes[registro['esquema']] = manager_usuario.deduplicar_archivos(aplicar)
+        except Exception as e:
+            print(f"⚠️ Error deduplicando esquema {registro['esquema']}: {e}")
+    
+    return resumenes
+
+def reconstruir_estadisticas_todos(connection_string):
+    """
+    Recalcular estadisticas_pemex en el esquema público y en el de cada
+    usuario (los triggers la mantienen; esto es para corregir desvíos)
+    """
+    resumenes = {}
+    
+    manager = ContratosManager(connection_string)
+    manager.init_db()
+    resumenes['public'] = manager.reconstruir_estadisticas()
+    
+    for registro in SistemaEsquemasUsuarios(connection_string).listar_usuarios():
+        try:
+            manager_usuario = ContratosManagerUsuarios(connection_string, registro['usuario'])
+            resumenes[registro['esquema']] = manager_usuario.reconstruir_estadisticas()
+        except Exception as e:
+            print(f"⚠️ Error reconstruyendo estadísticas del esquema {registro['esquema']}: {e}")
+    
+    return resumenes
+
 def migrar_datos_usuario(usuario_original, usuario_destino):
     """
     Migrar datos de un usuario del esquema público al suyo propio
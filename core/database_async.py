@@ -0,0 +1,135 @@
+# core/database_async.py
+"""
+Acceso concurrente a la base para las páginas de Streamlit
+
+Las páginas son síncronas y cada llamada al manager espera a la anterior,
+aunque sean independientes (conteo, página de contratos, archivos de varios
+contratos, diagnóstico). Este módulo permite lanzarlas a la vez:
+
+ContratosManagerAsync envuelve un ContratosManager o ContratosManagerUsuarios
+y expone los mismos métodos públicos como corrutinas. Cada una corre en un
+hilo con su propia conexión del pool del proceso (core.db_pool); psycopg2
+suelta el GIL mientras espera al servidor, así que las consultas se
+traslapan de verdad.
+
+    amanager = ContratosManagerAsync(manager)
+    conteo, pagina = await asyncio.gather(
+        amanager.contar_contratos(),
+        amanager.listar_contratos_pagina(tamaño_pagina=3),
+    )
+
+Desde una página (síncrona) se usa ejecutar_concurrente, que corre las
+llamadas en un event loop propio del proceso y regresa cuando terminan todas:
+
+    r = ejecutar_concurrente(
+        conteo=manager.contar_contratos,
+        plan=manager.diagnosticar_busqueda_similar,
+    )
+    r['conteo'], r['plan']
+
+Configuración: PEMEX_CONCURRENCIA (por defecto el tamaño máximo del pool)
+"""
+import asyncio
+import functools
+import os
+import threading
+
+from core.db_pool import POOL_MAXIMO
+
+try:
+    # Permite que los métodos que usan st.error / st.warning funcionen desde otro hilo
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Llamadas simultáneas a la base: más que el pool solo harían esperar conexiones
+CONCURRENCIA_MAXIMA = int(os.environ.get("PEMEX_CONCURRENCIA", POOL_MAXIMO))
+
+_semaforo = threading.BoundedSemaphore(CONCURRENCIA_MAXIMA)
+_loop = None
+_hilo_loop = None
+_lock_loop = threading.Lock()
+
+
+def _obtener_loop():
+    """Event loop del proceso en un hilo daemon (se crea la primera vez)"""
+    global _loop, _hilo_loop
+    with _lock_loop:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            hilo = threading.Thread(target=loop.run_forever, name="pemex-async", daemon=True)
+            hilo.start()
+            _loop, _hilo_loop = loop, hilo
+        return _loop
+
+def _contexto_streamlit():
+    """Contexto de la ejecución de Streamlit del hilo actual (None fuera de Streamlit)"""
+    return get_script_run_ctx() if get_script_run_ctx else None
+
+def _llamar(funcion, args, kwargs, contexto):
+    """Corre en el hilo trabajador: limita la concurrencia y hereda el contexto de Streamlit"""
+    if contexto is not None:
+        add_script_run_ctx(threading.current_thread(), contexto)
+    with _semaforo:
+        return funcion(*args, **kwargs)
+
+async def _en_hilo(funcion, args, kwargs, contexto):
+    return await asyncio.to_thread(_llamar, funcion, args, kwargs, contexto)
+
+def en_hilo(funcion, *args, **kwargs):
+    """Corrutina que ejecuta funcion(*args, **kwargs) en un hilo trabajador"""
+    return _en_hilo(funcion, args, kwargs, _contexto_streamlit())
+
+
+class ContratosManagerAsync:
+    """
+    Versión asyncio de un manager síncrono: mismos métodos públicos, cada
+    uno devuelve una corrutina. Los atributos que no son métodos (usuario,
+    esquema, connection_string) se leen tal cual del manager envuelto.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.manager, nombre)
+        if nombre.startswith('_') or not callable(atributo):
+            return atributo
+
+        @functools.wraps(atributo)
+        def metodo_async(*args, **kwargs):
+            # El contexto se toma aquí, en el hilo que crea la corrutina
+            return _en_hilo(atributo, args, kwargs, _contexto_streamlit())
+        return metodo_async
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(dir(self.manager)))
+
+
+async def _reunir(llamadas, devolver_errores):
+    nombres = list(llamadas)
+    resultados = await asyncio.gather(*llamadas.values(), return_exceptions=devolver_errores)
+    return dict(zip(nombres, resultados))
+
+def ejecutar_concurrente(devolver_errores=False, **llamadas):
+    """
+    Ejecuta a la vez llamadas independientes y espera a todas.
+
+    Cada valor puede ser una función sin argumentos (manager.metodo,
+    functools.partial o lambda) o una corrutina ya creada (por ejemplo de
+    ContratosManagerAsync). Devuelve {nombre: resultado}. Si alguna falla se
+    lanza su excepción; con devolver_errores=True la excepción queda como
+    resultado de esa llamada y las demás se conservan.
+    """
+    if threading.current_thread() is _hilo_loop:
+        raise Exception("❌ ejecutar_concurrente no puede llamarse desde una corrutina; use await asyncio.gather(...)")
+    if not llamadas:
+        return {}
+
+    contexto = _contexto_streamlit()
+    corrutinas = {
+        nombre: llamada if asyncio.iscoroutine(llamada) else _en_hilo(llamada, (), {}, contexto)
+        for nombre, llamada in llamadas.items()
+    }
+    futuro = asyncio.run_coroutine_threadsafe(_reunir(corrutinas, devolver_errores), _obtener_loop())
+    return futuro.result()
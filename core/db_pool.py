@@ -0,0 +1,407 @@
+# core/db_pool.py
+"""
+Pool de conexiones PostgreSQL compartido por todo el proceso
+
+Cada ContratosManager / ContratosManagerUsuarios obtiene sus conexiones de
+un pool por cadena de conexión en lugar de abrir una nueva (TCP + auth + TLS)
+en cada método. La conexión prestada es un proxy: conn.close() la devuelve al
+pool, así que el patrón existente try / finally: conn.close() no cambia.
+
+Al devolverla se revierte cualquier transacción abierta y se restablecen
+autocommit y las características de sesión de psycopg2 (set_session:
+aislamiento, solo lectura, diferible); el que cambie parámetros con SET
+debe usar SET LOCAL. El pool recuerda
+el search_path de cada conexión física: obtener(esquema) solo emite SET
+search_path (en autocommit, sin COMMIT aparte) cuando la conexión venía de
+otro esquema, así que servir al mismo usuario repetidamente no cuesta
+ningún viaje extra al servidor. Por eso nadie debe cambiar el search_path
+por fuera del pool: dentro de una transacción use SET LOCAL, o bien
+conn.usar_esquema(esquema) sobre la conexión prestada.
+
+Configuración (variables de entorno o argumentos de obtener_pool):
+    PEMEX_POOL_MIN, PEMEX_POOL_MAX, PEMEX_POOL_TIMEOUT,
+    PEMEX_POOL_INACTIVIDAD, PEMEX_POOL_VIDA_MAXIMA
+"""
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+POOL_MINIMO = int(os.environ.get("PEMEX_POOL_MIN", 1))
+POOL_MAXIMO = int(os.environ.get("PEMEX_POOL_MAX", 10))
+TIMEOUT_ESPERA_S = float(os.environ.get("PEMEX_POOL_TIMEOUT", 30))
+# Conexiones inactivas más tiempo que esto se cierran (respetando el mínimo)
+MAX_INACTIVIDAD_S = float(os.environ.get("PEMEX_POOL_INACTIVIDAD", 300))
+# Ninguna conexión vive más que esto (evita conexiones eternas tras failover)
+VIDA_MAXIMA_S = float(os.environ.get("PEMEX_POOL_VIDA_MAXIMA", 1800))
+# Una conexión inactiva más tiempo que esto se verifica con SELECT 1 al prestarla
+VERIFICAR_TRAS_S = 30.0
+
+
+class ConexionPool:
+    """
+    Proxy de una conexión psycopg2 prestada por el pool. Delega todo en la
+    conexión real; close() la devuelve al pool (solo la primera vez).
+    También sirve como context manager: al salir se devuelve al pool.
+    """
+
+    __slots__ = ("_conn", "_pool", "_devuelta")
+
+    def __init__(self, conn, pool):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_devuelta", False)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._conn, nombre, valor)
+
+    @property
+    def conexion_real(self):
+        return self._conn
+
+    def usar_esquema(self, esquema):
+        """Cambia el search_path de la conexión (None = el del servidor)"""
+        self._pool._fijar_esquema(self._conn, esquema)
+
+    def close(self):
+        if self._devuelta:
+            return
+        object.__setattr__(self, "_devuelta", True)
+        self._pool.devolver(self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.close()
+        return False
+
+
+class PoolConexiones:
+    """Pool thread-safe de conexiones psycopg2 para una cadena de conexión"""
+
+    def __init__(self, connection_string, minimo=POOL_MINIMO, maximo=POOL_MAXIMO,
+                 timeout_s=TIMEOUT_ESPERA_S, max_inactividad_s=MAX_INACTIVIDAD_S,
+                 vida_maxima_s=VIDA_MAXIMA_S):
+        if maximo < 1 or minimo < 0 or minimo > maximo:
+            raise Exception(f"❌ Tamaño de pool inválido: minimo={minimo}, maximo={maximo}")
+        self.connection_string = connection_string
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout_s = timeout_s
+        self.max_inactividad_s = max_inactividad_s
+        self.vida_maxima_s = vida_maxima_s
+
+        self._condicion = threading.Condition()
+        self._inactivas = []      # [(conn, devuelta_en)] - se presta la más reciente
+        self._creada_en = {}      # id(conn) -> momento de creación
+        self._esquemas = {}       # id(conn) -> search_path actual (None = por defecto)
+        self._en_uso = 0
+        self._cerrado = False
+        self._stats = {
+            "creadas": 0,
+            "cerradas": 0,
+            "prestamos": 0,
+            "esperas": 0,
+            "tiempo_espera_s": 0.0,
+            "timeouts": 0,
+            "fallos_verificacion": 0,
+            "recicladas": 0,
+            "cambios_esquema": 0,
+            "esquema_reutilizado": 0,
+            "sesiones_restablecidas": 0,
+        }
+
+    # ----------------- Conexiones físicas -----------------
+    def _crear(self):
+        conn = psycopg2.connect(self.connection_string)
+        conn.autocommit = False
+        with self._condicion:
+            self._creada_en[id(conn)] = time.monotonic()
+            self._stats["creadas"] += 1
+        return conn
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._condicion:
+            self._creada_en.pop(id(conn), None)
+            self._esquemas.pop(id(conn), None)
+            self._stats["cerradas"] += 1
+
+    def _vencida(self, conn, ahora):
+        return ahora - self._creada_en.get(id(conn), ahora) > self.vida_maxima_s
+
+    def _verificar(self, conn, inactiva_s):
+        """Revisión al prestar: estado local siempre, SELECT 1 si estuvo inactiva mucho tiempo"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if inactiva_s < VERIFICAR_TRAS_S:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _fijar_esquema(self, conn, esquema):
+        """SET search_path solo si la conexión tiene otro esquema (sin COMMIT aparte)"""
+        if self._esquemas.get(id(conn)) == esquema:
+            with self._condicion:
+                self._stats["esquema_reutilizado"] += 1
+            return
+        if esquema is None:
+            consulta = sql.SQL("RESET search_path")
+        else:
+            consulta = sql.SQL("SET search_path TO {}").format(sql.Identifier(esquema))
+        # En autocommit el SET no abre una transacción que haya que confirmar
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            cur.execute(consulta)
+            cur.close()
+        finally:
+            conn.autocommit = False
+        with self._condicion:
+            self._esquemas[id(conn)] = esquema
+            self._stats["cambios_esquema"] += 1
+
+    # ----------------- Préstamo y devolución -----------------
+    def obtener(self, esquema=None):
+        """
+        Presta una conexión (proxy) con el search_path del esquema indicado
+        (None = el del servidor); espera hasta timeout_s si el pool está lleno
+        """
+        conn = self._prestar()
+        try:
+            self._fijar_esquema(conn.conexion_real, esquema)
+        except Exception:
+            # Conexión en estado dudoso: se descarta en lugar de reutilizarla
+            with self._condicion:
+                self._esquemas.pop(id(conn.conexion_real), None)
+            conn.close()
+            raise
+        return conn
+
+    def _prestar(self):
+        limite = time.monotonic() + self.timeout_s
+        esperando_desde = None
+
+        while True:
+            descartar = []
+            conn = None
+            crear = False
+            with self._condicion:
+                if self._cerrado:
+                    raise Exception("❌ El pool de conexiones está cerrado")
+                ahora = time.monotonic()
+                while self._inactivas:
+                    candidata, devuelta_en = self._inactivas.pop()
+                    if self._vencida(candidata, ahora):
+                        self._stats["recicladas"] += 1
+                        descartar.append(candidata)
+                        continue
+                    conn = (candidata, ahora - devuelta_en)
+                    break
+                if conn is None and self._en_uso + len(self._inactivas) < self.maximo:
+                    crear = True
+                if conn is not None or crear:
+                    self._en_uso += 1
+                    self._stats["prestamos"] += 1
+                    if esperando_desde is not None:
+                        self._stats["tiempo_espera_s"] += ahora - esperando_desde
+                elif ahora >= limite:
+                    self._stats["timeouts"] += 1
+                    raise Exception(f"❌ Sin conexiones disponibles tras {self.timeout_s:g}s "
+                                    f"(pool máximo {self.maximo})")
+                else:
+                    if esperando_desde is None:
+                        esperando_desde = ahora
+                        self._stats["esperas"] += 1
+                    self._condicion.wait(limite - ahora)
+
+            # Cierres y conexiones nuevas fuera del lock
+            for candidata in descartar:
+                self._cerrar(candidata)
+
+            if crear:
+                try:
+                    return ConexionPool(self._crear(), self)
+                except Exception:
+                    self._liberar_cupo()
+                    raise
+
+            if conn is not None:
+                candidata, inactiva_s = conn
+                if self._verificar(candidata, inactiva_s):
+                    return ConexionPool(candidata, self)
+                with self._condicion:
+                    self._stats["fallos_verificacion"] += 1
+                self._cerrar(candidata)
+                self._liberar_cupo()
+                # Reintentar con otra conexión (o una nueva)
+
+    def _liberar_cupo(self):
+        with self._condicion:
+            self._en_uso -= 1
+            self._stats["prestamos"] -= 1
+            self._condicion.notify()
+
+    def _restablecer_sesion(self, conn):
+        """
+        Deja autocommit=False y aislamiento / solo lectura / diferible por
+        defecto. psycopg2 los aplica en el BEGIN de cada transacción, así que
+        restablecerlos no cuesta un viaje al servidor.
+        """
+        if (conn.autocommit or conn.isolation_level is not None
+                or conn.readonly is not None or conn.deferrable is not None):
+            conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT",
+                             deferrable="DEFAULT", autocommit=False)
+            with self._condicion:
+                self._stats["sesiones_restablecidas"] += 1
+
+    def devolver(self, conn):
+        """Recibe una conexión prestada: la deja limpia o la descarta si está dañada"""
+        reutilizable = False
+        if not conn.closed:
+            try:
+                en_transaccion = conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                if en_transaccion and conn.autocommit:
+                    # BEGIN explícito en autocommit: rollback() de psycopg2 no lo cierra
+                    raise Exception("transacción abierta en autocommit")
+                if en_transaccion:
+                    conn.rollback()
+                self._restablecer_sesion(conn)
+                # El search_path se conserva: el siguiente obtener() lo cambia solo si hace falta
+                reutilizable = True
+            except Exception:
+                reutilizable = False
+
+        ahora = time.monotonic()
+        descartar = []
+        with self._condicion:
+            self._en_uso -= 1
+            if reutilizable and not self._cerrado and not self._vencida(conn, ahora):
+                self._inactivas.append((conn, ahora))
+                conn = None
+            descartar = self._recolectar_inactivas(ahora)
+            self._condicion.notify()
+
+        if conn is not None:
+            descartar.append(conn)
+        for candidata in descartar:
+            self._cerrar(candidata)
+
+    def _recolectar_inactivas(self, ahora):
+        """Saca (con el lock tomado) las inactivas de más, respetando el mínimo"""
+        sobrantes = []
+        conservar = []
+        total = self._en_uso + len(self._inactivas)
+        # Las más antiguas están al inicio de la lista
+        for conn, devuelta_en in self._inactivas:
+            if total > self.minimo and ahora - devuelta_en > self.max_inactividad_s:
+                sobrantes.append(conn)
+                total -= 1
+                self._stats["recicladas"] += 1
+            else:
+                conservar.append((conn, devuelta_en))
+        self._inactivas = conservar
+        return sobrantes
+
+    @contextmanager
+    def conexion(self, esquema=None):
+        """
+        with pool.conexion() as conn:
+            ...
+        Confirma al salir sin errores, revierte si hubo excepción y siempre
+        devuelve la conexión al pool
+        """
+        conn = self.obtener(esquema)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # ----------------- Administración -----------------
+    def estadisticas(self):
+        with self._condicion:
+            stats = dict(self._stats)
+            stats.update({
+                "en_uso": self._en_uso,
+                "inactivas": len(self._inactivas),
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+            })
+        stats["espera_promedio_ms"] = (
+            stats["tiempo_espera_s"] * 1000 / stats["esperas"] if stats["esperas"] else 0.0
+        )
+        return stats
+
+    def cerrar(self):
+        """Cierra las conexiones inactivas; las prestadas se cierran al devolverse"""
+        with self._condicion:
+            self._cerrado = True
+            inactivas = [conn for conn, _ in self._inactivas]
+            self._inactivas = []
+            self._condicion.notify_all()
+        for conn in inactivas:
+            self._cerrar(conn)
+
+
+# ============================================
+# REGISTRO DE POOLS DEL PROCESO
+# ============================================
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def obtener_pool(connection_string, **opciones):
+    """
+    Pool único del proceso para una cadena de conexión. Las opciones solo
+    se aplican la primera vez (cuando se crea el pool).
+    """
+    pool = _POOLS.get(connection_string)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(connection_string)
+            if pool is None:
+                pool = PoolConexiones(connection_string, **opciones)
+                _POOLS[connection_string] = pool
+    return pool
+
+def estadisticas_pools():
+    """Estadísticas de todos los pools (la cadena de conexión se oculta)"""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [
+        dict(pool.estadisticas(), destino=pool.connection_string.rsplit("@", 1)[-1])
+        for pool in pools
+    ]
+
+def cerrar_pools():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.cerrar()
+
+atexit.register(cerrar_pools)
@@ -0,0 +1,305 @@
+# core/evaluacion_extraccion.py
+"""
+Evaluación de la extracción de datos contra un corpus de referencia
+
+Mide al mismo tiempo la exactitud (precisión / recall por campo) y el
+rendimiento (textos por segundo y tiempo por extractor) de
+core/text_processing.py, y permite comparar dos revisiones de git lado a
+lado para demostrar que una optimización no empeora los resultados.
+También verifica que ExtractorIncremental, alimentado línea por línea,
+termine con el mismo resultado que extract_contract_data sobre el texto
+completo (si hay diferencias el comando sale con código 1).
+
+El corpus es versionado (core/corpus_extraccion/vN.json): cada documento
+tiene el texto OCR y los valores esperados revisados a mano.
+
+Uso:
+    python core/evaluacion_extraccion.py
+    python core/evaluacion_extraccion.py --repeticiones 50
+    python core/evaluacion_extraccion.py --comparar HEAD~1 ACTUAL
+"""
+import argparse
+import io
+import json
+import re
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+RAIZ_REPO = Path(__file__).resolve().parent.parent
+CORPUS_POR_DEFECTO = Path(__file__).resolve().parent / "corpus_extraccion" / "v1.json"
+
+CAMPOS = ["contrato", "contratista", "objeto", "monto", "plazo", "anexos"]
+
+# Extractores individuales que se cronometran (si existen en la revisión)
+EXTRACTORES = [
+    "_extract_contrato_and_contratista",
+    "_extract_objeto",
+    "_extract_monto",
+    "_extract_plazo",
+    "_extract_anexos_avanzado",
+]
+
+# Revisión especial: el árbol de trabajo actual (con cambios sin confirmar)
+REVISION_ACTUAL = "ACTUAL"
+
+
+# ----------------- Carga del código a evaluar -----------------
+def _cargar_text_processing(raiz, dir_temporal):
+    """
+    Importa core.text_processing desde la raíz indicada. El vocabulario de
+    anexos se aísla en un directorio temporal para que la evaluación sea
+    reproducible y no modifique data/ del proyecto.
+    """
+    sys.path.insert(0, str(raiz))
+    from core import text_processing
+
+    try:
+        from core import anexos_vocabulario
+        anexos_vocabulario._VOCABULARIO = anexos_vocabulario.VocabularioAnexos(
+            archivo_base=Path(dir_temporal) / "anexos_base.json",
+            bitacora=Path(dir_temporal) / "anexos_aprendidos.log",
+        )
+    except ImportError:
+        # Revisiones anteriores al vocabulario compartido
+        pass
+
+    return text_processing
+
+def cargar_corpus(ruta=CORPUS_POR_DEFECTO):
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ----------------- Comparación de valores -----------------
+def _normalizar(campo, valor):
+    """Forma canónica para comparar lo esperado con lo obtenido"""
+    if campo == "anexos":
+        return {str(a).strip().upper() for a in (valor or []) if str(a).strip()}
+
+    valor = " ".join(str(valor or "").split())
+    if not valor:
+        return ""
+    if campo == "monto":
+        cifra = re.sub(r"[^\d.]", "", valor.replace(",", "")).strip(".")
+        try:
+            return Decimal(cifra)
+        except InvalidOperation:
+            return valor
+    if campo == "plazo":
+        return int(valor) if valor.isdigit() else valor
+    return valor.upper()
+
+def _contar(metricas, campo, esperado, obtenido):
+    """Acumula verdaderos positivos, falsos positivos y falsos negativos"""
+    m = metricas[campo]
+    if campo == "anexos":
+        m["vp"] += len(esperado & obtenido)
+        m["fp"] += len(obtenido - esperado)
+        m["fn"] += len(esperado - obtenido)
+        return esperado == obtenido
+
+    if obtenido and esperado:
+        if obtenido == esperado:
+            m["vp"] += 1
+            return True
+        # Valor incorrecto: sobra el obtenido y falta el esperado
+        m["fp"] += 1
+        m["fn"] += 1
+    elif obtenido:
+        m["fp"] += 1
+    elif esperado:
+        m["fn"] += 1
+    else:
+        return True
+    return False
+
+
+# ----------------- Evaluación -----------------
+def evaluar(text_processing, corpus, repeticiones=10):
+    """Evalúa exactitud y rendimiento; retorna un diccionario serializable"""
+    documentos = corpus["documentos"]
+    metricas = {campo: {"vp": 0, "fp": 0, "fn": 0} for campo in CAMPOS}
+    fallos = []
+
+    # 1. Exactitud (primera pasada, con vocabulario recién cargado)
+    for doc in documentos:
+        resultado = text_processing.extract_contract_data(doc["texto"]) or {}
+        for campo in CAMPOS:
+            esperado = _normalizar(campo, doc["esperado"].get(campo))
+            obtenido = _normalizar(campo, resultado.get(campo))
+            if not _contar(metricas, campo, esperado, obtenido):
+                fallos.append({
+                    "id": doc["id"],
+                    "campo": campo,
+                    "esperado": doc["esperado"].get(campo),
+                    "obtenido": resultado.get(campo),
+                })
+
+    for m in metricas.values():
+        m["precision"] = m["vp"] / (m["vp"] + m["fp"]) if m["vp"] + m["fp"] else 1.0
+        m["recall"] = m["vp"] / (m["vp"] + m["fn"]) if m["vp"] + m["fn"] else 1.0
+
+    # 2. Rendimiento de la función completa
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for doc in documentos:
+            text_processing.extract_contract_data(doc["texto"])
+    total = time.perf_counter() - inicio
+    textos_por_segundo = (len(documentos) * repeticiones) / total if total else 0.0
+
+    # 3. Tiempo por extractor (sobre el texto ya limpio, o ya normalizado si
+    # la revisión comparte la normalización entre extractores)
+    preparar = getattr(text_processing, "_normalizado", None)
+    limpios = [text_processing._clean_whitespace(doc["texto"]) for doc in documentos]
+    if preparar is not None:
+        limpios = [preparar(texto) for texto in limpios]
+    tiempos_ms = {}
+    for nombre in EXTRACTORES:
+        funcion = getattr(text_processing, nombre, None)
+        if funcion is None:
+            continue
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            for texto in limpios:
+                funcion(texto)
+        # Milisegundos por pasada completa del corpus
+        tiempos_ms[nombre] = (time.perf_counter() - inicio) * 1000 / repeticiones
+
+    # 4. Extracción incremental: cada línea llega por separado, así que toda
+    # cabecera queda cortada de lo que le sigue en algún momento
+    incremental = []
+    extractor = getattr(text_processing, "ExtractorIncremental", None)
+    for doc in documentos if extractor is not None else []:
+        completo = text_processing.extract_contract_data(doc["texto"])
+        parcial = extractor()
+        for linea in doc["texto"].splitlines(keepends=True):
+            parcial.agregar_texto(linea)
+        resultado = parcial.cerrar()
+        for campo in CAMPOS:
+            if resultado.get(campo) != completo.get(campo):
+                incremental.append({
+                    "id": doc["id"],
+                    "campo": campo,
+                    "completo": completo.get(campo),
+                    "incremental": resultado.get(campo),
+                })
+
+    return {
+        "corpus_version": corpus.get("version"),
+        "documentos": len(documentos),
+        "campos": metricas,
+        "textos_por_segundo": textos_por_segundo,
+        "tiempos_ms": tiempos_ms,
+        "fallos": fallos,
+        "incremental": incremental,
+    }
+
+
+# ----------------- Reportes -----------------
+def imprimir_reporte(resultado, titulo=""):
+    print(f"=== EVALUACIÓN DE EXTRACCIÓN {titulo}===")
+    print(f"Corpus v{resultado['corpus_version']} · {resultado['documentos']} documentos")
+    print(f"{'CAMPO':<14} {'PRECISIÓN':>10} {'RECALL':>8} {'VP':>5} {'FP':>5} {'FN':>5}")
+    for campo, m in resultado["campos"].items():
+        print(f"{campo:<14} {m['precision']:>10.3f} {m['recall']:>8.3f} {m['vp']:>5} {m['fp']:>5} {m['fn']:>5}")
+
+    print(f"\n⚡ {resultado['textos_por_segundo']:.1f} textos/seg")
+    for nombre, ms in resultado["tiempos_ms"].items():
+        print(f"   {nombre:<36} {ms:>9.3f} ms/corpus")
+
+    if resultado["fallos"]:
+        print(f"\n⚠️ {len(resultado['fallos'])} diferencias:")
+        for f in resultado["fallos"]:
+            print(f"   [{f['id']}] {f['campo']}: esperado={f['esperado']!r} obtenido={f['obtenido']!r}")
+
+    if resultado.get("incremental"):
+        print(f"\n❌ {len(resultado['incremental'])} diferencias del extractor incremental (línea por línea):")
+        for f in resultado["incremental"]:
+            print(f"   [{f['id']}] {f['campo']}: completo={f['completo']!r} incremental={f['incremental']!r}")
+
+def imprimir_comparacion(rev_a, res_a, rev_b, res_b):
+    print(f"=== COMPARACIÓN {rev_a} vs {rev_b} ===")
+    print(f"{'CAMPO':<14} {'PREC A':>8} {'PREC B':>8} {'REC A':>8} {'REC B':>8}")
+    for campo in CAMPOS:
+        a = res_a["campos"][campo]
+        b = res_b["campos"][campo]
+        marca = "" if (b["precision"], b["recall"]) >= (a["precision"], a["recall"]) else "  ❌"
+        print(f"{campo:<14} {a['precision']:>8.3f} {b['precision']:>8.3f} "
+              f"{a['recall']:>8.3f} {b['recall']:>8.3f}{marca}")
+
+    tps_a, tps_b = res_a["textos_por_segundo"], res_b["textos_por_segundo"]
+    print(f"\n{'textos/seg':<36} {tps_a:>10.1f} {tps_b:>10.1f}  x{tps_b / tps_a if tps_a else 0:.2f}")
+    for nombre in EXTRACTORES:
+        ms_a = res_a["tiempos_ms"].get(nombre)
+        ms_b = res_b["tiempos_ms"].get(nombre)
+        if ms_a is None or ms_b is None:
+            continue
+        print(f"{nombre:<36} {ms_a:>8.3f}ms {ms_b:>8.3f}ms  x{ms_a / ms_b if ms_b else 0:.2f}")
+
+
+# ----------------- Revisiones de git -----------------
+def _exportar_revision(revision, destino):
+    """Extrae el árbol de una revisión de git en destino (sin tocar el repo)"""
+    salida = subprocess.run(
+        ["git", "-C", str(RAIZ_REPO), "archive", "--format=tar", revision],
+        capture_output=True, check=True
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(salida)) as tar:
+        tar.extractall(destino)
+
+def evaluar_revision(revision, corpus_ruta, repeticiones):
+    """Evalúa una revisión en un proceso aparte (cada una importa su propio core)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        if revision == REVISION_ACTUAL:
+            raiz = RAIZ_REPO
+        else:
+            raiz = Path(tmp) / "arbol"
+            raiz.mkdir()
+            _exportar_revision(revision, raiz)
+
+        salida = Path(tmp) / "resultado.json"
+        comando = [sys.executable, str(Path(__file__).resolve()),
+                   "--raiz", str(raiz), "--corpus", str(corpus_ruta),
+                   "--repeticiones", str(repeticiones), "--salida", str(salida)]
+        proceso = subprocess.run(comando, cwd=str(raiz), stdout=subprocess.DEVNULL)
+        # Código 1 = diferencias del extractor incremental: el resultado sí se guardó
+        if proceso.returncode not in (0, 1):
+            raise subprocess.CalledProcessError(proceso.returncode, comando)
+        with open(salida, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación de extracción contra corpus de referencia")
+    parser.add_argument("--corpus", default=str(CORPUS_POR_DEFECTO))
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--raiz", default=None, help="raíz del proyecto cuyo core se evalúa")
+    parser.add_argument("--salida", default=None, help="guardar el resultado en JSON")
+    parser.add_argument("--comparar", nargs=2, metavar=("REV_A", "REV_B"),
+                        help=f"comparar dos revisiones de git ({REVISION_ACTUAL} = árbol de trabajo)")
+    args = parser.parse_args(argv)
+    corpus_ruta = Path(args.corpus).resolve()
+
+    if args.comparar:
+        rev_a, rev_b = args.comparar
+        res_a = evaluar_revision(rev_a, corpus_ruta, args.repeticiones)
+        res_b = evaluar_revision(rev_b, corpus_ruta, args.repeticiones)
+        imprimir_comparacion(rev_a, res_a, rev_b, res_b)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_processing = _cargar_text_processing(Path(args.raiz or RAIZ_REPO).resolve(), tmp)
+        resultado = evaluar(text_processing, cargar_corpus(corpus_ruta), args.repeticiones)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2, default=str)
+    imprimir_reporte(resultado)
+    return 1 if resultado["incremental"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
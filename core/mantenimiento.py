@@ -0,0 +1,341 @@
+# core/mantenimiento.py
+"""
+Recolección de large objects huérfanos y mantenimiento de tablas
+
+El contenido de contratos y archivos vive en large objects (pg_largeobject,
+compartido por toda la base). Un large object que ninguna fila referencia
+ocupa espacio para siempre: eliminaciones cuyo lo_unlink falló, esquemas o
+filas borrados a mano, datos anteriores a la deduplicación, etc.
+
+Como vacuumlo: se toman todos los large objects y se descartan los que
+aparecen en cualquier columna oid/lo de cualquier tabla de la base (todos
+los esquemas de usuario, public y lo que haya fuera de la aplicación);
+lo que queda es huérfano. Antes se podan las filas de blobs_pemex que ya
+nadie usa (referencias en cero y sin filas que apunten a su lo_oid), que
+de otro modo mantendrían vivo su large object.
+
+Por defecto solo reporta (simulacro). Para un cron:
+    python -m core.mantenimiento "postgresql://..."                 # simulacro
+    python -m core.mantenimiento "postgresql://..." --aplicar --vacuum
+    python -m core.mantenimiento "postgresql://..." --aplicar --repetir-cada-horas 24
+"""
+import argparse
+import sys
+import time
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+
+from core.db_pool import obtener_pool
+
+TAMAÑO_LOTE_UNLINK = 500
+# lo_open en modo lectura (INV_READ)
+_INV_READ = 0x40000
+
+# Tablas de la aplicación a las que se les hace VACUUM (ANALYZE) por esquema
+TABLAS_VACUUM = ("contratos_pemex", "archivos_pemex", "blobs_pemex", "estadisticas_pemex")
+
+# Columnas de tipo oid / lo en tablas de usuario: las posibles referencias a large objects
+_SQL_COLUMNAS_LO = """
+    SELECT n.nspname, c.relname, a.attname
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_type t ON t.oid = a.atttypid
+    WHERE c.relkind = 'r'
+      AND a.attnum > 0 AND NOT a.attisdropped
+      AND t.typname IN ('oid', 'lo')
+      AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+      AND n.nspname NOT LIKE 'pg\\_toast%'
+      AND n.nspname NOT LIKE 'pg\\_temp%'
+    ORDER BY 1, 2, 3
+"""
+
+# Fila de blobs_pemex sin uso: ninguna fila de contratos ni archivos apunta a ella.
+# referencias <= 0 va primero: si una subida concurrente la reutiliza
+# (referencias + 1), al releer la fila ya no cumple la condición
+_SQL_BLOB_MUERTO = """
+    {blob}.referencias <= 0
+    AND NOT EXISTS (SELECT 1 FROM {contratos} c WHERE c.lo_oid = {blob}.lo_oid)
+    AND NOT EXISTS (SELECT 1 FROM {archivos} a WHERE a.lo_oid = {blob}.lo_oid)
+"""
+
+
+def esquemas_con_blobs(conn):
+    """Esquemas que tienen blobs_pemex (public y usuarios migrados)"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT n.nspname
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'blobs_pemex' AND c.relkind = 'r'
+        ORDER BY n.nspname
+    """)
+    return [fila[0] for fila in cur.fetchall()]
+
+def _condicion_blob_muerto(esquema, alias="b"):
+    return sql.SQL(_SQL_BLOB_MUERTO).format(
+        blob=sql.Identifier(alias),
+        contratos=sql.Identifier(esquema, "contratos_pemex"),
+        archivos=sql.Identifier(esquema, "archivos_pemex"),
+    )
+
+def podar_blobs(conn, esquemas, aplicar=False):
+    """
+    Filas de blobs_pemex sin uso por esquema. Con aplicar se borran (sin
+    confirmar: el llamador hace commit). Retorna {esquema: cantidad}
+    """
+    cur = conn.cursor()
+    podados = {}
+    for esquema in esquemas:
+        if aplicar:
+            consulta = sql.SQL("DELETE FROM {blobs} b WHERE {condicion}")
+        else:
+            consulta = sql.SQL("SELECT 1 FROM {blobs} b WHERE {condicion}")
+        cur.execute(consulta.format(
+            blobs=sql.Identifier(esquema, "blobs_pemex"),
+            condicion=_condicion_blob_muerto(esquema),
+        ))
+        if cur.rowcount:
+            podados[esquema] = cur.rowcount
+    return podados
+
+def buscar_huerfanos(conn, ignorar_blobs_muertos=False):
+    """
+    OIDs de large objects que ninguna columna oid/lo de la base referencia.
+    Todo se lee en una sola instantánea (REPEATABLE READ): un large object
+    y la fila que lo referencia se confirman juntos, así que una subida en
+    curso nunca aparece como huérfana. Con ignorar_blobs_muertos las filas
+    de blobs_pemex sin uso no cuentan como referencia (para el simulacro,
+    que no las borra). Deja la transacción abierta; el llamador la cierra.
+    """
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    cur.execute("""
+        CREATE TEMP TABLE pemex_lo_candidatos (lo oid PRIMARY KEY) ON COMMIT DROP
+    """)
+    cur.execute("INSERT INTO pg_temp.pemex_lo_candidatos SELECT oid FROM pg_largeobject_metadata")
+    if not cur.rowcount:
+        return []
+
+    cur.execute(_SQL_COLUMNAS_LO)
+    columnas = cur.fetchall()
+    for esquema, tabla, columna in columnas:
+        consulta = sql.SQL("""
+            DELETE FROM pg_temp.pemex_lo_candidatos l USING {tabla} t WHERE t.{columna} = l.lo
+        """).format(tabla=sql.Identifier(esquema, tabla), columna=sql.Identifier(columna))
+        if ignorar_blobs_muertos and tabla == "blobs_pemex" and columna == "lo_oid":
+            consulta = sql.SQL("{consulta} AND NOT ({condicion})").format(
+                consulta=consulta,
+                condicion=_condicion_blob_muerto(esquema, alias="t"),
+            )
+        try:
+            cur.execute(consulta)
+        except psycopg2.errors.InsufficientPrivilege as e:
+            # Sin leer todas las referencias no se puede saber qué es huérfano
+            raise Exception(f"❌ Sin permiso para revisar {esquema}.{tabla}.{columna}: {e}")
+
+    cur.execute("SELECT lo FROM pg_temp.pemex_lo_candidatos ORDER BY lo")
+    return [fila[0] for fila in cur.fetchall()]
+
+def _lotes(oids, tamaño_lote):
+    for inicio in range(0, len(oids), tamaño_lote):
+        yield oids[inicio:inicio + tamaño_lote]
+
+def tamaño_large_objects(conn, oids):
+    """
+    {oid: bytes} de los large objects (lo_lseek64 al final de cada uno).
+    None si no hay permiso de lectura sobre alguno. No cierra la transacción.
+    """
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT medir_lo")
+    try:
+        cur.execute("""
+            SELECT o, lo_lseek64(lo_open(o, %s), 0, 2)
+            FROM unnest(%s::oid[]) AS o
+            WHERE EXISTS (SELECT 1 FROM pg_largeobject_metadata m WHERE m.oid = o)
+        """, (_INV_READ, list(oids)))
+        tamaños = dict(cur.fetchall())
+        cur.execute("RELEASE SAVEPOINT medir_lo")
+        return tamaños
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT medir_lo")
+        print(f"⚠️ No se pudo medir el tamaño de {len(oids)} large objects: {e}")
+        return None
+
+def eliminar_large_objects(conn, oids):
+    """
+    lo_unlink de los OIDs en una sola sentencia; si falla alguno (sin
+    permiso, ya eliminado) se reintenta uno por uno con savepoint y se
+    reporta cada fallo. No confirma. Retorna los OIDs eliminados.
+    """
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT unlink_lote")
+    try:
+        cur.execute("""
+            SELECT o, lo_unlink(o)
+            FROM unnest(%s::oid[]) AS o
+            WHERE EXISTS (SELECT 1 FROM pg_largeobject_metadata m WHERE m.oid = o)
+        """, (list(oids),))
+        eliminados = [fila[0] for fila in cur.fetchall()]
+        cur.execute("RELEASE SAVEPOINT unlink_lote")
+        return eliminados
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT unlink_lote")
+
+    eliminados = []
+    for lo_oid in oids:
+        cur.execute("SAVEPOINT unlink_blob")
+        try:
+            cur.execute("SELECT lo_unlink(%s)", (lo_oid,))
+            cur.execute("RELEASE SAVEPOINT unlink_blob")
+            eliminados.append(lo_oid)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT unlink_blob")
+            print(f"⚠️ No se pudo eliminar el large object {lo_oid}: {e}")
+    return eliminados
+
+def vacuum(conn, esquemas):
+    """
+    VACUUM (ANALYZE) de las tablas PEMEX de cada esquema y de pg_largeobject
+    (este último solo si el usuario es su dueño; si no, se avisa y se sigue).
+    Requiere autocommit: VACUUM no corre dentro de una transacción.
+    """
+    autocommit_previo = conn.autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        objetivos = [
+            sql.Identifier(esquema, tabla)
+            for esquema in esquemas for tabla in TABLAS_VACUUM
+        ]
+        objetivos.append(sql.Identifier("pg_catalog", "pg_largeobject"))
+        completados = 0
+        for objetivo in objetivos:
+            nombre = objetivo.as_string(cur)
+            cur.execute("SELECT to_regclass(%s)", (nombre,))
+            if cur.fetchone()[0] is None:
+                continue
+            del conn.notices[:]
+            try:
+                cur.execute(sql.SQL("VACUUM (ANALYZE) {}").format(objetivo))
+                # Sin privilegios PostgreSQL solo emite un WARNING y omite la tabla
+                avisos = [aviso for aviso in conn.notices if "skipping" in aviso or "omitiendo" in aviso]
+                del conn.notices[:]
+                if avisos:
+                    print(f"⚠️ VACUUM omitido en {nombre}: {avisos[-1].strip()}")
+                else:
+                    completados += 1
+            except psycopg2.Error as e:
+                print(f"⚠️ VACUUM falló en {nombre}: {e}")
+        return completados
+    finally:
+        conn.autocommit = autocommit_previo
+
+def recolectar_huerfanos(connection_string, aplicar=False, tamaño_lote=TAMAÑO_LOTE_UNLINK, hacer_vacuum=False):
+    """
+    Poda blobs_pemex, busca large objects huérfanos en toda la base y, con
+    aplicar, los elimina por lotes (una transacción por lote). Sin aplicar
+    es un simulacro: reporta lo mismo sin modificar nada.
+    Retorna {'blobs_podados', 'huerfanos', 'eliminados', 'bytes_huerfanos',
+    'bytes_liberados', 'aplicado', 'vacuum'}; los bytes son None si no se
+    pudieron medir (sin permiso de lectura sobre los large objects)
+    """
+    conn = obtener_pool(connection_string).obtener()
+    try:
+        esquemas = esquemas_con_blobs(conn)
+
+        try:
+            blobs_podados = podar_blobs(conn, esquemas, aplicar)
+            if aplicar:
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f"❌ Error podando blobs_pemex: {str(e)}")
+
+        try:
+            # En el simulacro las filas de blobs sin uso siguen ahí: no cuentan como referencia
+            huerfanos = buscar_huerfanos(conn, ignorar_blobs_muertos=not aplicar)
+        finally:
+            conn.rollback()
+
+        bytes_huerfanos = bytes_liberados = 0
+        eliminados = 0
+        for lote in _lotes(huerfanos, tamaño_lote):
+            try:
+                tamaños = tamaño_large_objects(conn, lote)
+                borrados = eliminar_large_objects(conn, lote) if aplicar else []
+                if aplicar:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            except Exception as e:
+                conn.rollback()
+                raise Exception(f"❌ Error eliminando large objects huérfanos: {str(e)}")
+            eliminados += len(borrados)
+            if tamaños is None or bytes_huerfanos is None:
+                bytes_huerfanos = bytes_liberados = None
+            else:
+                bytes_huerfanos += sum(tamaños.values())
+                bytes_liberados += sum(tamaños.get(lo_oid, 0) for lo_oid in borrados)
+
+        vacuum_completados = vacuum(conn, esquemas) if hacer_vacuum and aplicar else 0
+
+        resultado = {
+            'blobs_podados': blobs_podados,
+            'huerfanos': len(huerfanos),
+            'eliminados': eliminados,
+            'bytes_huerfanos': bytes_huerfanos,
+            'bytes_liberados': bytes_liberados,
+            'aplicado': aplicar,
+            'vacuum': vacuum_completados,
+        }
+        _imprimir_resultado(resultado)
+        return resultado
+    finally:
+        conn.close()
+
+def _megas(total_bytes):
+    return "tamaño desconocido" if total_bytes is None else f"{total_bytes / 1024 / 1024:.2f} MB"
+
+def _imprimir_resultado(resultado):
+    podados = sum(resultado['blobs_podados'].values())
+    if resultado['aplicado']:
+        print(f"♻️ blobs_pemex: {podados} filas sin uso eliminadas")
+        print(f"✅ Large objects huérfanos: {resultado['eliminados']} de {resultado['huerfanos']} eliminados, "
+              f"{_megas(resultado['bytes_liberados'])} liberados")
+    else:
+        print(f"🔧 Simulacro: {podados} filas de blobs_pemex sin uso, {resultado['huerfanos']} large objects "
+              f"huérfanos ({_megas(resultado['bytes_huerfanos'])}); use --aplicar para eliminarlos")
+
+
+# ----------------- Línea de comandos -----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Eliminar large objects huérfanos de la base PEMEX")
+    parser.add_argument("connection_string")
+    parser.add_argument("--aplicar", action="store_true",
+                        help="eliminar de verdad (por defecto solo reporta)")
+    parser.add_argument("--lote", type=int, default=TAMAÑO_LOTE_UNLINK,
+                        help="large objects por transacción")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM (ANALYZE) de las tablas PEMEX y pg_largeobject al terminar")
+    parser.add_argument("--repetir-cada-horas", type=float, default=None,
+                        help="no terminar: repetir la recolección cada N horas")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            recolectar_huerfanos(args.connection_string, args.aplicar, args.lote, args.vacuum)
+        except Exception as e:
+            if args.repetir_cada_horas is None:
+                raise
+            # En modo programado un fallo no detiene las siguientes corridas
+            print(f"⚠️ Recolección fallida: {e}")
+        if args.repetir_cada_horas is None:
+            return 0
+        time.sleep(args.repetir_cada_horas * 3600)
+
+if __name__ == "__main__":
+    sys.exit(main())
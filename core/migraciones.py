@@ -0,0 +1,594 @@
+# core/migraciones.py
+"""
+Migraciones versionadas de las tablas PEMEX
+
+Cada esquema (public y usuario_<USUARIO>) tiene una tabla schema_version
+con las migraciones ya aplicadas. Las migraciones de MIGRACIONES se
+aplican en orden, una sola vez por esquema, dentro de una transacción y
+bajo un advisory lock (dos procesos que arrancan a la vez no chocan).
+Una migración que devuelve False (p. ej. sin permiso para instalar una
+extensión) no se registra y se reintenta en la siguiente verificación.
+
+En el proceso se recuerda qué esquemas ya están al día: después de la
+primera verificación (al arrancar o en el primer login del usuario) los
+métodos de consulta y guardado no emiten DDL ni consultas al catálogo.
+
+Las migraciones son idempotentes (IF NOT EXISTS) para que una base creada
+antes de este sistema se adopte sin intervención.
+
+Uso:
+    python -m core.migraciones "postgresql://..."           # public y usuarios
+    python -m core.migraciones "postgresql://..." --esquema usuario_JUAN
+    python -m core.migraciones "postgresql://..." --reconstruir-estadisticas
+"""
+import argparse
+import sys
+import threading
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+
+from core.db_pool import obtener_pool
+
+ESQUEMA_PUBLICO = "public"
+
+# Configuración de búsqueda de texto: español sin acentos (compartida por
+# todos los esquemas) y caracteres de OCR que se indexan por contrato
+CONFIG_BUSQUEDA = "public.es_unaccent"
+LIMITE_OCR_BUSQUEDA = 1000000
+
+# Zona horaria con la que se agrupan las estadísticas por día
+ZONA_HORARIA_ESTADISTICAS = "America/Mexico_City"
+
+
+# ----------------- Migraciones -----------------
+def _m001_tablas_base(cur, esquema):
+    """Tablas de contratos y archivos con sus índices originales"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contratos_pemex (
+            id BIGSERIAL PRIMARY KEY,
+            area VARCHAR(500) NOT NULL DEFAULT 'SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN',
+            numero_contrato VARCHAR(100) UNIQUE NOT NULL,
+            contratista VARCHAR(300) NOT NULL,
+            monto_contrato VARCHAR(100),
+            plazo_dias VARCHAR(50),
+            descripcion TEXT,
+            anexos JSONB,
+
+            lo_oid OID NOT NULL,
+            nombre_archivo VARCHAR(300) NOT NULL,
+            tipo_archivo VARCHAR(50),
+            tamaño_bytes BIGINT NOT NULL,
+            hash_sha256 VARCHAR(64) NOT NULL,
+
+            fecha_subida TIMESTAMPTZ DEFAULT NOW(),
+            usuario_subio VARCHAR(100) DEFAULT 'sistema',
+            procesado BOOLEAN DEFAULT TRUE,
+
+            CONSTRAINT check_tamaño_positivo CHECK (tamaño_bytes > 0)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS archivos_pemex (
+            id BIGSERIAL PRIMARY KEY,
+            contrato_id BIGINT NOT NULL REFERENCES contratos_pemex(id) ON DELETE CASCADE,
+            categoria VARCHAR(50) NOT NULL,
+            tipo_archivo VARCHAR(50),
+            lo_oid OID NOT NULL,
+            nombre_archivo VARCHAR(300) NOT NULL,
+            tamaño_bytes BIGINT NOT NULL,
+            hash_sha256 VARCHAR(64) NOT NULL,
+            fecha_subida TIMESTAMPTZ DEFAULT NOW(),
+            usuario_subio VARCHAR(100) DEFAULT 'sistema',
+            CONSTRAINT check_tamaño_archivo CHECK (tamaño_bytes > 0)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_numero ON contratos_pemex(numero_contrato)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_contratista ON contratos_pemex(contratista)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_fecha ON contratos_pemex(fecha_subida)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_contrato_id ON archivos_pemex(contrato_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_categoria ON archivos_pemex(categoria)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_archivos_fecha ON archivos_pemex(fecha_subida)")
+
+    if esquema == ESQUEMA_PUBLICO:
+        # Registro maestro de usuarios (solo en public)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS usuarios_registrados (
+                id SERIAL PRIMARY KEY,
+                usuario VARCHAR(100) UNIQUE NOT NULL,
+                esquema VARCHAR(150) NOT NULL,
+                fecha_registro TIMESTAMPTZ DEFAULT NOW(),
+                ultimo_login TIMESTAMPTZ,
+                estado VARCHAR(20) DEFAULT 'activo'
+            )
+        """)
+
+def _m002_columnas_numericas(cur, esquema):
+    """
+    Columnas numéricas normalizadas de monto y plazo con índices B-tree. El
+    texto original se conserva en monto_contrato / plazo_dias para mostrarlo.
+    """
+    cur.execute("ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS monto_contrato_num NUMERIC(18,2)")
+    cur.execute("ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS plazo_dias_num INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_monto_num ON contratos_pemex(monto_contrato_num)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_plazo_num ON contratos_pemex(plazo_dias_num)")
+
+def _m003_texto_ocr(cur, esquema):
+    """
+    Texto OCR del contrato y versión del extractor que produjo sus campos.
+    PostgreSQL comprime el texto fuera de la fila (TOAST), con lz4 si el
+    servidor lo soporta (14+) y pglz si no.
+    """
+    cur.execute("ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS texto_ocr TEXT")
+    cur.execute("ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS version_extractor INTEGER")
+
+    cur.execute("SAVEPOINT compresion_texto_ocr")
+    try:
+        cur.execute("""
+            SELECT attcompression FROM pg_attribute
+            WHERE attrelid = 'contratos_pemex'::regclass AND attname = 'texto_ocr'
+        """)
+        if cur.fetchone()[0] != 'l':
+            cur.execute("ALTER TABLE contratos_pemex ALTER COLUMN texto_ocr SET COMPRESSION lz4")
+        cur.execute("RELEASE SAVEPOINT compresion_texto_ocr")
+    except psycopg2.Error:
+        # Servidor sin soporte de lz4: se conserva la compresión por defecto
+        cur.execute("ROLLBACK TO SAVEPOINT compresion_texto_ocr")
+
+def _m004_blobs(cur, esquema):
+    """
+    blobs_pemex: cada contenido distinto (hash_sha256) con un solo large
+    object y cuántas filas de contratos_pemex / archivos_pemex lo usan
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS blobs_pemex (
+            hash_sha256 VARCHAR(64) PRIMARY KEY,
+            lo_oid OID NOT NULL,
+            tamaño_bytes BIGINT NOT NULL,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            fecha_creacion TIMESTAMPTZ DEFAULT NOW(),
+            CONSTRAINT check_referencias CHECK (referencias >= 0)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_hash ON contratos_pemex(hash_sha256)")
+
+def _crear_config_busqueda(cur):
+    """
+    Configuración public.es_unaccent: copia de spanish que quita acentos
+    (extensión unaccent) antes de sacar la raíz. Es global a la base: la
+    crea la primera migración que la necesita. Si no hay permiso para
+    instalar unaccent queda como spanish sin más (distingue acentos).
+    """
+    cur.execute("""
+        SELECT 1 FROM pg_ts_config c JOIN pg_namespace n ON n.oid = c.cfgnamespace
+        WHERE n.nspname = 'public' AND c.cfgname = 'es_unaccent'
+    """)
+    if cur.fetchone():
+        return
+
+    cur.execute("SAVEPOINT extension_unaccent")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent SCHEMA public")
+        cur.execute("RELEASE SAVEPOINT extension_unaccent")
+        # El diccionario unaccent vive en el esquema de la extensión
+        cur.execute("SELECT extnamespace::regnamespace::text FROM pg_extension WHERE extname = 'unaccent'")
+        esquema_unaccent = cur.fetchone()[0]
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT extension_unaccent")
+        print(f"⚠️ Sin extensión unaccent ({str(e).strip()}): la búsqueda distinguirá acentos")
+        esquema_unaccent = None
+
+    cur.execute("SAVEPOINT config_busqueda")
+    try:
+        cur.execute("CREATE TEXT SEARCH CONFIGURATION public.es_unaccent (COPY = pg_catalog.spanish)")
+        if esquema_unaccent:
+            cur.execute(sql.SQL("""
+                ALTER TEXT SEARCH CONFIGURATION public.es_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH {}, spanish_stem
+            """).format(sql.Identifier(esquema_unaccent, "unaccent")))
+        cur.execute("RELEASE SAVEPOINT config_busqueda")
+    except (psycopg2.errors.DuplicateObject, psycopg2.errors.UniqueViolation):
+        # Otro esquema la creó al mismo tiempo
+        cur.execute("ROLLBACK TO SAVEPOINT config_busqueda")
+
+def _m005_busqueda_texto(cur, esquema):
+    """
+    Columna tsvector generada (número y contratista con peso A, descripción
+    B, área C, texto OCR D) con índice GIN para buscar_texto(). Se usa una
+    columna generada y no un trigger: PostgreSQL la mantiene en cada
+    INSERT/UPDATE. El OCR se recorta para no pasar el límite de 1 MB de un
+    tsvector.
+    """
+    _crear_config_busqueda(cur)
+    cur.execute(sql.SQL("""
+        ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector({config}::regconfig, coalesce(numero_contrato, '')), 'A') ||
+            setweight(to_tsvector({config}::regconfig, coalesce(contratista, '')), 'A') ||
+            setweight(to_tsvector({config}::regconfig, coalesce(descripcion, '')), 'B') ||
+            setweight(to_tsvector({config}::regconfig, coalesce(area, '')), 'C') ||
+            setweight(to_tsvector({config}::regconfig, left(coalesce(texto_ocr, ''), {limite})), 'D')
+        ) STORED
+    """).format(config=sql.Literal(CONFIG_BUSQUEDA), limite=sql.Literal(LIMITE_OCR_BUSQUEDA)))
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_busqueda ON contratos_pemex USING GIN (busqueda_tsv)")
+
+def _m006_trigramas(cur, esquema):
+    """
+    Índices GIN de trigramas (pg_trgm) sobre numero_contrato y contratista:
+    sirven a ILIKE '%texto%' y a la búsqueda por similitud de
+    buscar_similares(). La extensión se instala en public; sin permiso para
+    instalarla se omiten los índices, ILIKE sigue con recorrido secuencial y
+    la migración queda pendiente (devuelve False) para reintentarla.
+    """
+    cur.execute("SAVEPOINT extension_pg_trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public")
+        cur.execute("RELEASE SAVEPOINT extension_pg_trgm")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT extension_pg_trgm")
+        print(f"⚠️ Sin extensión pg_trgm ({str(e).strip()}): no se crean índices de trigramas en {esquema}")
+        return False
+
+    # La clase de operadores vive en el esquema de la extensión
+    cur.execute("SELECT extnamespace::regnamespace::text FROM pg_extension WHERE extname = 'pg_trgm'")
+    clase_trgm = sql.SQL("{}.gin_trgm_ops").format(sql.Identifier(cur.fetchone()[0]))
+    for indice, columna in (
+        ("idx_contratos_numero_trgm", "numero_contrato"),
+        ("idx_contratos_contratista_trgm", "contratista"),
+    ):
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON contratos_pemex USING GIN ({} {})").format(
+            sql.Identifier(indice), sql.Identifier(columna), clase_trgm
+        ))
+
+def _m007_orden_keyset(cur, esquema):
+    """
+    Índice (fecha_subida DESC, id DESC) para listar_contratos_pagina: cada
+    página es un recorrido corto del índice a partir del cursor. Reemplaza
+    al índice de solo fecha_subida, que queda cubierto por este.
+    """
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_fecha_id ON contratos_pemex(fecha_subida DESC, id DESC)")
+    cur.execute("DROP INDEX IF EXISTS idx_contratos_fecha")
+
+def _m008_anexos_jsonb(cur, esquema):
+    """
+    Índice GIN jsonb_path_ops sobre anexos para el filtro anexos @> '["SSPA"]'.
+    Corrige además los anexos guardados como texto JSON dentro del JSONB
+    (una cadena '["A", "B"]' en lugar de la lista), que @> no encuentra.
+    """
+    cur.execute("""
+        UPDATE contratos_pemex
+        SET anexos = (anexos #>> '{}')::jsonb
+        WHERE jsonb_typeof(anexos) = 'string'
+          AND anexos #>> '{}' LIKE '[%]'
+    """)
+    if cur.rowcount:
+        print(f"🔧 {cur.rowcount} contratos con anexos doblemente codificados corregidos en {esquema}")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contratos_anexos ON contratos_pemex USING GIN (anexos jsonb_path_ops)")
+
+# ----------------- Estadísticas precalculadas -----------------
+# estadisticas_pemex guarda una fila por (dimension, clave):
+#   ('total', '')              totales del esquema
+#   ('contratista', nombre)    contratos, bytes y monto por contratista
+#   ('dia', 'AAAA-MM-DD')      contratos, bytes y monto por día de subida
+#   ('categoria', categoria)   archivos y bytes por categoría
+# Triggers por sentencia (con tablas de transición) suman los cambios de
+# cada INSERT/UPDATE/DELETE agrupados: un INSERT de 50 filas es un solo
+# UPSERT por clave y no 50, y un UPDATE que no cambia contratista, fecha,
+# tamaño ni monto (p. ej. version_extractor) no toca la tabla.
+
+def _sql_dia(columna):
+    return (f"COALESCE(to_char({columna} AT TIME ZONE '{ZONA_HORARIA_ESTADISTICAS}', 'YYYY-MM-DD'), "
+            f"'sin fecha')")
+
+# Suma a estadisticas_pemex los cambios de contratos (cambios: filas con signo +1/-1)
+_SQL_DELTA_CONTRATOS = f"""
+    INSERT INTO estadisticas_pemex AS e (dimension, clave, contratos, bytes_contratos, monto_total)
+    SELECT d.dimension, d.clave, SUM(c.signo), SUM(c.signo * c.tamaño_bytes),
+           SUM(c.signo * COALESCE(c.monto_contrato_num, 0))
+    FROM cambios c
+    CROSS JOIN LATERAL (VALUES
+        ('total', ''),
+        ('contratista', COALESCE(c.contratista, '')),
+        ('dia', {_sql_dia('c.fecha_subida')})
+    ) AS d(dimension, clave)
+    GROUP BY d.dimension, d.clave
+    HAVING SUM(c.signo) <> 0 OR SUM(c.signo * c.tamaño_bytes) <> 0
+        OR SUM(c.signo * COALESCE(c.monto_contrato_num, 0)) <> 0
+    ON CONFLICT (dimension, clave) DO UPDATE SET
+        contratos = e.contratos + EXCLUDED.contratos,
+        bytes_contratos = e.bytes_contratos + EXCLUDED.bytes_contratos,
+        monto_total = e.monto_total + EXCLUDED.monto_total
+"""
+
+_SQL_DELTA_ARCHIVOS = """
+    INSERT INTO estadisticas_pemex AS e (dimension, clave, archivos, bytes_archivos)
+    SELECT d.dimension, d.clave, SUM(c.signo), SUM(c.signo * c.tamaño_bytes)
+    FROM cambios c
+    CROSS JOIN LATERAL (VALUES ('total', ''), ('categoria', c.categoria)) AS d(dimension, clave)
+    GROUP BY d.dimension, d.clave
+    HAVING SUM(c.signo) <> 0 OR SUM(c.signo * c.tamaño_bytes) <> 0
+    ON CONFLICT (dimension, clave) DO UPDATE SET
+        archivos = e.archivos + EXCLUDED.archivos,
+        bytes_archivos = e.bytes_archivos + EXCLUDED.bytes_archivos
+"""
+
+_COLUMNAS_DELTA = {
+    'contratos_pemex': "contratista, fecha_subida, tamaño_bytes, monto_contrato_num",
+    'archivos_pemex': "contrato_id, categoria, tamaño_bytes",
+}
+
+def _funcion_trigger(tabla, operacion):
+    """Cuerpo PL/pgSQL del trigger por sentencia de 'tabla' para 'operacion'"""
+    columnas = _COLUMNAS_DELTA[tabla]
+    origenes = []
+    if operacion in ("UPDATE", "DELETE"):
+        origenes.append(f"SELECT {columnas}, -1 AS signo FROM viejas")
+    if operacion in ("INSERT", "UPDATE"):
+        origenes.append(f"SELECT {columnas}, 1 AS signo FROM nuevas")
+    cambios = " UNION ALL ".join(origenes)
+    delta = _SQL_DELTA_CONTRATOS if tabla == 'contratos_pemex' else _SQL_DELTA_ARCHIVOS
+    cuerpo = f"WITH cambios AS ({cambios}) {delta};"
+
+    # Contratos que pasan a tener archivos (o se quedan sin ninguno)
+    if tabla == 'archivos_pemex' and operacion == "INSERT":
+        cuerpo += """
+        UPDATE estadisticas_pemex SET contratos_con_archivos = contratos_con_archivos + (
+            SELECT COUNT(*) FROM (SELECT contrato_id, COUNT(*) AS n FROM nuevas GROUP BY contrato_id) x
+            WHERE x.n = (SELECT COUNT(*) FROM archivos_pemex a WHERE a.contrato_id = x.contrato_id)
+        ) WHERE dimension = 'total' AND clave = '';"""
+    elif tabla == 'archivos_pemex' and operacion == "DELETE":
+        cuerpo += """
+        UPDATE estadisticas_pemex SET contratos_con_archivos = contratos_con_archivos - (
+            SELECT COUNT(DISTINCT v.contrato_id) FROM viejas v
+            WHERE NOT EXISTS (SELECT 1 FROM archivos_pemex a WHERE a.contrato_id = v.contrato_id)
+        ) WHERE dimension = 'total' AND clave = '';"""
+
+    return f"""
+        BEGIN
+            {cuerpo}
+            RETURN NULL;
+        END
+    """
+
+def reconstruir_estadisticas(cur):
+    """
+    Recalcula estadisticas_pemex desde cero en el esquema del search_path.
+    Bloquea la escritura en contratos y archivos mientras tanto (las
+    lecturas siguen) para que ningún cambio se cuente dos veces o se pierda.
+    """
+    cur.execute("LOCK TABLE contratos_pemex, archivos_pemex IN SHARE MODE")
+    cur.execute("DELETE FROM estadisticas_pemex")
+    cur.execute("INSERT INTO estadisticas_pemex (dimension, clave) VALUES ('total', '')")
+    cur.execute(f"""
+        WITH cambios AS (
+            SELECT {_COLUMNAS_DELTA['contratos_pemex']}, 1 AS signo FROM contratos_pemex
+        ) {_SQL_DELTA_CONTRATOS}
+    """)
+    cur.execute(f"""
+        WITH cambios AS (
+            SELECT {_COLUMNAS_DELTA['archivos_pemex']}, 1 AS signo FROM archivos_pemex
+        ) {_SQL_DELTA_ARCHIVOS}
+    """)
+    cur.execute("""
+        UPDATE estadisticas_pemex
+        SET contratos_con_archivos = (SELECT COUNT(DISTINCT contrato_id) FROM archivos_pemex)
+        WHERE dimension = 'total' AND clave = ''
+    """)
+
+def _m009_estadisticas(cur, esquema):
+    """
+    Tabla estadisticas_pemex con los triggers que la mantienen al día y su
+    primer cálculo. Las funciones fijan el search_path del esquema donde se
+    crean (SET search_path FROM CURRENT), así cada esquema actualiza su tabla.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS estadisticas_pemex (
+            dimension VARCHAR(20) NOT NULL,
+            clave TEXT NOT NULL,
+            contratos BIGINT NOT NULL DEFAULT 0,
+            bytes_contratos BIGINT NOT NULL DEFAULT 0,
+            monto_total NUMERIC(20,2) NOT NULL DEFAULT 0,
+            archivos BIGINT NOT NULL DEFAULT 0,
+            bytes_archivos BIGINT NOT NULL DEFAULT 0,
+            contratos_con_archivos BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, clave)
+        )
+    """)
+    for tabla in ("contratos_pemex", "archivos_pemex"):
+        for operacion in ("INSERT", "UPDATE", "DELETE"):
+            funcion = f"estadisticas_{tabla}_{operacion.lower()}"
+            cur.execute(sql.SQL("""
+                CREATE OR REPLACE FUNCTION {funcion}() RETURNS trigger
+                LANGUAGE plpgsql SET search_path FROM CURRENT AS {cuerpo}
+            """).format(funcion=sql.Identifier(funcion), cuerpo=sql.Literal(_funcion_trigger(tabla, operacion))))
+
+            transiciones = {
+                "INSERT": "NEW TABLE AS nuevas",
+                "UPDATE": "OLD TABLE AS viejas NEW TABLE AS nuevas",
+                "DELETE": "OLD TABLE AS viejas",
+            }[operacion]
+            trigger = f"trg_{funcion}"
+            cur.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {}").format(
+                sql.Identifier(trigger), sql.Identifier(tabla)))
+            cur.execute(sql.SQL("""
+                CREATE TRIGGER {trigger} AFTER {operacion} ON {tabla}
+                REFERENCING {transiciones}
+                FOR EACH STATEMENT EXECUTE FUNCTION {funcion}()
+            """).format(
+                trigger=sql.Identifier(trigger), operacion=sql.SQL(operacion),
+                tabla=sql.Identifier(tabla), transiciones=sql.SQL(transiciones),
+                funcion=sql.Identifier(funcion),
+            ))
+    reconstruir_estadisticas(cur)
+
+def _m010_extraccion_original(cur, esquema):
+    """
+    Instantánea de lo que produjo el extractor (contratista, objeto, monto,
+    plazo, anexos). El reprocesamiento solo reemplaza un campo guardado si
+    sigue igual a ella; NULL en contratos anteriores = solo llenar vacíos.
+    """
+    cur.execute("ALTER TABLE contratos_pemex ADD COLUMN IF NOT EXISTS extraccion_original JSONB")
+
+def _m011_reintentar_trigramas(cur, esquema):
+    """
+    La migración 6 se registraba aunque no hubiera podido instalar pg_trgm.
+    Se repite (todo es IF NOT EXISTS) en los esquemas que ya la tenían
+    registrada; si sigue sin permiso queda pendiente como la 6.
+    """
+    return _m006_trigramas(cur, esquema)
+
+
+# (versión, descripción, función) en orden. Nunca cambiar ni reordenar una
+# migración publicada: agregar una nueva al final.
+MIGRACIONES = [
+    (1, "tablas base de contratos y archivos", _m001_tablas_base),
+    (2, "columnas numéricas de monto y plazo", _m002_columnas_numericas),
+    (3, "texto OCR y versión del extractor", _m003_texto_ocr),
+    (4, "blobs deduplicados por hash", _m004_blobs),
+    (5, "búsqueda de texto completo en español", _m005_busqueda_texto),
+    (6, "índices de trigramas para subcadenas y similitud", _m006_trigramas),
+    (7, "índice para paginación keyset de contratos", _m007_orden_keyset),
+    (8, "índice GIN de anexos y corrección de doble codificación", _m008_anexos_jsonb),
+    (9, "estadísticas precalculadas mantenidas por triggers", _m009_estadisticas),
+    (10, "instantánea de la extracción para no pisar correcciones", _m010_extraccion_original),
+    (11, "reintento de la extensión e índices de trigramas", _m011_reintentar_trigramas),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+# ----------------- Aplicación -----------------
+def aplicar_migraciones(conn, esquema=ESQUEMA_PUBLICO, crear_esquema=False):
+    """
+    Aplica en 'esquema' las migraciones pendientes, en una sola transacción
+    que se confirma al final. Retorna la lista de versiones aplicadas.
+    """
+    esquema = esquema or ESQUEMA_PUBLICO
+    cur = conn.cursor()
+    try:
+        # Serializa las migraciones del mismo esquema entre procesos
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"migraciones:{esquema}",))
+        if crear_esquema:
+            cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(esquema)))
+        # SET LOCAL: termina con la transacción y no altera el search_path del pool
+        cur.execute(sql.SQL("SET LOCAL search_path TO {}").format(sql.Identifier(esquema)))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                descripcion TEXT NOT NULL,
+                aplicada_en TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_version")
+        registradas = {fila[0] for fila in cur.fetchall()}
+
+        # Una migración que devuelve False no se registra: queda pendiente y se
+        # reintenta la próxima vez (aunque ya estén registradas las siguientes)
+        aplicadas = []
+        pendientes = []
+        for numero, descripcion, migracion in MIGRACIONES:
+            if numero in registradas:
+                continue
+            if migracion(cur, esquema) is False:
+                pendientes.append(numero)
+                continue
+            cur.execute(
+                "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                (numero, descripcion)
+            )
+            aplicadas.append(numero)
+
+        conn.commit()
+        for numero in aplicadas:
+            print(f"🔧 Migración {numero} aplicada en {esquema}")
+        for numero in pendientes:
+            print(f"⚠️ Migración {numero} pendiente en {esquema}: se reintentará")
+        return aplicadas
+
+    except Exception as e:
+        conn.rollback()
+        raise Exception(f"❌ Error migrando esquema {esquema}: {str(e)}")
+
+
+# ----------------- Esquemas al día en este proceso -----------------
+_AL_DIA = set()          # {(connection_string, esquema)}
+_AL_DIA_LOCK = threading.Lock()
+
+def esquema_al_dia(connection_string, esquema=ESQUEMA_PUBLICO):
+    return (connection_string, esquema or ESQUEMA_PUBLICO) in _AL_DIA
+
+def asegurar_esquema(connection_string, esquema=ESQUEMA_PUBLICO, crear_esquema=False):
+    """
+    Deja 'esquema' en la versión actual. Solo la primera llamada del proceso
+    por esquema toca la base; las siguientes solo revisan un set.
+    """
+    esquema = esquema or ESQUEMA_PUBLICO
+    clave = (connection_string, esquema)
+    if clave in _AL_DIA:
+        return []
+
+    with _AL_DIA_LOCK:
+        if clave in _AL_DIA:
+            return []
+        conn = obtener_pool(connection_string).obtener()
+        try:
+            aplicadas = aplicar_migraciones(conn, esquema, crear_esquema)
+        finally:
+            conn.close()
+        _AL_DIA.add(clave)
+        return aplicadas
+
+def olvidar_esquema(connection_string, esquema=ESQUEMA_PUBLICO):
+    """Vuelve a verificar el esquema en la próxima llamada (p. ej. si se borró)"""
+    with _AL_DIA_LOCK:
+        _AL_DIA.discard((connection_string, esquema or ESQUEMA_PUBLICO))
+
+
+# ----------------- Línea de comandos -----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplicar migraciones de las tablas PEMEX")
+    parser.add_argument("connection_string")
+    parser.add_argument("--esquema", default=None,
+                        help="solo este esquema (por defecto: public y todos los usuarios registrados)")
+    parser.add_argument("--reconstruir-estadisticas", action="store_true",
+                        help="recalcular estadisticas_pemex desde las tablas")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    if args.esquema:
+        esquemas = [args.esquema]
+    else:
+        # public primero: ahí vive el registro de usuarios
+        resultados[ESQUEMA_PUBLICO] = asegurar_esquema(args.connection_string)
+        conn = obtener_pool(args.connection_string).obtener()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT esquema FROM public.usuarios_registrados ORDER BY esquema")
+            esquemas = [fila[0] for fila in cur.fetchall()]
+        finally:
+            conn.close()
+
+    for esquema in esquemas:
+        resultados[esquema] = asegurar_esquema(args.connection_string, esquema)
+
+    for esquema, aplicadas in resultados.items():
+        estado = f"{len(aplicadas)} migraciones aplicadas" if aplicadas else "sin cambios"
+        print(f"✅ {esquema}: versión {VERSION_ACTUAL} ({estado})")
+
+    if args.reconstruir_estadisticas:
+        for esquema in resultados:
+            conn = obtener_pool(args.connection_string).obtener(esquema)
+            try:
+                reconstruir_estadisticas(conn.cursor())
+                conn.commit()
+                print(f"✅ {esquema}: estadísticas reconstruidas")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
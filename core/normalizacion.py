@@ -0,0 +1,164 @@
+# core/normalizacion.py
+"""
+Normalización de texto OCR en una sola pasada para la extracción
+
+A partir del texto original se generan tres vistas del mismo largo
+(carácter por carácter), de modo que una posición encontrada en una vale
+para las otras:
+
+- limpio:      espacios plegados (equivale a _clean_whitespace), caso original
+- clave:       limpio en mayúsculas y sin acentos, para patrones sensibles a
+               mayúsculas sin re.IGNORECASE ni clases como [ÁÉÍÓÚ]
+- mayusculas:  limpio en mayúsculas conservando acentos (valores de anexos)
+
+Los valores se cortan de "limpio" con las posiciones halladas en "clave",
+así se conservan mayúsculas y acentos originales. posicion_original()
+traduce una posición de "limpio" al texto original (antes de plegar espacios).
+
+Las tablas de plegado están precalculadas. Se aplican con upper() y
+reemplazos dirigidos (solo los caracteres presentes) en lugar de
+str.translate, que en CPython recorre carácter por carácter en cuanto el
+texto tiene acentos y resulta ~10 veces más lento.
+"""
+import re
+import unicodedata
+from bisect import bisect_right
+
+# ----------------- Tablas precalculadas -----------------
+# Acentos y diacríticos latinos -> letra base (ya en mayúsculas)
+TABLA_ACENTOS = {}
+for _codigo in range(0xC0, 0x250):
+    _caracter = chr(_codigo)
+    _base = unicodedata.normalize("NFD", _caracter)[0]
+    if _caracter.isupper() and _base.isascii() and _base.isalpha() and _base != _caracter:
+        TABLA_ACENTOS[_caracter] = _base.upper()
+
+# Equivalencias que re.IGNORECASE ya aplicaba (ı, İ, ſ, signo Kelvin)
+TABLA_ACENTOS.update({"İ": "I", "ı": "I", "ſ": "S", "K": "K"})
+
+# Caracteres cuya mayúscula ocupa más de un carácter (ß -> SS, ligaduras ﬁ -> FI).
+# Se dejan tal cual para que todas las vistas midan lo mismo.
+_EXPANSIBLES = "".join(
+    chr(c) for c in range(0x10000)
+    if not 0xD800 <= c <= 0xDFFF and len(chr(c).upper()) > 1
+)
+_PATRON_EXPANSIBLES = re.compile("([" + re.escape(_EXPANSIBLES) + "])")
+
+# Plegado de espacios
+_PATRON_ESPACIOS_REPETIDOS = re.compile(r" {2,}")
+_PATRON_SALTOS_REPETIDOS = re.compile(r"\n{3,}")
+# Las mismas reglas en un solo patrón (solo para reconstruir posiciones)
+_PATRON_PLEGADO = re.compile(r"(?:\r?\n){3,}|[ \t]{2,}|\t|\r\n")
+
+
+# ----------------- Funciones de plegado -----------------
+def limpiar_espacios(texto):
+    """
+    Equivale a: \\r\\n -> \\n, [ \\t]+ -> ' ', \\n{3,} -> \\n\\n y strip(),
+    pero cada paso solo se ejecuta si el texto lo necesita
+    """
+    if not texto:
+        return ""
+    if "\r" in texto:
+        texto = texto.replace("\r\n", "\n")
+    if "\t" in texto:
+        texto = texto.replace("\t", " ")
+    if "  " in texto:
+        texto = _PATRON_ESPACIOS_REPETIDOS.sub(" ", texto)
+    if "\n\n\n" in texto:
+        texto = _PATRON_SALTOS_REPETIDOS.sub("\n\n", texto)
+    return texto.strip()
+
+def mayusculas(texto):
+    """upper() que conserva el largo (los caracteres expansibles no cambian)"""
+    resultado = texto.upper()
+    if len(resultado) == len(texto):
+        return resultado
+    partes = _PATRON_EXPANSIBLES.split(texto)
+    # Las posiciones impares son los separadores capturados (expansibles)
+    return "".join(p if i % 2 else p.upper() for i, p in enumerate(partes))
+
+def plegar_acentos(texto_mayusculas):
+    """Quita acentos de un texto ya en mayúsculas usando TABLA_ACENTOS"""
+    if texto_mayusculas.isascii():
+        return texto_mayusculas
+    for acentuado, base in TABLA_ACENTOS.items():
+        if acentuado in texto_mayusculas:
+            texto_mayusculas = texto_mayusculas.replace(acentuado, base)
+    return texto_mayusculas
+
+def clave(texto):
+    """Vista de búsqueda: mayúsculas sin acentos, mismo largo que texto"""
+    return plegar_acentos(mayusculas(texto))
+
+
+# ----------------- Texto normalizado -----------------
+class TextoNormalizado:
+    """Texto OCR con sus vistas normalizadas y el mapa de posiciones al original"""
+
+    __slots__ = ("original", "limpio", "clave", "_mayusculas", "_mapa")
+
+    def __init__(self, original, limpio=None, vista_clave=None):
+        """limpio / vista_clave: vistas ya calculadas (p. ej. por partes)"""
+        self.original = original or ""
+        self.limpio = limpiar_espacios(self.original) if limpio is None else limpio
+        self.clave = clave(self.limpio) if vista_clave is None else vista_clave
+        self._mayusculas = None
+        self._mapa = None
+
+    @property
+    def mayusculas(self):
+        if self._mayusculas is None:
+            self._mayusculas = mayusculas(self.limpio)
+        return self._mayusculas
+
+    def __len__(self):
+        return len(self.limpio)
+
+    # ----------------- Mapa de posiciones -----------------
+    def _construir_mapa(self):
+        """
+        Puntos (posición en limpio, desplazamiento al original) donde cambia
+        el desplazamiento; se calcula solo si alguien lo pide
+        """
+        original = self.original
+        inicio = len(original) - len(original.lstrip())
+        puntos = []
+        desplazamientos = []
+        salida = 0
+        entrada = 0
+        inicio_salida = None
+
+        for m in _PATRON_PLEGADO.finditer(original):
+            if inicio_salida is None and m.start() >= inicio:
+                inicio_salida = salida + (inicio - entrada)
+            salida += m.start() - entrada
+            grupo = m.group(0)
+            if grupo == "\r\n":
+                salida += 1
+            elif grupo[0] in " \t":
+                salida += 1
+            else:
+                salida += 2
+            puntos.append(salida)
+            desplazamientos.append(m.end() - salida)
+            entrada = m.end()
+
+        if inicio_salida is None:
+            inicio_salida = salida + (inicio - entrada)
+
+        # Pasar de posiciones sin strip() a posiciones en limpio
+        self._mapa = ([p - inicio_salida for p in puntos], desplazamientos, inicio_salida)
+
+    def posicion_original(self, posicion):
+        """Posición en el texto original que corresponde a una posición de limpio"""
+        if self._mapa is None:
+            self._construir_mapa()
+        puntos, desplazamientos, inicio_salida = self._mapa
+        k = bisect_right(puntos, posicion) - 1
+        desplazamiento = desplazamientos[k] if k >= 0 else 0
+        return posicion + inicio_salida + desplazamiento
+
+    def fragmento_original(self, inicio, fin):
+        """Texto original (sin plegar espacios) entre dos posiciones de limpio"""
+        return self.original[self.posicion_original(inicio):self.posicion_original(fin)]
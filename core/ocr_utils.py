@@ -5,6 +5,8 @@ import re
 from pathlib import Path
 import os
 
+from core import perfilador
+
 try:
     import fitz  # PyMuPDF
     PYMUPDF_AVAILABLE = True
@@ -29,40 +31,81 @@ def pdf_to_text(file_path):
     except Exception as e:
         return f"[ERROR] {str(e)}"
 
+def iter_paginas_texto(file_path):
+    """
+    Generar el texto de cada página conforme se procesa, para poder extraer
+    datos mientras el OCR continúa. "\n\n".join(páginas) equivale a pdf_to_text
+    (los errores se generan como una página que empieza con "[ERROR]")
+    """
+    file_path = Path(file_path)
+    
+    if not file_path.exists():
+        yield "[ERROR] Archivo no encontrado"
+        return
+    
+    try:
+        if file_path.suffix.lower() == ".pdf":
+            yield from _iter_paginas_pdf(file_path)
+        else:
+            yield _process_image(file_path)
+            
+    except Exception as e:
+        yield f"[ERROR] {str(e)}"
+
 def _process_pdf(file_path):
     """Procesar archivo PDF"""
+    text_parts = list(_iter_paginas_pdf(file_path))
+    if text_parts and text_parts[-1].startswith("[ERROR]"):
+        return text_parts[-1]
+    return "\n\n".join(text_parts)
+
+def _iter_paginas_pdf(file_path):
+    """Generar el texto de cada página del PDF (extracción directa u OCR)"""
     if not PYMUPDF_AVAILABLE:
-        return "[ERROR] PyMuPDF no disponible: pip install pymupdf"
+        yield "[ERROR] PyMuPDF no disponible: pip install pymupdf"
+        return
     
     try:
         doc = fitz.open(file_path)
-        text_parts = []
+    except Exception as e:
+        yield f"[ERROR] Procesando PDF: {str(e)}"
+        return
+    
+    try:
+        con_texto = False
         
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
             
             # Intentar extracción directa primero
-            text = page.get_text().strip()
+            with perfilador.medir("ocr.texto_directo"):
+                text = page.get_text().strip()
             if text:
-                text_parts.append(f"--- Página {page_num + 1} ---\n{text}")
+                con_texto = True
+                yield f"--- Página {page_num + 1} ---\n{text}"
             else:
                 # Fallback a OCR
-                ocr_text = _extract_with_ocr(page)
+                with perfilador.medir("ocr.tesseract_pagina"):
+                    ocr_text = _extract_with_ocr(page)
                 if ocr_text:
-                    text_parts.append(f"--- Página {page_num + 1} (OCR) ---\n{ocr_text}")
+                    con_texto = True
+                    yield f"--- Página {page_num + 1} (OCR) ---\n{ocr_text}"
         
-        doc.close()
-        return "\n\n".join(text_parts) if text_parts else "[INFO] PDF sin texto extraíble"
+        if not con_texto:
+            yield "[INFO] PDF sin texto extraíble"
         
     except Exception as e:
-        return f"[ERROR] Procesando PDF: {str(e)}"
+        yield f"[ERROR] Procesando PDF: {str(e)}"
+    finally:
+        doc.close()
 
 def _process_image(file_path):
     """Procesar archivo de imagen"""
     try:
         img = Image.open(file_path)
         custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÁÉÍÓÚáéíóúÑñ.,;:()$-/ '
-        text = pytesseract.image_to_string(img, lang="spa", config=custom_config)
+        with perfilador.medir("ocr.tesseract_imagen"):
+            text = pytesseract.image_to_string(img, lang="spa", config=custom_config)
         return text.strip() if text.strip() else "[INFO] Imagen sin texto detectable"
     except Exception as e:
         return f"[ERROR] Procesando imagen: {str(e)}"
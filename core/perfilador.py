@@ -0,0 +1,183 @@
+# core/perfilador.py
+"""
+Perfilador opcional de la extracción de datos
+
+Registra tiempo de pared y número de coincidencias por extractor, por
+patrón regex y por etapa de la página (OCR, post-procesamiento), y los
+acumula en un registro único del proceso. Desactivado por defecto: cada
+punto instrumentado solo revisa una variable global.
+
+Activación:
+    PERFILAR_EXTRACCION=1 streamlit run INICIO.py
+    o bien perfilador.activar() desde código
+
+Reporte:
+    perfilador.imprimir_reporte()          # tabla ordenada por tiempo total
+    perfilador.reporte(ordenar_por="llamadas")
+"""
+import functools
+import os
+import threading
+import time
+
+# Variable global consultada en cada punto instrumentado
+ACTIVO = os.environ.get("PERFILAR_EXTRACCION", "").lower() in ("1", "true", "si", "sí")
+
+_registro = {}                 # nombre -> [llamadas, total_s, max_s, coincidencias]
+_lock = threading.Lock()
+_nombres_patrones = {}         # texto del patrón -> nombre legible
+
+
+# ----------------- Control -----------------
+def activar():
+    global ACTIVO
+    ACTIVO = True
+
+def desactivar():
+    global ACTIVO
+    ACTIVO = False
+
+def activo():
+    return ACTIVO
+
+def reiniciar():
+    """Borra lo acumulado"""
+    with _lock:
+        _registro.clear()
+
+
+# ----------------- Registro -----------------
+def registrar(nombre, segundos, coincidencias=0):
+    """Acumula una medición en el registro del proceso"""
+    with _lock:
+        entrada = _registro.get(nombre)
+        if entrada is None:
+            _registro[nombre] = [1, segundos, segundos, coincidencias]
+        else:
+            entrada[0] += 1
+            entrada[1] += segundos
+            if segundos > entrada[2]:
+                entrada[2] = segundos
+            entrada[3] += coincidencias
+
+def nombrar_patrones(espacio):
+    """
+    Asocia los patrones compilados de un módulo (p. ej. globals()) con su
+    nombre de variable, para que el reporte muestre _PATRON_MONTO en lugar
+    del texto de la regex
+    """
+    for nombre, valor in espacio.items():
+        patron = getattr(valor, "pattern", None)
+        if isinstance(patron, str) and nombre.startswith(("_PATRON_", "_FIN_")):
+            _nombres_patrones[patron] = nombre
+
+def registrar_patron(patron, segundos, coincidencias):
+    """Medición de un patrón regex (los dinámicos se nombran por su texto)"""
+    nombre = _nombres_patrones.get(patron.pattern)
+    if nombre is None:
+        texto = patron.pattern
+        nombre = texto if len(texto) <= 40 else texto[:37] + "..."
+    registrar(f"patron.{nombre}", segundos, coincidencias)
+
+def _contar(resultado):
+    """Coincidencias de un resultado de extractor: elementos o valores no vacíos"""
+    if isinstance(resultado, (list, set, dict)):
+        return len(resultado)
+    if isinstance(resultado, tuple):
+        return sum(1 for valor in resultado if valor)
+    return 1 if resultado else 0
+
+
+# ----------------- Instrumentación -----------------
+class _Medicion:
+    """Context manager que registra el tiempo del bloque"""
+
+    __slots__ = ("nombre", "inicio", "coincidencias")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.coincidencias = 0
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar(self.nombre, time.perf_counter() - self.inicio, self.coincidencias)
+        return False
+
+class _SinMedicion:
+    """Context manager vacío (perfilador desactivado)"""
+
+    __slots__ = ()
+    coincidencias = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, nombre, valor):
+        # medicion.coincidencias = n se ignora cuando no se perfila
+        pass
+
+_SIN_MEDICION = _SinMedicion()
+
+def medir(nombre):
+    """
+    with perfilador.medir("pagina.plazo_regex") as m:
+        ...
+        m.coincidencias = 1
+    """
+    if not ACTIVO:
+        return _SIN_MEDICION
+    return _Medicion(nombre)
+
+def perfilar(nombre):
+    """Decorador: registra tiempo y coincidencias de cada llamada a la función"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not ACTIVO:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            resultado = funcion(*args, **kwargs)
+            registrar(nombre, time.perf_counter() - inicio, _contar(resultado))
+            return resultado
+        return envoltura
+    return decorador
+
+
+# ----------------- Reporte -----------------
+def reporte(ordenar_por="total_ms"):
+    """Lista de mediciones acumuladas, ordenada de mayor a menor"""
+    with _lock:
+        filas = [
+            {
+                "nombre": nombre,
+                "llamadas": llamadas,
+                "total_ms": total * 1000,
+                "promedio_ms": total * 1000 / llamadas,
+                "max_ms": maximo * 1000,
+                "coincidencias": coincidencias,
+            }
+            for nombre, (llamadas, total, maximo, coincidencias) in _registro.items()
+        ]
+    return sorted(filas, key=lambda fila: fila[ordenar_por], reverse=True)
+
+def formatear_reporte(ordenar_por="total_ms", limite=None):
+    filas = reporte(ordenar_por)[:limite]
+    if not filas:
+        return "ℹ️ Sin mediciones (¿perfilador desactivado?)"
+    lineas = [f"{'MEDICIÓN':<48} {'LLAMADAS':>8} {'TOTAL ms':>10} {'PROM ms':>9} {'MAX ms':>9} {'COINC':>7}"]
+    for f in filas:
+        lineas.append(
+            f"{f['nombre'][:48]:<48} {f['llamadas']:>8} {f['total_ms']:>10.2f} "
+            f"{f['promedio_ms']:>9.3f} {f['max_ms']:>9.2f} {f['coincidencias']:>7}"
+        )
+    return "\n".join(lineas)
+
+def imprimir_reporte(ordenar_por="total_ms", limite=None):
+    print("=== PERFIL DE EXTRACCIÓN ===")
+    print(formatear_reporte(ordenar_por, limite))
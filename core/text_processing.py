@@ -1,184 +1,504 @@
 # core/text_processing.py
 import re
-import json
-from pathlib import Path
+import threading
+import time
+from decimal import Decimal, InvalidOperation
 
-# Base inicial de anexos conocidos (almacenada en memoria)
-BASE_ANEXOS = [
-    "A", "B", "B-1", "C", "CN", "E", "F", "I", "SSPA", "PACMA",
-    "AP", "MMRDD", "GNR", "PUE", "BDE", "GARANTÍAS", "FORMA", "DT-9",
-    "II", "IV", "O"
-]
+from core import perfilador
+from core.anexos_vocabulario import ANEXOS_BASE, obtener_vocabulario
+from core.normalizacion import TextoNormalizado, clave, limpiar_espacios
+
+# Base inicial de anexos conocidos (se mantiene por compatibilidad)
+BASE_ANEXOS = ANEXOS_BASE
 
 # Área fija (según tu requerimiento)
 AREA_FIJA = "SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN"
 
-# Cache en memoria para anexos conocidos (sin archivos locales)
-_ANEXOS_CONOCIDOS_CACHE = set(BASE_ANEXOS)
+# Presupuesto de tiempo por documento (segundos). Todos los patrones son de
+# tiempo lineal; el presupuesto protege contra documentos gigantes: al
+# agotarse se omiten los patrones restantes y se devuelve lo ya extraído.
+PRESUPUESTO_EXTRACCION_S = 10.0
+
+# Versión de las reglas de extracción. Incrementarla al cambiar patrones o
+# extractores: los contratos guardados con una versión anterior se vuelven a
+# extraer desde su texto OCR (ContratosManager.reprocesar_contratos).
+VERSION_EXTRACTOR = 1
+
+# ----------------- Patrones precompilados -----------------
+# Todas las repeticiones que pueden retroceder (backtracking) están acotadas
+# por ventanas fijas, y los bloques "cabecera ... terminador" se buscan en dos
+# pasos (ver _buscar_bloque) para no reintentar el cuerpo desde cada inicio.
+#
+# Los patrones de campos se aplican sobre la vista "clave" del texto
+# (mayúsculas sin acentos, ver core/normalizacion.py): son sensibles a
+# mayúsculas y no necesitan IGNORECASE ni clases [ÁÉÍÓÚ]. Las palabras clave
+# toleran las confusiones de OCR O/0 e I/1. Los valores se cortan del texto
+# limpio en las mismas posiciones, con su escritura original.
+
+_PATRON_CONTRATO_64 = re.compile(r'\b(64\d{6,7})\b')
+
+_PATRON_CONTRATO_CONTRATISTA = re.compile(
+    r'C[O0]NTRAT[O0]\s{0,10}(?:NUMER[O0]|N\.|N[O0]\.|N)\s{0,10}[:\-]?\s{0,10}(64\d{6,7}|\d{6,10})\s{1,10}([A-Z0-9\.,\s&\-]{5,200}?)\s{1,10}(?:H[O0]JA|PAG[I1]NA|\bH[O0]JA\b|\bPAG[I1]NA\b|\bDE\b)'
+)
+
+_PATRON_CONTRATISTA_CAMPO = re.compile(
+    r'(?:PR[O0]VEED[O0]R|RAZ[O0]N\s+S[O0]C[I1]AL|C[O0]NTRAT[I1]STA)\s{0,10}[:\-]\s{0,10}([^\n]{5,200})'
+)
+
+# Objeto - Patrón 1: sección numerada (4. OBJETO)
+_PATRON_OBJETO_NUMERADO = re.compile(
+    r'(?:\n|^)\s{0,10}4\.\s{0,10}.{0,120}?[O0]BJET[O0][^\n]*\n',
+    re.DOTALL
+)
+_FIN_OBJETO_NUMERADO = re.compile(r'\n\s*(?:5\.|\d+\.)|\n\s*M[O0]NT[O0]|\n\s*CLAUSULA|\n{2,}')
+
+# Objeto - Patrón 2: palabra clave OBJETO
+_PATRON_OBJETO_CLAVE = re.compile(r'[O0]BJET[O0](?:\s+DEL\s+C[O0]NTRAT[O0])?[^\n]*[:\-]?\s*')
+_FIN_OBJETO_CLAVE = re.compile(r'\n\s*\d+\.|\n{2,}|M[O0]NT[O0]|PLAZ[O0]')
+
+_PATRON_COMILLAS = re.compile(r'[“"«]([^”"»]+)[”"»]')
+_PATRON_ESPACIOS = re.compile(r'\s+')
+
+_PATRON_MONTO = re.compile(r'\$\s{0,10}([\d{1,3}\.,]{1,}\d{0,2})(?:\s*M\.?N\.?)?')
+# Monto en texto: palabra clave y después la primera cifra que le sigue
+_PATRON_MONTO_CLAVE = re.compile(r'M[O0]NT[O0]|[I1]MP[O0]RTE|VAL[O0]R')
+_PATRON_MONTO_CIFRA = re.compile(r'\d[\d,]*\.?\d*')
+
+# Plazo: cabecera "11. PLAZO" y la primera mención de días en esa línea o al
+# inicio de la siguiente (hasta _VENTANA_PLAZO caracteres después del salto)
+_VENTANA_PLAZO = 80
+_PATRON_PLAZO_SECCION = re.compile(r'11\.\s{0,10}PLAZ[O0]')
+_PATRON_PLAZO_DIAS = re.compile(r'(\d{1,4})\s{0,10}D[I1]AS')
+_PATRON_PLAZO_CONTEXTO = re.compile(r'PLAZ[O0]\s{0,10}(?:DE\s+)?(\d{1,4})\s{0,10}D[I1]A')
+
+# Anexos: se buscan sobre el texto en mayúsculas con acentos (los nombres de
+# anexo conservan su escritura, p. ej. "GARANTÍAS"). Un nombre entre comillas
+# puede tener hasta 80 caracteres
+_PATRON_ANEXO_COMILLAS = re.compile(r'ANEXO\s{1,10}[“”"\'´`]{1,5}\s{0,10}([A-Z0-9\-]{1,80})\s{0,10}[“”"\'´`]{1,5}')
+_PATRON_ANEXO_SIMPLE = re.compile(r'ANEXO\s+([A-Z]{1,3}(?:-[A-Z0-9]{1,3})?)(?:\s|\.|\,|\:|$)')
+_PATRON_FORMATO_ANEXO = re.compile(r'^[A-Z]{1,3}(?:-[A-Z0-9]{1,3})?$')
+_PATRON_INTEGRIDAD = re.compile(r'2\.\s{0,10}INTEGRIDAD\s+DEL\s+CONTRATO', re.IGNORECASE)
+_FIN_INTEGRIDAD = re.compile(r'\n\s*\d+\.')
+_PATRON_INTEGRIDAD_ALT = re.compile(r'INTEGRIDAD\s+DEL\s+CONTRATO', re.IGNORECASE)
+_FIN_INTEGRIDAD_ALT = re.compile(r'\n{2,}|\n\s*\d+\.')
+_PATRON_ANEXO_INTEGRIDAD = re.compile(r'ANEXO[“"\'\s]{0,10}([A-Z0-9\-]+)[”"\'\s]*', re.IGNORECASE)
+
+# Nombres legibles de los patrones en el reporte del perfilador
+perfilador.nombrar_patrones(globals())
+
+# ----------------- Presupuesto de tiempo -----------------
+_presupuesto = threading.local()
+
+def _iniciar_presupuesto(segundos):
+    """Fija el límite de tiempo del documento actual (por hilo)"""
+    _presupuesto.limite = time.monotonic() + segundos if segundos else None
+    _presupuesto.agotado = False
+
+def _presupuesto_agotado():
+    limite = getattr(_presupuesto, 'limite', None)
+    if limite is None:
+        return False
+    if time.monotonic() > limite:
+        if not _presupuesto.agotado:
+            _presupuesto.agotado = True
+            print("⚠️ Presupuesto de extracción agotado: se omiten los patrones restantes")
+        return True
+    return False
+
+def _buscar(patron, texto, pos=0):
+    """re.search respetando el presupuesto del documento"""
+    if _presupuesto_agotado():
+        return None
+    if perfilador.ACTIVO:
+        inicio = time.perf_counter()
+        m = patron.search(texto, pos)
+        perfilador.registrar_patron(patron, time.perf_counter() - inicio, 1 if m else 0)
+        return m
+    return patron.search(texto, pos)
+
+def _buscar_todos(patron, texto):
+    """re.findall respetando el presupuesto del documento"""
+    if _presupuesto_agotado():
+        return []
+    if perfilador.ACTIVO:
+        inicio = time.perf_counter()
+        encontrados = patron.findall(texto)
+        perfilador.registrar_patron(patron, time.perf_counter() - inicio, len(encontrados))
+        return encontrados
+    return patron.findall(texto)
+
+def _iterar(patron, texto, pos=0):
+    """re.finditer respetando el presupuesto del documento"""
+    while True:
+        m = _buscar(patron, texto, pos)
+        if not m:
+            return
+        yield m
+        pos = m.end() if m.end() > m.start() else m.end() + 1
+
+def _buscar_bloque(texto, cabecera, fin):
+    """
+    Equivale a cabecera(.*?)(?=fin) con DOTALL, en tiempo lineal:
+    primero la cabecera y después el primer terminador a partir de ella.
+    Si no hay terminador después de la primera cabecera tampoco lo hay
+    después de las siguientes, así que no se reintenta desde otros inicios.
+    Retorna las posiciones (inicio, fin) del bloque, válidas en cualquier
+    vista del mismo texto normalizado.
+    """
+    m = _buscar(cabecera, texto)
+    if not m:
+        return None
+    t = _buscar(fin, texto, m.end())
+    if not t:
+        return None
+    return m.end(), t.start()
 
 # ----------------- Helpers -----------------
 def _clean_whitespace(text):
     """Limpia espacios en blanco y normaliza el texto"""
-    if not text:
-        return ""
-    
-    text = re.sub(r'\r\n', '\n', text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
+    return limpiar_espacios(text)
+
+def _normalizado(text):
+    """Acepta texto (se normaliza una vez) o un TextoNormalizado ya preparado"""
+    if isinstance(text, TextoNormalizado):
+        return text
+    return TextoNormalizado(text)
 
 def _agregar_anexo_conocido(anexo):
-    """Agrega un anexo a la cache en memoria (sin guardar en archivos)"""
-    if anexo and anexo not in _ANEXOS_CONOCIDOS_CACHE:
-        _ANEXOS_CONOCIDOS_CACHE.add(anexo.upper())
-        return True
-    return False
+    """Agrega un anexo al vocabulario compartido (persistido incrementalmente)"""
+    return obtener_vocabulario().agregar(anexo)
 
 def obtener_anexos_conocidos():
     """Retorna la lista de anexos conocidos (desde memoria)"""
-    return sorted(list(_ANEXOS_CONOCIDOS_CACHE))
+    return obtener_vocabulario().obtener()
+
+# ----------------- Normalización numérica -----------------
+# Máximo representable en NUMERIC(18,2)
+MONTO_MAXIMO = Decimal("9999999999999999.99")
+_PATRON_NO_CIFRA = re.compile(r'[^\d.,]')
+# Plazo: grupos de miles ("1,200", "1 200") o una cifra simple
+_PATRON_ENTERO = re.compile(r'(?<!\d)(\d{1,3}(?:[ .,]\d{3})+|\d+)(?![\d])')
+PLAZO_MAXIMO = 99999
+
+def _sin_miles(parte, separador):
+    """
+    '1,500,000' -> '1500000'. None si los grupos no son de miles (el primero
+    de 1 a 3 dígitos sin cero inicial, los demás de exactamente 3)
+    """
+    if separador not in parte:
+        return parte
+    grupos = parte.split(separador)
+    if not 1 <= len(grupos[0]) <= 3 or grupos[0].startswith('0'):
+        return None
+    if any(len(grupo) != 3 for grupo in grupos[1:]):
+        return None
+    return ''.join(grupos)
+
+def normalizar_monto(valor):
+    """
+    Convierte un monto de texto ("$1,500,000.00 M.N.", "1.500.000,00",
+    "$12.345") a Decimal con dos decimales. Un separador único seguido de 1
+    o 2 dígitos es decimal; seguido de exactamente 3, de miles. Retorna None
+    si no hay cifra utilizable o si es ambigua ("1.2345", "1,23,456"), antes
+    que guardar un valor equivocado.
+    """
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, (int, float, Decimal)):
+        cifra = str(valor)
+    else:
+        cifra = _PATRON_NO_CIFRA.sub('', str(valor)).strip('.,')
+        if not cifra:
+            return None
+
+        ultima_coma = cifra.rfind(',')
+        ultimo_punto = cifra.rfind('.')
+        if ultima_coma >= 0 and ultimo_punto >= 0:
+            # El último separador es el decimal y el otro el de miles
+            decimal, miles = (',', '.') if ultima_coma > ultimo_punto else ('.', ',')
+            entero, fraccion = cifra.rsplit(decimal, 1)
+            entero = None if decimal in entero else _sin_miles(entero, miles)
+        elif ultima_coma >= 0 or ultimo_punto >= 0:
+            separador = ',' if ultima_coma >= 0 else '.'
+            entero, _, fraccion = cifra.rpartition(separador)
+            if cifra.count(separador) == 1 and len(fraccion) in (1, 2):
+                # Decimal: "1500,5", "1500.50"
+                pass
+            else:
+                # Miles: "12.345", "1,500,000"
+                entero, fraccion = _sin_miles(cifra, separador), ""
+        else:
+            entero, fraccion = cifra, ""
+        if entero is None:
+            return None
+        cifra = f"{entero}.{fraccion}" if fraccion else entero
+
+    try:
+        monto = Decimal(cifra).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+    if not monto.is_finite() or abs(monto) > MONTO_MAXIMO:
+        return None
+    return monto
+
+def normalizar_plazo(valor):
+    """
+    Convierte un plazo ("180", "180 DÍAS", "1,200", "1 200 días") a entero
+    de días; None si no hay cifra o no cabe en PLAZO_MAXIMO
+    """
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, int):
+        return valor
+    m = _PATRON_ENTERO.search(str(valor))
+    if not m:
+        return None
+    dias = int(re.sub(r'\D', '', m.group(1)))
+    return dias if dias <= PLAZO_MAXIMO else None
 
 # ----------------- Extracción específica -----------------
+def _grupo(texto, m, n):
+    """Valor del grupo n de una coincidencia en la vista clave, con la escritura original"""
+    return texto[m.start(n):m.end(n)]
+
+@perfilador.perfilar("extractor.contrato_contratista")
 def _extract_contrato_and_contratista(text):
     """Extrae número de contrato y contratista del texto"""
+    t = _normalizado(text)
     contrato = ""
     contratista = ""
 
     # Patrón para número de contrato PEMEX (64XXXXXXX)
-    m = re.search(r'\b(64\d{6,7})\b', text)
+    m = _buscar(_PATRON_CONTRATO_64, t.clave)
     if m:
         contrato = m.group(1)
 
     # Patrón mejorado para contrato y contratista
-    m = re.search(
-        r'Contrato\s*(?:N(?:ú|u)mero|N\.|NO\.|N)\s*[:\-]?\s*(64\d{6,7}|\d{6,10})\s+([A-ZÁÉÍÓÚÑ0-9\.,\s&\-]{5,200}?)\s+(?:Hoja|Página|\bHoja\b|\bPágina\b|\bDE\b)',
-        text,
-        re.IGNORECASE
-    )
+    m = _buscar(_PATRON_CONTRATO_CONTRATISTA, t.clave)
     if m:
         if not contrato:
             contrato = m.group(1).strip()
-        contratista = m.group(2).strip()
+        contratista = _grupo(t.limpio, m, 2).strip()
 
     # Búsqueda contextual si no se encontró contratista
+    # (línea siguiente a la primera aparición del número de contrato)
     if not contratista and contrato:
-        pattern = rf'.{{0,80}}{re.escape(contrato)}[^\n]*\n([^\n]{{5,200}})'
-        m2 = re.search(pattern, text, re.IGNORECASE)
+        pattern = re.compile(rf'{re.escape(contrato)}[^\n]{{0,300}}\n([^\n]{{5,200}})')
+        m2 = _buscar(pattern, t.clave)
         if m2:
-            candidate = m2.group(1).strip()
+            candidate = _grupo(t.limpio, m2, 1).strip()
             if len(candidate) > 4:
                 contratista = candidate.split('Hoja')[0].strip()
 
     # Búsqueda por campos específicos
     if not contratista:
-        m3 = re.search(r'(?:PROVEEDOR|RAZ[ÓO]N\s+SOCIAL|CONTRATISTA)\s*[:\-]\s*([^\n]{5,200})', text, re.IGNORECASE)
+        m3 = _buscar(_PATRON_CONTRATISTA_CAMPO, t.clave)
         if m3:
-            contratista = m3.group(1).strip()
+            contratista = _grupo(t.limpio, m3, 1).strip()
 
     return contrato or "", contratista or ""
 
+@perfilador.perfilar("extractor.objeto")
 def _extract_objeto(text):
     """Extrae el objeto del contrato"""
+    t = _normalizado(text)
     # Patrón 1: Buscar por numeración (4. OBJETO)
-    m = re.search(r'(?:\n|^)\s*4\.\s*.*?OBJETO[^\n]*\n(.*?)(?=\n\s*(?:5\.|\d+\.)|\n\s*MONTO|\n\s*CL[AÁ]USULA|\n{2,})', text, re.IGNORECASE | re.DOTALL)
-    if not m:
+    bloque = _buscar_bloque(t.clave, _PATRON_OBJETO_NUMERADO, _FIN_OBJETO_NUMERADO)
+    if bloque is None:
         # Patrón 2: Buscar por palabra clave OBJETO
-        m = re.search(r'OBJETO(?:\s+DEL\s+CONTRATO)?[^\n]*[:\-]?\s*(.*?)(?=\n\s*\d+\.|\n{2,}|MONTO|PLAZO)', text, re.IGNORECASE | re.DOTALL)
+        bloque = _buscar_bloque(t.clave, _PATRON_OBJETO_CLAVE, _FIN_OBJETO_CLAVE)
     
-    if m:
-        objeto = m.group(1).strip()
-        # Extraer texto entre comillas si existe
-        q = re.search(r'[“"«]([^”"»]+)[”"»]', objeto)
-        if q:
-            return q.group(1).strip()
-        # Limpiar espacios extra
-        objeto = re.sub(r'\s+', ' ', objeto)
-        return objeto.strip()
+    if bloque is not None:
+        inicio, fin = bloque
+        return _limpiar_objeto(t.limpio[inicio:fin])
     return ""
 
+def _limpiar_objeto(objeto):
+    """Normaliza el bloque del objeto: texto entre comillas o espacios compactados"""
+    objeto = objeto.strip()
+    # Extraer texto entre comillas si existe
+    q = _buscar(_PATRON_COMILLAS, objeto)
+    if q:
+        return q.group(1).strip()
+    # Limpiar espacios extra
+    objeto = _PATRON_ESPACIOS.sub(' ', objeto)
+    return objeto.strip()
+
+@perfilador.perfilar("extractor.monto")
 def _extract_monto(text):
     """Extrae el monto del contrato"""
+    t = _normalizado(text)
     # Patrón para formato $ XXX,XXX.XX
-    m = re.search(r'\$\s*([\d{1,3}\.,]{1,}\d{0,2})(?:\s*M\.?N\.?)?', text, re.IGNORECASE)
+    m = _buscar(_PATRON_MONTO, t.clave)
     if m:
-        val = m.group(1).strip()
-        val = val.replace(' ', '')
-        return f"${val}"
+        return _formatear_monto(m)
     
     # Patrón alternativo para montos en texto
-    m2 = re.search(r'(?:MONTO|IMPORTE|VALOR)[^\d]*(\$?\s*[\d,]+\.?\d*)', text, re.IGNORECASE)
+    # (si no hay cifra después de la primera palabra clave no la hay después de ninguna)
+    m2 = _buscar(_PATRON_MONTO_CLAVE, t.clave)
     if m2:
-        return m2.group(1).strip()
+        cifra = _buscar(_PATRON_MONTO_CIFRA, t.clave, m2.end())
+        if cifra:
+            return cifra.group(0).strip()
     
     return ""
 
+def _formatear_monto(m):
+    """Monto con signo de pesos a partir de una coincidencia de _PATRON_MONTO"""
+    val = m.group(1).strip()
+    val = val.replace(' ', '')
+    return f"${val}"
+
+@perfilador.perfilar("extractor.plazo")
 def _extract_plazo(text):
     """Extrae el plazo en días del contrato"""
+    t = _normalizado(text)
     # Patrón 1: Buscar en sección 11. PLAZO
-    m = re.search(r'11\.\s*PLAZO[^\n]*?(?:es\s+de\s+)?\s*(\d{1,4})\s*(?:D[IÍ]AS|DIAS)', text, re.IGNORECASE)
+    m = _buscar_plazo_seccion(t.clave)
     if m:
         return m.group(1)
     
     # Patrón 2: Buscar cualquier mención de días
-    m2 = re.search(r'(\d{1,4})\s*(?:D[IÍ]AS|DIAS)', text, re.IGNORECASE)
+    m2 = _buscar(_PATRON_PLAZO_DIAS, t.clave)
     if m2:
         return m2.group(1)
     
     # Patrón 3: Buscar en contexto de plazo
-    m3 = re.search(r'plazo\s*(?:de\s+)?(\d{1,4})\s*(?:d[ií]a)', text, re.IGNORECASE)
+    m3 = _buscar(_PATRON_PLAZO_CONTEXTO, t.clave)
     if m3:
         return m3.group(1)
     
     return ""
 
+def _buscar_plazo_seccion(text, pos=0):
+    """
+    Primera mención de días después de una cabecera "11. PLAZO": en su misma
+    línea o en los primeros _VENTANA_PLAZO caracteres de la siguiente ("11.
+    PLAZO\n120 DÍAS"). text es la vista clave. La búsqueda de días se
+    reutiliza entre cabeceras para no reescanear la línea.
+    """
+    dias = None
+    for m in _iterar(_PATRON_PLAZO_SECCION, text, pos):
+        fin_linea = text.find('\n', m.end())
+        limite = len(text) if fin_linea < 0 else fin_linea + 1 + _VENTANA_PLAZO
+        if dias is None or dias.start() < m.end():
+            dias = _buscar(_PATRON_PLAZO_DIAS, text, m.end())
+            if not dias:
+                return None
+        if dias.start() < limite:
+            return dias
+    return None
+
+def _buscar_plazo_seccion_estable(text, pos, estable):
+    """
+    _buscar_plazo_seccion para ExtractorIncremental, donde solo el texto
+    antes de 'estable' es definitivo. Retorna (días, None) si el resultado
+    ya no puede cambiar, o (None, posición desde donde repetir la búsqueda):
+    la cabecera cuya línea o cuyos días aún no están completos, o 'estable'
+    si ninguna quedó pendiente. Nunca se salta una cabecera sin decidir.
+    """
+    dias = None
+    for m in _iterar(_PATRON_PLAZO_SECCION, text, pos):
+        if m.start() >= estable:
+            break
+        fin_linea = text.find('\n', m.end())
+        if fin_linea < 0:
+            return None, m.start()
+        limite = fin_linea + 1 + _VENTANA_PLAZO
+        if dias is None or dias.start() < m.end():
+            dias = _buscar(_PATRON_PLAZO_DIAS, text, m.end())
+        if dias and dias.start() < limite:
+            if dias.start() < estable:
+                return dias, None
+            return None, m.start()
+        if limite >= estable:
+            return None, m.start()
+    return None, estable
+
+# Anexos conocidos como una sola alternación, recompilada solo cuando cambia
+# el conjunto (el vocabulario publica un frozenset nuevo en cada cambio)
+_cache_anexos_conocidos = (None, None, ())
+
+def _patron_anexos_conocidos(anexos_conocidos):
+    """
+    Retorna (patrón combinado, anexos que se buscan aparte). Las alternativas
+    van de la más larga a la más corta; un anexo que es prefijo de otro
+    seguido de algo que también lo termina ("B" y "B.1") quedaría oculto por
+    el más largo en la misma posición, así que esos se buscan individualmente.
+    """
+    global _cache_anexos_conocidos
+    conjunto, patron, aparte = _cache_anexos_conocidos
+    if conjunto is anexos_conocidos:
+        return patron, aparte
+
+    ordenados = sorted(anexos_conocidos, key=lambda a: (-len(a), a))
+    aparte = tuple(
+        a for a in ordenados
+        if any(len(b) > len(a) and b.startswith(a) and (b[len(a)].isspace() or b[len(a)] in '.,:“')
+               for b in ordenados)
+    )
+    patron = None
+    if ordenados:
+        # Solo se consume "ANEXO": cada aparición se revisa aunque un nombre la contenga
+        alternativas = "|".join(re.escape(a) for a in ordenados)
+        patron = re.compile(rf'ANEXO(?=\s+(?:[“]\"\'´`]*\s*)?({alternativas})(?:\s*[“]\"\'´`])?(?:\s|\.|\,|\:|$))')
+    _cache_anexos_conocidos = (anexos_conocidos, patron, aparte)
+    return patron, aparte
+
+@perfilador.perfilar("extractor.anexos")
 def _extract_anexos_avanzado(text):
     """Extrae anexos usando múltiples patrones avanzados"""
     anexos_detectados = set()
+    anexos_conocidos = obtener_vocabulario().snapshot()
     
-    # Convertir texto a mayúsculas para búsqueda consistente
-    texto_upper = text.upper()
+    # Texto en mayúsculas (con acentos) para búsqueda consistente
+    texto_upper = _normalizado(text).mayusculas
     
     # Patrón 1: Anexo entre comillas
-    patron1 = r'ANEXO\s+[“”"\'´`]+\s*([A-Z0-9\-]+)\s*[“”"\'´`]+'
-    matches1 = re.findall(patron1, texto_upper)
+    matches1 = _buscar_todos(_PATRON_ANEXO_COMILLAS, texto_upper)
     for match in matches1:
         if match.strip():
             anexos_detectados.add(match.strip())
     
     # Patrón 2: Anexo con formato claro
-    patron2 = r'ANEXO\s+([A-Z]{1,3}(?:-[A-Z0-9]{1,3})?)(?:\s|\.|\,|\:|$)'
-    matches2 = re.findall(patron2, texto_upper)
+    matches2 = _buscar_todos(_PATRON_ANEXO_SIMPLE, texto_upper)
     for match in matches2:
         anexo = match.strip()
-        if anexo and (anexo in _ANEXOS_CONOCIDOS_CACHE or re.match(r'^[A-Z]{1,3}(?:-[A-Z0-9]{1,3})?$', anexo)):
+        if anexo and (anexo in anexos_conocidos or _PATRON_FORMATO_ANEXO.match(anexo)):
             anexos_detectados.add(anexo)
     
     # Patrón 3: Buscar en sección de integridad del contrato
-    patron_integridad = r'2\.\s*INTEGRIDAD\s+DEL\s+CONTRATO(.*?)(?=\n\s*\d+\.)'
-    m_integridad = re.search(patron_integridad, texto_upper, re.IGNORECASE | re.DOTALL)
-    if not m_integridad:
-        patron_integridad_alt = r'INTEGRIDAD\s+DEL\s+CONTRATO(.*?)(?=\n{2,}|\n\s*\d+\.)'
-        m_integridad = re.search(patron_integridad_alt, texto_upper, re.IGNORECASE | re.DOTALL)
-    
-    if m_integridad:
-        bloque_integridad = m_integridad.group(1)
-        anexos_integridad = re.findall(r'ANEXO\s*[“"\'\s]*([A-Z0-9\-]+)[”"\'\s]*', bloque_integridad, re.IGNORECASE)
+    bloque_integridad = _buscar_bloque(texto_upper, _PATRON_INTEGRIDAD, _FIN_INTEGRIDAD)
+    if bloque_integridad is None:
+        bloque_integridad = _buscar_bloque(texto_upper, _PATRON_INTEGRIDAD_ALT, _FIN_INTEGRIDAD_ALT)
+    
+    if bloque_integridad is not None:
+        inicio, fin = bloque_integridad
+        anexos_integridad = _buscar_todos(_PATRON_ANEXO_INTEGRIDAD, texto_upper[inicio:fin])
         for anexo in anexos_integridad:
             if anexo.strip():
                 anexos_detectados.add(anexo.strip().upper())
     
-    # Buscar anexos conocidos específicamente
-    for anexo_conocido in _ANEXOS_CONOCIDOS_CACHE:
-        patron_especifico = rf'ANEXO\s+(?:[“]\"\'´`]*\s*)?{re.escape(anexo_conocido)}(?:\s*[“]\"\'´`])?(?:\s|\.|\,|\:|$)'
-        if re.search(patron_especifico, texto_upper):
+    # Buscar anexos conocidos específicamente (una sola pasada para todos)
+    patron_conocidos, aparte = _patron_anexos_conocidos(anexos_conocidos)
+    if patron_conocidos is not None:
+        for m in _iterar(patron_conocidos, texto_upper):
+            anexos_detectados.add(m.group(1))
+    for anexo_conocido in aparte:
+        if anexo_conocido in anexos_detectados:
+            continue
+        patron_especifico = re.compile(rf'ANEXO\s+(?:[“]\"\'´`]*\s*)?{re.escape(anexo_conocido)}(?:\s*[“]\"\'´`])?(?:\s|\.|\,|\:|$)')
+        if _buscar(patron_especifico, texto_upper):
             anexos_detectados.add(anexo_conocido)
     
     return sorted(list(anexos_detectados))
 
-def extract_contract_data(raw_text):
+@perfilador.perfilar("extract_contract_data")
+def extract_contract_data(raw_text, presupuesto_s=PRESUPUESTO_EXTRACCION_S):
     """
     Función principal para extraer datos del contrato del texto OCR
-    No usa archivos locales, todo en memoria
+    Los anexos nuevos se agregan al vocabulario compartido del proceso
+    presupuesto_s: tiempo máximo por documento (None = sin límite)
     """
     if not raw_text:
         return {
@@ -187,23 +507,29 @@ def extract_contract_data(raw_text):
             "objeto": "",
             "monto": "",
             "plazo": "",
+            "monto_num": None,
+            "plazo_num": None,
             "anexos": [],
             "area": AREA_FIJA
         }
 
-    # Limpiar y normalizar texto
-    text = _clean_whitespace(raw_text)
+    _iniciar_presupuesto(presupuesto_s)
+    try:
+        # Limpiar y normalizar texto (una sola vez para todos los extractores)
+        with perfilador.medir("normalizacion"):
+            text = TextoNormalizado(raw_text)
 
-    # Extraer todos los campos
-    contrato, contratista = _extract_contrato_and_contratista(text)
-    objeto = _extract_objeto(text)
-    monto = _extract_monto(text)
-    plazo = _extract_plazo(text)
-    anexos = _extract_anexos_avanzado(text)
+        # Extraer todos los campos
+        contrato, contratista = _extract_contrato_and_contratista(text)
+        objeto = _extract_objeto(text)
+        monto = _extract_monto(text)
+        plazo = _extract_plazo(text)
+        anexos = _extract_anexos_avanzado(text)
+    finally:
+        _iniciar_presupuesto(None)
 
-    # Agregar nuevos anexos a la cache en memoria
-    for anexo in anexos:
-        _agregar_anexo_conocido(anexo)
+    # Agregar nuevos anexos al vocabulario compartido (una sola escritura)
+    obtener_vocabulario().agregar_varios(anexos)
 
     return {
         "contrato": contrato,
@@ -211,10 +537,264 @@ def extract_contract_data(raw_text):
         "objeto": objeto,
         "monto": monto,
         "plazo": plazo,
+        "monto_num": normalizar_monto(monto),
+        "plazo_num": normalizar_plazo(plazo),
         "anexos": anexos,
         "area": AREA_FIJA
     }
 
+# ----------------- Extracción incremental -----------------
+# Separador entre páginas (el mismo que usa ocr_utils.pdf_to_text)
+SEPARADOR_PAGINAS = "\n\n"
+
+# Distancia mínima (caracteres) entre el inicio de una coincidencia y el final
+# del texto estable para darla por definitiva. Supera la ventana máxima de los
+# patrones acotados; las partes no acotadas ([^\n]*, \s*) se detienen en el
+# último salto de línea del texto estable.
+MARGEN_ESTABLE = 512
+
+CAMPOS_EXTRACCION = ("contrato", "contratista", "objeto", "monto", "plazo", "anexos")
+
+
+class ExtractorIncremental:
+    """
+    Extracción de datos del contrato alimentada página por página.
+
+    Permite traslapar OCR y extracción: cada página nueva se limpia y se
+    revisa solo a partir de donde quedó la revisión anterior. Un campo se
+    marca como final en cuanto su patrón principal coincide lo bastante
+    lejos del final del texto recibido como para que ninguna página
+    posterior pueda cambiarlo. Los anexos solo son finales al cerrar,
+    porque cualquier página puede agregar uno.
+
+    cerrar() devuelve exactamente el mismo diccionario que
+    extract_contract_data() sobre el texto completo.
+    """
+
+    def __init__(self, presupuesto_s=PRESUPUESTO_EXTRACCION_S):
+        self.presupuesto_s = presupuesto_s
+        self.paginas = 0
+        self.cerrado = False
+
+        self._partes = []        # texto crudo recibido
+        self._limpio = []        # segmentos ya limpios (no cambian con texto nuevo)
+        self._claves = []        # vista clave de cada segmento limpio
+        self._pendiente = ""     # cola cruda aún no limpiada
+        self._ventana = ""       # parte del texto limpio que aún se revisa
+        self._ventana_clave = "" # la misma parte en vista clave (mismas posiciones)
+        self._base = 0           # posición de la ventana dentro del texto limpio
+        self._largo = 0          # largo total del texto limpio
+        self._finales = {}       # campo -> valor definitivo
+        self._desde = {}         # campo -> posición desde donde seguir buscando
+        self._cabecera_objeto = None
+        self._resultado = None
+
+    # ----------------- Alimentación -----------------
+    @perfilador.perfilar("incremental.agregar_pagina")
+    def agregar_pagina(self, texto_pagina):
+        """Agrega el texto de una página (unida con SEPARADOR_PAGINAS)"""
+        if self._partes:
+            self._agregar(SEPARADOR_PAGINAS)
+        self._agregar(texto_pagina or "")
+        self.paginas += 1
+        self._avanzar()
+        return self.campos_finales()
+
+    def agregar_texto(self, fragmento):
+        """Agrega un fragmento de texto crudo tal cual (sin separador)"""
+        self._agregar(fragmento or "")
+        self._avanzar()
+        return self.campos_finales()
+
+    def _agregar(self, texto):
+        if self.cerrado:
+            raise Exception("❌ El extractor ya fue cerrado")
+        self._partes.append(texto)
+        self._pendiente += texto
+
+    @property
+    def texto(self):
+        """Texto crudo completo recibido hasta ahora"""
+        return "".join(self._partes)
+
+    # ----------------- Estado -----------------
+    def campos_finales(self):
+        """Diccionario campo -> True si su valor ya no puede cambiar"""
+        if self.cerrado:
+            return {campo: True for campo in CAMPOS_EXTRACCION}
+        return {campo: campo in self._finales for campo in CAMPOS_EXTRACCION}
+
+    def datos_parciales(self):
+        """Valores de los campos que ya son finales"""
+        if self.cerrado:
+            return dict(self._resultado)
+        return dict(self._finales)
+
+    # ----------------- Procesamiento -----------------
+    def _limpiar_pendiente(self):
+        """
+        Mueve al prefijo limpio la parte de la cola que ya no puede cambiar.
+        Se corta entre dos caracteres que no son espacio: ahí ninguna regla de
+        _clean_whitespace cruza el corte, así que limpiar por partes equivale
+        a limpiar el texto completo.
+        """
+        cola = self._pendiente
+        corte = len(cola.rstrip()) - 1
+        if corte < 1 or cola[corte - 1].isspace():
+            return
+        segmento = limpiar_espacios(cola[:corte])
+        segmento_clave = clave(segmento)
+        self._limpio.append(segmento)
+        self._claves.append(segmento_clave)
+        self._ventana += segmento
+        self._ventana_clave += segmento_clave
+        self._largo += len(segmento)
+        self._pendiente = cola[corte:]
+
+    def _avanzar(self):
+        """Revisa los campos pendientes sobre el texto estable nuevo"""
+        self._limpiar_pendiente()
+        fin_linea = self._ventana.rfind('\n')
+        if fin_linea < 0:
+            return
+        limite = self._base + fin_linea - MARGEN_ESTABLE
+        if limite <= 0:
+            return
+
+        if "contrato" not in self._finales:
+            m = self._buscar_estable(_PATRON_CONTRATO_64, limite, "contrato")
+            if m:
+                self._finales["contrato"] = m.group(1)
+
+        if "contratista" not in self._finales:
+            m = self._buscar_estable(_PATRON_CONTRATO_CONTRATISTA, limite, "contratista")
+            if m:
+                self._finales["contratista"] = _grupo(self._ventana, m, 2).strip()
+
+        if "objeto" not in self._finales:
+            self._avanzar_objeto(limite)
+
+        if "monto" not in self._finales:
+            m = self._buscar_estable(_PATRON_MONTO, limite, "monto")
+            if m:
+                self._finales["monto"] = _formatear_monto(m)
+
+        if "plazo" not in self._finales:
+            # El cursor se queda en la cabecera pendiente, no en sus días: una
+            # cabecera antes de limite con los días después se vuelve a revisar
+            pos = self._desde.get("plazo", 0)
+            m, pendiente = _buscar_plazo_seccion_estable(
+                self._ventana_clave, pos - self._base, limite - self._base
+            )
+            if m:
+                self._finales["plazo"] = m.group(1)
+            else:
+                self._desde["plazo"] = max(pos, self._base + pendiente)
+
+        self._recortar_ventana()
+
+    def _buscar_estable(self, patron, limite, campo):
+        """
+        Primera coincidencia que empieza antes de limite; si no la hay, la
+        siguiente búsqueda continúa desde limite (nada antes puede coincidir).
+        Se busca en la vista clave; las posiciones de la coincidencia son
+        relativas a la ventana.
+        """
+        pos = self._desde.get(campo, 0)
+        m = _buscar(patron, self._ventana_clave, pos - self._base)
+        if m and self._base + m.start() < limite:
+            return m
+        self._desde[campo] = max(pos, limite)
+        return None
+
+    def _avanzar_objeto(self, limite):
+        """Objeto final = sección '4. OBJETO' con su terminador dentro del texto estable"""
+        if self._cabecera_objeto is None:
+            m = self._buscar_estable(_PATRON_OBJETO_NUMERADO, limite, "objeto")
+            if not m:
+                return
+            self._cabecera_objeto = self._base + m.end()
+            self._desde["fin_objeto"] = self._cabecera_objeto
+
+        t = self._buscar_estable(_FIN_OBJETO_NUMERADO, limite, "fin_objeto")
+        if t:
+            bloque = self._ventana[self._cabecera_objeto - self._base:t.start()]
+            self._finales["objeto"] = _limpiar_objeto(bloque)
+
+    def _recortar_ventana(self):
+        """
+        Descarta de la ventana lo que ya ningún campo pendiente necesita.
+        Se conservan unos caracteres antes para que \\b y los saltos de línea
+        previos se evalúen igual que sobre el texto completo.
+        """
+        pendientes = [self._largo]
+        for campo in ("contrato", "contratista", "monto", "plazo"):
+            if campo not in self._finales:
+                pendientes.append(self._desde.get(campo, 0))
+        if "objeto" not in self._finales:
+            if self._cabecera_objeto is None:
+                pendientes.append(self._desde.get("objeto", 0))
+            else:
+                pendientes.append(self._cabecera_objeto)
+        inicio = min(pendientes) - 16
+        if inicio - self._base > len(self._ventana) // 2:
+            self._ventana = self._ventana[inicio - self._base:]
+            self._ventana_clave = self._ventana_clave[inicio - self._base:]
+            self._base = inicio
+
+    @perfilador.perfilar("incremental.cerrar")
+    def cerrar(self):
+        """Termina la extracción; retorna el mismo dict que extract_contract_data"""
+        if self.cerrado:
+            return dict(self._resultado)
+
+        if not self._partes or not self.texto:
+            self._resultado = extract_contract_data("")
+            self.cerrado = True
+            return dict(self._resultado)
+
+        # Los segmentos ya normalizados se reutilizan; solo se normaliza la cola
+        cola = limpiar_espacios(self._pendiente)
+        text = TextoNormalizado(
+            self.texto,
+            limpio="".join(self._limpio) + cola,
+            vista_clave="".join(self._claves) + clave(cola),
+        )
+        datos = dict(self._finales)
+
+        _iniciar_presupuesto(self.presupuesto_s)
+        try:
+            if "contrato" not in datos or "contratista" not in datos:
+                contrato, contratista = _extract_contrato_and_contratista(text)
+                datos.setdefault("contrato", contrato)
+                datos.setdefault("contratista", contratista)
+            if "objeto" not in datos:
+                datos["objeto"] = _extract_objeto(text)
+            if "monto" not in datos:
+                datos["monto"] = _extract_monto(text)
+            if "plazo" not in datos:
+                datos["plazo"] = _extract_plazo(text)
+            anexos = _extract_anexos_avanzado(text)
+        finally:
+            _iniciar_presupuesto(None)
+
+        # Agregar nuevos anexos al vocabulario compartido (una sola escritura)
+        obtener_vocabulario().agregar_varios(anexos)
+
+        self._resultado = {
+            "contrato": datos["contrato"],
+            "contratista": datos["contratista"],
+            "objeto": datos["objeto"],
+            "monto": datos["monto"],
+            "plazo": datos["plazo"],
+            "monto_num": normalizar_monto(datos["monto"]),
+            "plazo_num": normalizar_plazo(datos["plazo"]),
+            "anexos": anexos,
+            "area": AREA_FIJA
+        }
+        self.cerrado = True
+        return dict(self._resultado)
+
 # Función auxiliar para debugging
 def debug_extraccion(texto):
     """Función para debugging de la extracción de datos"""
@@ -231,7 +811,7 @@ def debug_extraccion(texto):
     return resultado
 
 if __name__ == "__main__":
-    # Ejemplo de uso sin archivos locales
+    # Ejemplo de uso
     texto_ejemplo = """
     CONTRATO NÚMERO 641234567
     EMPRESA CONSTRUCTORA XYZ S.A. DE C.V.
@@ -249,5 +829,5 @@ if __name__ == "__main__":
     """
     
     debug_extraccion(texto_ejemplo)
-    print(f"Anexos conocidos en memoria: {obtener_anexos_conocidos()}")
+    print(f"Anexos conocidos: {obtener_anexos_conocidos()}")
     
\ No newline at end of file
@@ -9,8 +9,9 @@ import warnings
 
 from core.database import get_db_manager_por_usuario
 from core.config import UPLOAD_DIR, TEMPLATE_PATH, timestamp
-from core.ocr_utils import pdf_to_text
-from core.text_processing import extract_contract_data
+from core.ocr_utils import iter_paginas_texto
+from core import perfilador
+from core.text_processing import ExtractorIncremental, normalizar_plazo, obtener_anexos_conocidos
 from core.excel_utils import load_excel
 from hashlib import sha256
 from core.config import OUTPUT_DIR
@@ -53,6 +54,7 @@ for key, default in {
     "ultimo_pdf_temp": "",
     "ultimo_guardado": "",
     "texto_extraido": "",
+    "extraccion_original": {},
     "anexos_detectados": [],
     "procesamiento_completado": False,
     "excel_generado": None,
@@ -111,10 +113,8 @@ def detectar_anexos_robusta(texto):
     # Patrón secundario: para casos sin comillas pero con formato claro
     patron_secundario = r'ANEXO\s+([A-Z]{1,3}(?:-[A-Z0-9]{1,3})?)(?:\s|\.|\,|\:|$)'
     
-    # Patrón para anexos conocidos específicos
-    anexos_conocidos = ["A", "AP", "B", "B-1", "BDE", "C", "CN", "DT-9", "E", "F", 
-                       "FORMA", "GARANTÍAS", "GNR", "I", "II", "IV", "MMRDD", "O", 
-                       "PACMA", "PUE", "SSPA"]
+    # Anexos conocidos (vocabulario compartido del proceso)
+    anexos_conocidos = obtener_anexos_conocidos()
     
     # Buscar con patrón principal (comillas)
     matches_principal = re.findall(patron_principal, texto_upper)
@@ -211,11 +211,20 @@ def guardar_contrato_postgresql(archivos_data, datos_contrato, usuario):
             'anexos': datos_contrato.get('anexos', []),
             'area': datos_contrato.get('area', 'SUBDIRECCIÓN DE PRODUCCIÓN REGIÓN NORTE GERENCIA DE MANTENIMIENTO CONFIABILIDAD Y CONSTRUCCIÓN')
         }
-        
+
+        # Texto OCR para poder reprocesar el contrato si mejoran las reglas de extracción
+        texto_ocr = st.session_state.get("texto_extraido", "")
+        if texto_ocr and not texto_ocr.startswith("[ERROR]"):
+            datos_postgresql['texto_ocr'] = texto_ocr
+            # Lo que dio el extractor, para que el reprocesamiento no pise lo editado en el formulario
+            datos_postgresql['extraccion'] = st.session_state.get("extraccion_original") or None
+
         # Guardar en PostgreSQL
         contrato_id = manager.guardar_contrato_completo(archivos_data, datos_postgresql, usuario)
         
         if contrato_id:
+            # El selector de contratos de ARCHIVO se vuelve a pedir con el nuevo
+            st.session_state["contratos_selector"] = None
             st.success(f"✅ *Contrato guardado exitosamente en PostgreSQL* (ID: {contrato_id})")
             return True
         else:
@@ -451,32 +460,58 @@ with st.form("form_contratos", clear_on_submit=False):
                 with open(temp_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
 
-                texto = pdf_to_text(temp_path)
+                # OCR y extracción traslapados: cada página se entrega al extractor
+                # en cuanto termina su OCR
+                extractor = ExtractorIncremental()
+                avance = st.empty()
+                texto = ""
+                for pagina in iter_paginas_texto(temp_path):
+                    if pagina.startswith("[ERROR]"):
+                        texto = pagina
+                        break
+                    finales = extractor.agregar_pagina(pagina)
+                    listos = [campo for campo, final in finales.items() if final]
+                    avance.caption(f"📄 Página {extractor.paginas} procesada · Campos listos: {', '.join(listos) or 'ninguno'}")
+                else:
+                    texto = extractor.texto
+                avance.empty()
                 st.session_state["texto_extraido"] = texto
+                st.session_state["extraccion_original"] = {}
 
                 if texto.startswith("[ERROR]"):
                     st.error(f"❌ Error en OCR: {texto}")
                 else:
-                    datos_extraidos = extract_contract_data(texto) or {}
+                    datos_extraidos = extractor.cerrar() or {}
+                    # Salida del extractor tal cual (antes del plazo y los anexos de la página)
+                    st.session_state["extraccion_original"] = {
+                        campo: datos_extraidos.get(campo)
+                        for campo in ("contratista", "objeto", "monto", "plazo", "anexos")
+                    }
 
                     # Limpieza de campos no requeridos
                     datos_extraidos.pop("partida", None)
                     datos_extraidos.pop("observaciones", None)
 
                     # Extracción mejorada de plazo
-                    plazo_regex = re.search(
-                        r"(?:plazo del contrato|plazo(?:\s+total)?|tendrá un plazo|plazo es de)\s*(?:de\s*)?(\d{1,4})\s*(?:d[ií]as?)",
-                        texto,
-                        flags=re.IGNORECASE
-                    )
-                    if plazo_regex:
-                        datos_extraidos["plazo"] = plazo_regex.group(1)
-                    else:
-                        plazo_alt = re.search(r"(\d{1,4})\s*d[ií]as", texto, flags=re.IGNORECASE)
-                        datos_extraidos["plazo"] = plazo_alt.group(1) if plazo_alt else ""
+                    with perfilador.medir("pagina.plazo_regex") as medicion:
+                        plazo_regex = re.search(
+                            r"(?:plazo del contrato|plazo(?:\s+total)?|tendrá un plazo|plazo es de)\s*(?:de\s*)?(\d{1,4})\s*(?:d[ií]as?)",
+                            texto,
+                            flags=re.IGNORECASE
+                        )
+                        if plazo_regex:
+                            datos_extraidos["plazo"] = plazo_regex.group(1)
+                        else:
+                            plazo_alt = re.search(r"(\d{1,4})\s*d[ií]as", texto, flags=re.IGNORECASE)
+                            datos_extraidos["plazo"] = plazo_alt.group(1) if plazo_alt else ""
+                        # plazo_num debe corresponder al plazo que se muestra y se guarda
+                        datos_extraidos["plazo_num"] = normalizar_plazo(datos_extraidos["plazo"])
+                        medicion.coincidencias = 1 if datos_extraidos["plazo"] else 0
 
                     # Detección ROBUSTA de anexos
-                    anexos_detectados = detectar_anexos_robusta(texto)
+                    with perfilador.medir("pagina.detectar_anexos") as medicion:
+                        anexos_detectados = detectar_anexos_robusta(texto)
+                        medicion.coincidencias = len(anexos_detectados)
                     st.session_state["anexos_detectados"] = anexos_detectados
                     datos_extraidos["anexos"] = anexos_detectados
 
@@ -539,6 +574,11 @@ with st.form("form_contratos", clear_on_submit=False):
             )
             st.markdown("</div>", unsafe_allow_html=True)
 
+        # Perfil acumulado (solo con PERFILAR_EXTRACCION=1)
+        if perfilador.activo():
+            with st.expander("⏱️ Perfil de extracción (acumulado del proceso)"):
+                st.code(perfilador.formatear_reporte())
+
 
 #  SECCIÓN DE DESCARGA FUERA DEL FORM (por restricciones de Streamlit)
 
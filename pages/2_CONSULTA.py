@@ -3,8 +3,10 @@ import streamlit as st
 from pathlib import Path
 import re
 import base64
+import functools
 import json 
 from core.database import get_db_manager_por_usuario
+from core.database_async import ejecutar_concurrente
 # CORRECCIÓN: Solo importar las funciones que existen
 from core.tutorial import init, header_button, overlay
 
@@ -233,6 +235,10 @@ def obtener_archivos_por_contrato(manager, contrato_id):
     try:
         archivos = []
         
+        # Método 0: solo metadatos; el contenido se descarga bajo demanda
+        if hasattr(manager, 'listar_archivos'):
+            return manager.listar_archivos(contrato_id)
+        
         # Método 1: Intentar usar método directo si existe
         try:
             if hasattr(manager, 'obtener_archivos_por_contrato'):
@@ -245,21 +251,23 @@ def obtener_archivos_por_contrato(manager, contrato_id):
         # Método 2: Buscar por categorías individuales usando métodos disponibles
         categorias = ['CONTRATO', 'ANEXOS', 'CEDULAS', 'SOPORTES FISICOS']
         
+        llamadas = {}
         for categoria in categorias:
+            if hasattr(manager, 'obtener_archivos'):
+                llamadas[categoria] = functools.partial(manager.obtener_archivos, contrato_id, categoria)
+            elif hasattr(manager, 'get_archivos'):
+                llamadas[categoria] = functools.partial(manager.get_archivos, contrato_id, categoria)
+            elif hasattr(manager, f'get_{categoria.lower()}'):
+                llamadas[categoria] = functools.partial(getattr(manager, f'get_{categoria.lower()}'), contrato_id)
+            elif hasattr(manager, f'obtener_{categoria.lower()}'):
+                llamadas[categoria] = functools.partial(getattr(manager, f'obtener_{categoria.lower()}'), contrato_id)
+        
+        # Las categorías son independientes: se consultan a la vez
+        resultados = ejecutar_concurrente(devolver_errores=True, **llamadas)
+        
+        for categoria, archivos_categoria in resultados.items():
             try:
-                archivos_categoria = []
-                
-                if hasattr(manager, 'obtener_archivos'):
-                    archivos_categoria = manager.obtener_archivos(contrato_id, categoria)
-                elif hasattr(manager, 'get_archivos'):
-                    archivos_categoria = manager.get_archivos(contrato_id, categoria)
-                elif hasattr(manager, f'get_{categoria.lower()}'):
-                    metodo = getattr(manager, f'get_{categoria.lower()}')
-                    archivos_categoria = metodo(contrato_id)
-                elif hasattr(manager, f'obtener_{categoria.lower()}'):
-                    metodo = getattr(manager, f'obtener_{categoria.lower()}')
-                    archivos_categoria = metodo(contrato_id)
-                else:
+                if isinstance(archivos_categoria, Exception):
                     continue
                 
                 if archivos_categoria:
@@ -285,21 +293,88 @@ def obtener_archivos_por_contrato(manager, contrato_id):
         st.error(f"Error obteniendo archivos: {str(e)}")
         return []
 
-def buscar_contratos_avanzada(manager, texto_busqueda):
+# Al cargar los archivos de un contrato se leen a la vez los que miden hasta
+# PRECARGA_MAXIMA_BYTES (sin pasar de PRECARGA_TOTAL_BYTES en total); los
+# demás se leen bajo demanda con "Preparar descarga"
+PRECARGA_MAXIMA_BYTES = 5 * 1024 * 1024
+PRECARGA_TOTAL_BYTES = 25 * 1024 * 1024
+
+def precargar_archivos(manager, archivos):
+    """Contenido {archivo_id: bytes} de los archivos chicos, leídos en paralelo"""
+    if not hasattr(manager, 'leer_archivo'):
+        return {}
+    
+    ids = {}
+    total = 0
+    for archivo in archivos:
+        archivo_id = archivo.get('id')
+        tamaño = archivo.get('tamaño_bytes') or 0
+        if archivo_id is None or archivo.get('contenido') or not 0 < tamaño <= PRECARGA_MAXIMA_BYTES:
+            continue
+        if total + tamaño > PRECARGA_TOTAL_BYTES:
+            break
+        total += tamaño
+        ids[str(archivo_id)] = archivo_id
+    
+    resultados = ejecutar_concurrente(devolver_errores=True, **{
+        nombre: functools.partial(manager.leer_archivo, archivo_id)
+        for nombre, archivo_id in ids.items()
+    })
+    # Un archivo que no se pudo leer queda con su botón "Preparar descarga"
+    return {
+        ids[nombre]: contenido for nombre, contenido in resultados.items()
+        if contenido and not isinstance(contenido, Exception)
+    }
+
+# Resultados de la búsqueda de texto que se muestran (los más relevantes)
+LIMITE_RESULTADOS = 50
+
+# Modos del buscador
+MODO_TEXTO = "📝 Texto completo"
+MODO_SIMILAR = "🔤 Similar (tolera errores de escritura)"
+
+def buscar_contratos_avanzada(manager, texto_busqueda, modo=MODO_TEXTO):
     """✅ BÚSQUEDA MEJORADA: Búsqueda avanzada en múltiples campos"""
     try:
         texto_busqueda = texto_busqueda.strip().upper()
         if not texto_busqueda:
             return []
         
-        # Intentar diferentes estrategias de búsqueda
+        # Modo similar: número o contratista con errores de OCR o de tecleo
+        if modo == MODO_SIMILAR and hasattr(manager, 'buscar_similares'):
+            try:
+                return manager.buscar_similares(texto_busqueda, limit=LIMITE_RESULTADOS)
+            except Exception as e:
+                st.warning(f"⚠️ Búsqueda por similitud no disponible, usando búsqueda simple: {e}")
+        
+        # Estrategia principal: texto completo indexado (número, contratista,
+        # descripción, área y texto OCR) ordenado por relevancia
+        elif hasattr(manager, 'buscar_texto'):
+            try:
+                resultados = manager.buscar_texto(texto_busqueda, limit=LIMITE_RESULTADOS)
+                if resultados:
+                    return resultados
+            except Exception as e:
+                st.warning(f"⚠️ Búsqueda de texto no disponible, usando búsqueda simple: {e}")
+            
+            # Sin coincidencias de palabras: parte de un número o un nombre mal escrito
+            if hasattr(manager, 'buscar_similares'):
+                try:
+                    resultados = manager.buscar_similares(texto_busqueda, limit=LIMITE_RESULTADOS)
+                    if resultados:
+                        return resultados
+                except Exception:
+                    pass
+        
+        # Intentar diferentes estrategias de búsqueda (subcadenas que el
+        # índice de texto no encuentra, p. ej. parte de un número)
         resultados_finales = []
         contratos_vistos = set()
         
         # Estrategia 1: Búsqueda por número exacto de contrato
         try:
             filtros = {'numero_contrato': texto_busqueda}
-            resultados = manager.buscar_contratos_pemex(filtros)
+            resultados = manager.buscar_contratos_pemex(filtros, limite=LIMITE_RESULTADOS)
             if resultados:
                 for contrato in resultados:
                     if contrato['id'] not in contratos_vistos:
@@ -321,13 +396,15 @@ def buscar_contratos_avanzada(manager, texto_busqueda):
             pass
         
         # Estrategia 3: Búsqueda en otros campos
-        campos_busqueda = ['contratista', 'area', 'descripcion', 'numero_contrato']
+        # (área y descripción las cubre buscar_texto; buscar_contratos_pemex
+        # no las filtra y devolvería todos los contratos)
+        campos_busqueda = ['contratista', 'numero_contrato']
         
         for campo in campos_busqueda:
             try:
                 # Buscar cualquier contrato que contenga el texto en este campo
                 filtros = {campo: texto_busqueda}
-                resultados = manager.buscar_contratos_pemex(filtros)
+                resultados = manager.buscar_contratos_pemex(filtros, limite=LIMITE_RESULTADOS)
                 
                 if resultados:
                     for contrato in resultados:
@@ -342,7 +419,7 @@ def buscar_contratos_avanzada(manager, texto_busqueda):
             try:
                 # Buscar contratos cuyo número contenga estos dígitos
                 filtros = {'numero_contrato': texto_busqueda}
-                resultados = manager.buscar_contratos_pemex(filtros)
+                resultados = manager.buscar_contratos_pemex(filtros, limite=LIMITE_RESULTADOS)
                 
                 if resultados:
                     for contrato in resultados:
@@ -358,6 +435,24 @@ def buscar_contratos_avanzada(manager, texto_busqueda):
         st.error(f"Error en búsqueda: {str(e)}")
         return []
 
+def obtener_anexos_disponibles(manager):
+    """Anexos con su número de contratos para el filtro (una vez por sesión)"""
+    if 'anexos_disponibles' not in st.session_state:
+        try:
+            st.session_state.anexos_disponibles = manager.contar_anexos(limite=300) if hasattr(manager, 'contar_anexos') else []
+        except Exception as e:
+            st.warning(f"⚠️ No se pudieron obtener los anexos: {e}")
+            st.session_state.anexos_disponibles = []
+    return st.session_state.anexos_disponibles
+
+def buscar_por_anexos(manager, anexos):
+    """Contratos que incluyen todos los anexos indicados (índice GIN, operador @>)"""
+    try:
+        return manager.buscar_contratos_pemex({'anexos_contiene': anexos}, limite=LIMITE_RESULTADOS)
+    except Exception as e:
+        st.error(f"Error buscando por anexos: {str(e)}")
+        return []
+
 # ==================================================
 #  INTERFAZ PRINCIPAL - MANTENIENDO DISEÑO ORIGINAL
 # ==================================================
@@ -385,6 +480,14 @@ with st.form("form_consulta", clear_on_submit=False):
         placeholder="Ej: 12345, PEMEX, servicios, mantenimiento...",
         key="busqueda_contratos"
     ).strip()
+    
+    modo_busqueda = st.radio(
+        "Modo de búsqueda:",
+        [MODO_TEXTO, MODO_SIMILAR],
+        horizontal=True,
+        key="modo_busqueda",
+        help="Similar encuentra números parciales y nombres con errores (p. ej. CONSTRUCTRA → CONSTRUCTORA)"
+    )
 
     # ==================================================
     #  MODO BASE DE DATOS POSTGRESQL
@@ -404,18 +507,39 @@ with st.form("form_consulta", clear_on_submit=False):
         if 'archivos_cargados' not in st.session_state:
             st.session_state.archivos_cargados = []
         
-        # Realizar búsqueda si hay texto
+        # Filtro por anexos: contratos que los incluyen todos
+        anexos_disponibles = obtener_anexos_disponibles(manager)
+        conteo_anexos = dict(anexos_disponibles)
+        anexos_filtro = st.multiselect(
+            "📎 Contratos que incluyen los anexos:",
+            [anexo for anexo, _ in anexos_disponibles],
+            format_func=lambda anexo: f"ANEXO {anexo} ({conteo_anexos.get(anexo, 0)})",
+            key="anexos_filtro"
+        )
+        
+        # Realizar búsqueda si hay texto o anexos
         buscar_button = st.form_submit_button("🔍 Buscar", use_container_width=True)
         
-        if buscar_button and busqueda:
+        if buscar_button and (busqueda or anexos_filtro):
             with st.spinner("🔍 Buscando contratos..."):
-                resultados = buscar_contratos_avanzada(manager, busqueda)
+                if busqueda:
+                    resultados = buscar_contratos_avanzada(manager, busqueda, modo_busqueda)
+                    if anexos_filtro:
+                        # Sobre los resultados más relevantes; el total de la búsqueda ya no aplica
+                        resultados = [c for c in resultados if set(anexos_filtro) <= set(c.get('anexos') or [])]
+                        for contrato in resultados:
+                            contrato.pop('total', None)
+                else:
+                    resultados = buscar_por_anexos(manager, anexos_filtro)
                 st.session_state.contratos_encontrados = resultados
         
         # Mostrar resultados
         if st.session_state.contratos_encontrados:
             st.markdown("---")
-            st.markdown(f"### 📂 Contratos Encontrados ({len(st.session_state.contratos_encontrados)})")
+            total_encontrados = st.session_state.contratos_encontrados[0].get('total', len(st.session_state.contratos_encontrados))
+            st.markdown(f"### 📂 Contratos Encontrados ({total_encontrados})")
+            if total_encontrados > len(st.session_state.contratos_encontrados):
+                st.caption(f"Se muestran los {len(st.session_state.contratos_encontrados)} más relevantes")
             
             # Selección de contrato
             if len(st.session_state.contratos_encontrados) > 1:
@@ -457,11 +581,16 @@ with st.form("form_consulta", clear_on_submit=False):
                 st.write(f"- *Plazo:* {contrato_info.get('plazo_dias', 'No especificado')} días")
                 st.write(f"- *Fecha Inicio:* {contrato_info.get('fecha_inicio', 'No especificado')}")
             
+            # Fragmento del contrato donde aparece lo buscado
+            if contrato_info.get('fragmento'):
+                st.markdown(f"*🔎 Coincidencia:* {contrato_info['fragmento']}")
+            
             # Cargar archivos si se presiona el botón
             if cargar_archivos_btn:
                 with st.spinner("🔍 Cargando archivos..."):
                     archivos = obtener_archivos_por_contrato(manager, contrato_id)
                     st.session_state.archivos_cargados = archivos
+                    st.session_state.descargas_archivos = precargar_archivos(manager, archivos)
 
 # SECCIÓN FUERA DEL FORMULARIO PARA MOSTRAR ARCHIVOS Y BOTONES DE DESCARGA
 if st.session_state.get("archivos_cargados"):
@@ -497,7 +626,10 @@ if st.session_state.get("archivos_cargados"):
                 size_bytes = archivo.get('tamaño_bytes', 0)
                 size_mb = size_bytes / 1024 / 1024 if size_bytes > 0 else 0
                 nombre_archivo = archivo.get('nombre_archivo', 'archivo_sin_nombre')
-                contenido = archivo.get('contenido', b'')
+                archivo_id = archivo.get('id')
+                # El contenido solo se trae de la base cuando se pide la descarga
+                descargas = st.session_state.setdefault("descargas_archivos", {})
+                contenido = archivo.get('contenido') or descargas.get(archivo_id, b'')
                 
                 # Crear un contenedor para el archivo
                 st.markdown("<div class='archivo-item'>", unsafe_allow_html=True)
@@ -525,6 +657,15 @@ if st.session_state.get("archivos_cargados"):
                             )
                         except Exception as e:
                             st.error(f"Error al crear botón de descarga: {str(e)}")
+                    elif archivo_id is not None and hasattr(manager, 'leer_archivo'):
+                        if st.button("📥 Preparar descarga", key=f"preparar_{archivo_id}_{categoria}",
+                                     use_container_width=True):
+                            try:
+                                with st.spinner(f"Leyendo {nombre_archivo}..."):
+                                    descargas[archivo_id] = manager.leer_archivo(archivo_id) or b''
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"Error leyendo archivo: {str(e)}")
                 
                 st.markdown("</div>", unsafe_allow_html=True)
 
@@ -547,4 +688,5 @@ if st.button("🧹 Limpiar búsqueda", use_container_width=True):
     st.session_state.contratos_encontrados = []
     st.session_state.contrato_seleccionado = None
     st.session_state.archivos_cargados = []
+    st.session_state.descargas_archivos = {}
     st.rerun()
\ No newline at end of file
@@ -4,7 +4,9 @@ from pathlib import Path
 import json
 import os
 import base64
+import functools
 from core.database import get_db_manager_por_usuario  
+from core.database_async import ejecutar_concurrente
 import sys
 import psycopg2
 
@@ -40,14 +42,48 @@ overlay("archivo")
 # ==============================
 #  FUNCIONES CORREGIDAS Y ROBUSTAS PARA POSTGRESQL
 # ==============================
-def obtener_contratos_postgresql(manager):
-    """Obtener lista de contratos desde PostgreSQL"""
+# Contratos por página en el selector (se piden más con "Cargar más")
+TAMAÑO_PAGINA_SELECTOR = 50
+
+def filtros_selector(filtro_texto):
+    """Texto del filtro: con dígitos se busca en el número, si no en el contratista"""
+    filtro_texto = (filtro_texto or "").strip()
+    if not filtro_texto:
+        return {}
+    if any(c.isdigit() for c in filtro_texto):
+        return {'numero_contrato': filtro_texto}
+    return {'contratista': filtro_texto}
+
+def obtener_contratos_postgresql(manager, filtro_texto="", cursor=None):
+    """Obtener una página de contratos desde PostgreSQL: {'contratos', 'siguiente'}"""
     try:
-        contratos = manager.buscar_contratos_pemex({})
-        return True, contratos
+        filtros = filtros_selector(filtro_texto)
+        if hasattr(manager, 'listar_contratos_pagina'):
+            return True, manager.listar_contratos_pagina(filtros, TAMAÑO_PAGINA_SELECTOR, cursor)
+        contratos = manager.buscar_contratos_pemex(filtros)
+        return True, {'contratos': contratos, 'siguiente': None}
     except Exception as e:
         return False, f"❌ Error obteniendo contratos: {str(e)}"
 
+def total_contratos_esquema(manager):
+    """Total de contratos del esquema (una fila de estadisticas_pemex); None si no se puede contar"""
+    if not hasattr(manager, 'contar_contratos'):
+        return None
+    try:
+        return manager.contar_contratos()['total']
+    except Exception:
+        return None
+
+def cargar_mas_contratos(manager):
+    """Agrega al selector la siguiente página (callback del botón, antes del rerun)"""
+    selector = st.session_state.contratos_selector
+    if not selector.get('siguiente'):
+        return
+    success, pagina = obtener_contratos_postgresql(manager, selector['filtro'], selector['siguiente'])
+    if success:
+        selector['contratos'].extend(pagina['contratos'])
+        selector['siguiente'] = pagina['siguiente']
+
 def guardar_archivo_postgresql(manager, contrato_id, archivo, categoria, tipo_archivo):
     """✅ VERSIÓN CORREGIDA Y FUNCIONAL: Guardar archivo individual en PostgreSQL"""
     try:
@@ -85,9 +121,21 @@ def guardar_archivo_postgresql(manager, contrato_id, archivo, categoria, tipo_ar
         st.error(f"Traceback: {traceback.format_exc()}")
         return False, f"❌ Error guardando: {str(e)}"
 
+def guardar_archivos_lote_postgresql(manager, contrato_id, archivos, categoria):
+    """Guardar todos los archivos seleccionados en una sola transacción (todos o ninguno)"""
+    try:
+        ids = manager.guardar_archivos_lote(contrato_id, archivos, categoria=categoria, usuario=nombre)
+        return True, f"✅ {len(ids)} archivo(s) guardado(s) en una sola transacción"
+    except Exception as e:
+        return False, f"❌ No se guardó ningún archivo: {str(e)}"
+
 def obtener_archivos_por_contrato(manager, contrato_id):
     """✅ FUNCIÓN SIMPLIFICADA Y CORREGIDA: Obtener todos los archivos de un contrato"""
     try:
+        # Solo metadatos: aquí se listan nombres y tamaños, no se descarga nada
+        if hasattr(manager, 'listar_archivos'):
+            return manager.listar_archivos(contrato_id)
+        
         if hasattr(manager, 'obtener_archivos_por_contrato'):
             try:
                 archivos = manager.obtener_archivos_por_contrato(contrato_id)
@@ -136,6 +184,8 @@ def eliminar_contrato_postgresql(manager, contrato_id):
             try:
                 success = manager.eliminar_contrato(contrato_id)
                 if success:
+                    # El selector de contratos se vuelve a pedir desde la primera página
+                    st.session_state.contratos_selector = None
                     return True, "✅ Contrato eliminado completamente"
                 else:
                     return False, "❌ No se pudo eliminar el contrato"
@@ -148,6 +198,35 @@ def eliminar_contrato_postgresql(manager, contrato_id):
         return False, f"❌ Error eliminando contrato: {str(e)}"
 
 
+def calcular_diagnostico_esquema(manager):
+    """Conteo, archivos de los primeros contratos y plan de la búsqueda por similitud"""
+    if hasattr(manager, 'contar_contratos'):
+        # Consultas independientes: se lanzan a la vez, cada una con su conexión
+        llamadas = {
+            'conteo': manager.contar_contratos,
+            'pagina': functools.partial(manager.listar_contratos_pagina, tamaño_pagina=3),
+        }
+        if hasattr(manager, 'diagnosticar_busqueda_similar'):
+            llamadas['plan'] = manager.diagnosticar_busqueda_similar
+        resultados = ejecutar_concurrente(**llamadas)
+        conteo = resultados['conteo']
+        contratos = resultados['pagina']['contratos']
+    else:
+        resultados = {}
+        contratos = manager.buscar_contratos_pemex({})
+        conteo = {'total': len(contratos), 'estimado': False}
+    
+    # Solo primeros 3 para no sobrecargar, también en paralelo
+    archivos_por_contrato = ejecutar_concurrente(**{
+        str(contrato['id']): functools.partial(obtener_archivos_por_contrato, manager, contrato['id'])
+        for contrato in contratos[:3]
+    })
+    return {
+        'conteo': conteo,
+        'total_archivos': sum(len(archivos) for archivos in archivos_por_contrato.values()),
+        'plan': resultados.get('plan'),
+    }
+
 def diagnosticar_esquema_postgresql(manager):
     """Diagnosticar el estado del esquema PostgreSQL"""
     st.sidebar.markdown("### 🔍 DIAGNÓSTICO ESQUEMA")
@@ -160,19 +239,29 @@ def diagnosticar_esquema_postgresql(manager):
         metodos_archivos = [m for m in dir(manager) if 'archivo' in m.lower() and not m.startswith('_')]
         st.sidebar.write(f"*Métodos de archivos:* {len(metodos_archivos)}")
         
-        try:
-            contratos = manager.buscar_contratos_pemex({})
-            st.sidebar.write(f"*Contratos en esquema:* {len(contratos)}")
-            
-            total_archivos = 0
-            for contrato in contratos[:3]:  # Solo primeros 3 para no sobrecargar
-                archivos = obtener_archivos_por_contrato(manager, contrato['id'])
-                total_archivos += len(archivos)
-            
-            st.sidebar.write(f"*Archivos totales (primeros 3 contratos):* {total_archivos}")
+        # Se calcula una vez por sesión (usa varias conexiones y un EXPLAIN);
+        # el botón o "ACTUALIZAR VISTA COMPLETA" lo vuelven a pedir
+        diagnostico = st.session_state.get('diagnostico_esquema')
+        if st.sidebar.button("♻️ Actualizar diagnóstico") or not diagnostico or diagnostico['usuario'] != manager.usuario:
+            try:
+                diagnostico = {'usuario': manager.usuario, **calcular_diagnostico_esquema(manager)}
+            except Exception as e:
+                # El error también se guarda: no se reintenta en cada rerun
+                diagnostico = {'usuario': manager.usuario, 'error': str(e)}
+            st.session_state.diagnostico_esquema = diagnostico
+        
+        if diagnostico.get('error'):
+            st.sidebar.error(f"Error diagnóstico: {diagnostico['error']}")
+        else:
+            conteo = diagnostico['conteo']
+            prefijo = "≈ " if conteo['estimado'] else ""
+            st.sidebar.write(f"*Contratos en esquema:* {prefijo}{conteo['total']}")
+            st.sidebar.write(f"*Archivos totales (primeros 3 contratos):* {diagnostico['total_archivos']}")
             
-        except Exception as e:
-            st.sidebar.error(f"Error diagnóstico: {e}")
+            plan = diagnostico['plan']
+            if plan:
+                icono = "✅" if plan['usa_indice_trigramas'] else "⚠️"
+                st.sidebar.write(f"*Índices de búsqueda:* {icono} {', '.join(plan['indices']) or 'ninguno'}")
     
     if st.sidebar.button("🔍 Diagnóstico Detallado"):
         with st.spinner("Ejecutando diagnóstico..."):
@@ -523,49 +612,77 @@ if not manager:
 # 🔍 DIAGNÓSTICO (siempre visible)
 diagnosticar_esquema_postgresql(manager)
 
-with st.form("form_gestion_archivos", clear_on_submit=True):
-    
-    if logo_base64:
-        st.markdown(
-            f"<div style='text-align:center;'><img src='data:image/jpeg;base64,{logo_base64}' width='200'></div>",
-            unsafe_allow_html=True
-        )
+if logo_base64:
+    st.markdown(
+        f"<div style='text-align:center;'><img src='data:image/jpeg;base64,{logo_base64}' width='200'></div>",
+        unsafe_allow_html=True
+    )
 
-    st.markdown("<h2 style='text-align:center;'>SISTEMA DE GESTIÓN DE DOCUMENTOS PEMEX</h2>", unsafe_allow_html=True)
-    st.markdown("<h4 style='text-align:center;'>📁 ARCHIVOS Y CONTRATOS</h4>", unsafe_allow_html=True)
+st.markdown("<h2 style='text-align:center;'>SISTEMA DE GESTIÓN DE DOCUMENTOS PEMEX</h2>", unsafe_allow_html=True)
+st.markdown("<h4 style='text-align:center;'>📁 ARCHIVOS Y CONTRATOS</h4>", unsafe_allow_html=True)
 
-    # ==================================================
-    #  SECCIÓN PARA SUBIR NUEVOS ARCHIVOS (CORREGIDA)
-    # ==================================================
-    st.markdown("---")
-    st.markdown("### 📤 Subir Archivos a Contrato Existente")
-    
-    # Obtener contratos de PostgreSQL
-    success, contratos_db = obtener_contratos_postgresql(manager)
-    if not success:
-        st.error(contratos_db)
-        contratos_lista = []
-    else:
-        # Mejorar la visualización de contratos
-        contratos_lista = [(c['id'], f"{c['numero_contrato']} - {c['contratista']}") for c in contratos_db]
+# ==================================================
+#  SECCIÓN PARA SUBIR NUEVOS ARCHIVOS (CORREGIDA)
+# ==================================================
+st.markdown("---")
+st.markdown("### 📤 Subir Archivos a Contrato Existente")
+
+# El filtro, el selector y "Cargar más" van fuera del formulario:
+# clear_on_submit los regresaría a su valor inicial en cada envío
+filtro_contratos = st.text_input(
+    "🔎 Filtrar contratos (número o contratista):",
+    key="filtro_contratos_subir"
+).strip()
+
+# Obtener contratos de PostgreSQL (solo las páginas que se muestran). Se vuelven
+# a pedir si cambia el filtro o el total del esquema (contratos guardados o
+# eliminados desde otra página o sesión)
+total_contratos = total_contratos_esquema(manager)
+selector = st.session_state.get('contratos_selector')
+success = True
+if selector is None or selector['filtro'] != filtro_contratos or selector['total'] != total_contratos:
+    success, pagina = obtener_contratos_postgresql(manager, filtro_contratos)
+    if success:
+        selector = {
+            'filtro': filtro_contratos, 'total': total_contratos,
+            'contratos': pagina['contratos'], 'siguiente': pagina['siguiente']
+        }
+        st.session_state.contratos_selector = selector
+
+if not success:
+    st.error(pagina)
+    contratos_db = []
+    contratos_lista = []
+else:
+    contratos_db = selector['contratos']
+    # Mejorar la visualización de contratos
+    contratos_lista = [(c['id'], f"{c['numero_contrato']} - {c['contratista']}") for c in contratos_db]
+
+if contratos_lista:
+    contrato_seleccionado_id = st.selectbox(
+        "📄 Seleccionar contrato:",
+        options=[c[0] for c in contratos_lista],
+        format_func=lambda x: next((c[1] for c in contratos_lista if c[0] == x), ""),
+        key="select_contrato_postgresql",
+        help="Elige el contrato al que quieres añadir archivos"
+    )
     
-    if contratos_lista:
-        contrato_seleccionado_id = st.selectbox(
-            "📄 Seleccionar contrato:",
-            options=[c[0] for c in contratos_lista],
-            format_func=lambda x: next((c[1] for c in contratos_lista if c[0] == x), ""),
-            key="select_contrato_postgresql",
-            help="Elige el contrato al que quieres añadir archivos"
+    if selector.get('siguiente'):
+        st.button(
+            f"⏬ Cargar {TAMAÑO_PAGINA_SELECTOR} contratos más ({len(contratos_lista)} cargados)",
+            on_click=cargar_mas_contratos, args=(manager,)
         )
-        
-        # Mostrar información del contrato seleccionado
-        if contrato_seleccionado_id:
-            contrato_info = next((c for c in contratos_db if c['id'] == contrato_seleccionado_id), None)
-            if contrato_info:
-                st.info(f"📋 *Contrato seleccionado:* {contrato_info['numero_contrato']} - {contrato_info['contratista']}")
-    else:
-        st.warning("📭 No hay contratos disponibles en PostgreSQL")
-        contrato_seleccionado_id = None
+    
+    # Mostrar información del contrato seleccionado
+    if contrato_seleccionado_id:
+        contrato_info = next((c for c in contratos_db if c['id'] == contrato_seleccionado_id), None)
+        if contrato_info:
+            st.info(f"📋 *Contrato seleccionado:* {contrato_info['numero_contrato']} - {contrato_info['contratista']}")
+else:
+    st.warning("📭 No hay contratos disponibles en PostgreSQL")
+    contrato_seleccionado_id = None
+
+with st.form("form_gestion_archivos", clear_on_submit=True):
 
     # Selección de sección
     seccion_seleccionada = st.selectbox(
@@ -592,17 +709,30 @@ with st.form("form_gestion_archivos", clear_on_submit=True):
                 archivos_exitosos = 0
                 archivos_fallidos = 0
                 
-                for archivo in archivos_subir:
-                    success, message = guardar_archivo_postgresql(
-                        manager, contrato_seleccionado_id, archivo, 
-                        seccion_seleccionada, "anexo"
+                if hasattr(manager, 'guardar_archivos_lote'):
+                    # Una conexión y un commit para todo el lote
+                    success, message = guardar_archivos_lote_postgresql(
+                        manager, contrato_seleccionado_id, archivos_subir, seccion_seleccionada
                     )
                     if success:
-                        archivos_exitosos += 1
-                        st.success(f"✅ {archivo.name}")
+                        archivos_exitosos = len(archivos_subir)
+                        for archivo in archivos_subir:
+                            st.success(f"✅ {archivo.name}")
                     else:
-                        archivos_fallidos += 1
-                        st.error(f"❌ {archivo.name}: {message}")
+                        archivos_fallidos = len(archivos_subir)
+                        st.error(message)
+                else:
+                    for archivo in archivos_subir:
+                        success, message = guardar_archivo_postgresql(
+                            manager, contrato_seleccionado_id, archivo, 
+                            seccion_seleccionada, "anexo"
+                        )
+                        if success:
+                            archivos_exitosos += 1
+                            st.success(f"✅ {archivo.name}")
+                        else:
+                            archivos_fallidos += 1
+                            st.error(f"❌ {archivo.name}: {message}")
                 
                 # Resumen
                 if archivos_exitosos > 0:
@@ -620,4 +750,6 @@ with st.form("form_gestion_archivos", clear_on_submit=True):
     if actualizar:
         st.session_state.archivo_eliminando = None
         st.session_state.contrato_eliminando = None
+        st.session_state.contratos_selector = None
+        st.session_state.diagnostico_esquema = None
         st.rerun()
\ No newline at end of file
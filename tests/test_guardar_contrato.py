@@ -0,0 +1,97 @@
+# tests/test_guardar_contrato.py
+"""
+guardar_contrato_completo debe guardar la extracción original que manda
+la página (datos['extraccion']) en extraccion_original; sin ella el
+reprocesamiento trata todos los campos como corregidos a mano.
+
+Usa una conexión falsa que registra los INSERT: no necesita PostgreSQL.
+"""
+import io
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("streamlit")
+
+from core import database
+
+
+class CursorFalso:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.description = [("id",)]
+
+    def execute(self, consulta, params=None):
+        self.conexion.sentencias.append((" ".join(str(consulta).split()), params))
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return []
+
+
+class ConexionFalsa:
+    def __init__(self):
+        self.sentencias = []
+        self.confirmada = False
+
+    def cursor(self, *args, **kwargs):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.confirmada = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _manager(clase, conexion):
+    manager = clase.__new__(clase)
+    manager.connection_string = "postgresql://prueba"
+    manager.usuario = "PRUEBA"
+    manager.esquema = "usuario_PRUEBA"
+    manager._get_connection = lambda: conexion
+    manager._get_connection_with_schema = lambda: conexion
+    return manager
+
+
+@pytest.mark.parametrize("clase", [database.ContratosManager, database.ContratosManagerUsuarios])
+def test_guardar_contrato_completo_guarda_extraccion_original(clase, monkeypatch):
+    monkeypatch.setattr(database, "_guardar_blob", lambda conn, archivo: (77, 3, "hash", False))
+    conexion = ConexionFalsa()
+    manager = _manager(clase, conexion)
+
+    extraccion = {
+        "contratista": "CONSTRUCTORA DEL NORESTE S.A.",
+        "objeto": "MANTENIMIENTO DE PLATAFORMAS",
+        "monto": "$1,000.00",
+        "plazo": "120",
+        "anexos": ["SSPA", "B"],
+    }
+    datos = {
+        "contrato": "648101202",
+        # Corregido a mano en el formulario
+        "contratista": "CONSTRUCTORA DEL NORESTE S.A. DE C.V.",
+        "monto": "$1,000.00",
+        "plazo": "90",
+        "objeto": "MANTENIMIENTO DE PLATAFORMAS",
+        "anexos": ["B", "SSPA"],
+        "texto_ocr": "CONTRATO No. 648101202 ...",
+        "extraccion": extraccion,
+    }
+    principal = io.BytesIO(b"pdf")
+    principal.name = "contrato.pdf"
+
+    contrato_id = manager.guardar_contrato_completo({"principal": principal}, datos, "PRUEBA")
+
+    assert contrato_id == 1
+    assert conexion.confirmada
+    consulta, params = next(s for s in conexion.sentencias if s[0].startswith("INSERT INTO contratos_pemex"))
+    columnas = consulta.split("(", 1)[1].split(")", 1)[0].replace(" ", "").split(",")
+    guardado = json.loads(params[columnas.index("extraccion_original")])
+    assert guardado == {**extraccion, "anexos": ["B", "SSPA"]}